@@ -0,0 +1,3 @@
+from benchmark.pool_benchmark import main
+
+main()
@@ -0,0 +1,82 @@
+import argparse
+import json
+import platform
+import sys
+import time
+from threading import BoundedSemaphore
+
+from pythreadpool.capacity_tree import CapacityNode
+
+
+def now():
+    return time.perf_counter()
+
+
+def semaphore_chain(depth, capacity):
+    return [BoundedSemaphore(capacity) for _ in range(depth)]
+
+
+def chained_admission(chain, rounds):
+    start = now()
+    for _ in range(rounds):
+        for semaphore in chain:
+            semaphore.acquire()
+        for semaphore in reversed(chain):
+            semaphore.release()
+    return (now() - start) / rounds
+
+
+def capacity_tree(depth, capacity):
+    node = CapacityNode(capacity)
+    for _ in range(depth - 1):
+        node = node.new_child()
+    return node
+
+
+def tree_admission(node, rounds):
+    start = now()
+    for _ in range(rounds):
+        node.acquire()
+        node.release()
+    return (now() - start) / rounds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Admission cost of nested shared pools by depth')
+    parser.add_argument('--rounds', type=int, default=100000)
+    parser.add_argument('--capacity', type=int, default=16)
+    parser.add_argument('--max-depth', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default='-')
+    args = parser.parse_args(argv)
+
+    report = {
+        'meta': {
+            'python': sys.version,
+            'platform': platform.platform(),
+            'timestamp': time.time(),
+            'rounds': args.rounds,
+            'capacity': args.capacity,
+            'repeat': args.repeat,
+        },
+        'results': {},
+    }
+    for depth in range(1, args.max_depth + 1):
+        chain = semaphore_chain(depth, args.capacity)
+        node = capacity_tree(depth, args.capacity)
+        report['results'][depth] = {
+            'semaphore_chain_seconds_per_admission': min(chained_admission(chain, args.rounds) for _ in range(args.repeat)),
+            'capacity_tree_seconds_per_admission': min(tree_admission(node, args.rounds) for _ in range(args.repeat)),
+        }
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output == '-':
+        print(output)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import gevent
+from gevent.event import Event
+
+from pythreadpool.gevent_thread_pool import GeventThreadPool
+
+
+MODES = {
+    'default': {},
+    'compact': {'compact': True},
+}
+
+
+def now():
+    return time.perf_counter()
+
+
+def run_fanout(options, tasks, trace_memory):
+    release_event = Event()
+    started = [0]
+
+    def task(n):
+        started[0] += 1
+        release_event.wait()
+        return n
+
+    if trace_memory:
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+    pool = GeventThreadPool(total_thread_number=tasks, **options)
+    start = now()
+    for n in range(tasks):
+        pool.apply_async(task, args=(n,))
+    while started[0] < tasks:
+        gevent.sleep(0)
+    spawned = now()
+    if trace_memory:
+        # Every task is parked on the event here, so this is the cost of one in-flight greenlet.
+        in_flight_bytes = (tracemalloc.get_traced_memory()[0] - baseline) / tasks
+        tracemalloc.stop()
+    release_event.set()
+    pool.get_results_order_by_index()
+    finished = now()
+    if trace_memory:
+        return {'bytes_per_in_flight_task': in_flight_bytes}
+    return {
+        'spawn_tasks_per_second': tasks / (spawned - start),
+        'complete_tasks_per_second': tasks / (finished - spawned),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Memory and spawn throughput of GeventThreadPool at high fan-out')
+    parser.add_argument('--tasks', default='100000,1000000')
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default='-')
+    args = parser.parse_args(argv)
+
+    report = {
+        'meta': {
+            'python': sys.version,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'gevent': gevent.__version__,
+            'timestamp': time.time(),
+            'repeat': args.repeat,
+        },
+        'results': {},
+    }
+    for tasks in (int(n) for n in args.tasks.split(',')):
+        report['results'][tasks] = {}
+        for mode in args.modes.split(','):
+            result = run_fanout(MODES[mode], tasks, trace_memory=True)
+            runs = [run_fanout(MODES[mode], tasks, trace_memory=False) for _ in range(args.repeat)]
+            for key in runs[0]:
+                result[key] = max(run[key] for run in runs)
+            report['results'][tasks][mode] = result
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output == '-':
+        print(output)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    return report
+
+
+if __name__ == '__main__':
+    main()
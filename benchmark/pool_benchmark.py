@@ -0,0 +1,225 @@
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+
+from pythreadpool.native_thread_pool import NativeThreadPool
+
+try:
+    import gevent
+    from pythreadpool.gevent_thread_pool import GeventThreadPool
+except ImportError:
+    gevent = None
+    GeventThreadPool = None
+
+
+def noop():
+    pass
+
+
+def now():
+    return time.perf_counter()
+
+
+class PoolBackend:
+
+    def __init__(self, name, pool_factory, sleep):
+        self.name = name
+        self.pool_factory = pool_factory
+        self.sleep = sleep
+
+    def new_pool(self, capacity):
+        return self.pool_factory(capacity)
+
+    def submit_latency(self, tasks):
+        pool = self.new_pool(tasks)
+        start = now()
+        for _ in range(tasks):
+            pool.apply_async(noop)
+        elapsed = now() - start
+        pool.wait_all_threads()
+        self.close(pool)
+        return elapsed / tasks
+
+    def empty_task_throughput(self, tasks, capacity):
+        pool = self.new_pool(capacity)
+        start = now()
+        for _ in range(tasks):
+            pool.apply_async(noop)
+        pool.wait_all_threads()
+        elapsed = now() - start
+        self.close(pool)
+        return tasks / elapsed
+
+    def result_retrieval(self, tasks, method):
+        pool = self.new_pool(tasks)
+        for _ in range(tasks):
+            pool.apply_async(noop)
+        while len(pool.completed_threads) < tasks:
+            self.sleep(0.001)
+        start = now()
+        if method == 'get_results_order_by_index':
+            pool.get_results_order_by_index()
+        elif method == 'get_results_order_by_time':
+            for _ in pool.get_results_order_by_time():
+                pass
+        else:
+            for _ in range(tasks):
+                pool.get_one_result()
+        elapsed = now() - start
+        pool.refresh()
+        self.close(pool)
+        return elapsed / tasks
+
+    def wakeup_latency(self, rounds):
+        pool = self.new_pool(1)
+        latencies = []
+        for _ in range(rounds):
+            pool.apply_async(self.delayed_clock)
+            finished_at = pool.get_one_result()
+            latencies.append(now() - finished_at)
+        pool.refresh()
+        self.close(pool)
+        return statistics.median(latencies)
+
+    def stop_all_cost(self, tasks):
+        pool = self.new_pool(tasks)
+        for _ in range(tasks):
+            pool.apply_async(self.long_task)
+        self.sleep(0.05)
+        start = now()
+        pool.stop_all()
+        elapsed = now() - start
+        pool.refresh()
+        self.close(pool)
+        return elapsed / tasks
+
+    def long_task(self):
+        for _ in range(1000):
+            self.sleep(0.01)
+
+    def delayed_clock(self):
+        self.sleep(0.001)
+        return now()
+
+    def close(self, pool):
+        if getattr(pool, 'persistent_workers', False):
+            pool.shutdown()
+
+
+class ExecutorBackend(PoolBackend):
+
+    def __init__(self):
+        PoolBackend.__init__(self, 'thread_pool_executor', ThreadPoolExecutor, time.sleep)
+
+    def new_pool(self, capacity):
+        return ThreadPoolExecutor(max_workers=capacity)
+
+    def submit_latency(self, tasks):
+        with self.new_pool(tasks) as executor:
+            start = now()
+            futures = [executor.submit(noop) for _ in range(tasks)]
+            elapsed = now() - start
+            wait(futures)
+        return elapsed / tasks
+
+    def empty_task_throughput(self, tasks, capacity):
+        with self.new_pool(capacity) as executor:
+            start = now()
+            wait([executor.submit(noop) for _ in range(tasks)])
+            elapsed = now() - start
+        return tasks / elapsed
+
+    def result_retrieval(self, tasks, method):
+        with self.new_pool(tasks) as executor:
+            futures = [executor.submit(noop) for _ in range(tasks)]
+            wait(futures)
+            start = now()
+            if method == 'get_results_order_by_time':
+                for future in as_completed(futures):
+                    future.result()
+            else:
+                for future in futures:
+                    future.result()
+            elapsed = now() - start
+        return elapsed / tasks
+
+    def wakeup_latency(self, rounds):
+        latencies = []
+        with self.new_pool(1) as executor:
+            for _ in range(rounds):
+                finished_at = executor.submit(self.delayed_clock).result()
+                latencies.append(now() - finished_at)
+        return statistics.median(latencies)
+
+    def stop_all_cost(self, tasks):
+        executor = self.new_pool(tasks)
+        futures = [executor.submit(time.sleep, 0.2) for _ in range(tasks)]
+        start = now()
+        executor.shutdown(wait=False, cancel_futures=True)
+        elapsed = now() - start
+        wait(futures)
+        return elapsed / tasks
+
+
+def build_backends(names):
+    backends = {
+        'native': lambda: PoolBackend('native', lambda capacity: NativeThreadPool(total_thread_number=capacity), time.sleep),
+        'native_persistent': lambda: PoolBackend('native_persistent', lambda capacity: NativeThreadPool(
+            total_thread_number=capacity, persistent_workers=True), time.sleep),
+        'thread_pool_executor': ExecutorBackend,
+    }
+    if GeventThreadPool is not None:
+        backends['gevent'] = lambda: PoolBackend('gevent', lambda capacity: GeventThreadPool(total_thread_number=capacity), gevent.sleep)
+    return [backends[name]() for name in names if name in backends]
+
+
+def run_backend(backend, tasks, capacity, repeat):
+    def best(measure, *args, larger_is_better=False):
+        samples = [measure(*args) for _ in range(repeat)]
+        return max(samples) if larger_is_better else min(samples)
+
+    return {
+        'submit_latency_seconds': best(backend.submit_latency, tasks),
+        'empty_task_throughput_per_second': best(backend.empty_task_throughput, tasks, capacity, larger_is_better=True),
+        'get_results_order_by_index_seconds_per_result': best(backend.result_retrieval, tasks, 'get_results_order_by_index'),
+        'get_results_order_by_time_seconds_per_result': best(backend.result_retrieval, tasks, 'get_results_order_by_time'),
+        'get_one_result_seconds_per_result': best(backend.result_retrieval, tasks, 'get_one_result'),
+        'get_one_result_wakeup_latency_seconds': best(backend.wakeup_latency, 200),
+        'stop_all_seconds_per_task': best(backend.stop_all_cost, min(tasks, 500)),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Microbenchmarks for pythreadpool primitives')
+    parser.add_argument('--tasks', type=int, default=2000)
+    parser.add_argument('--capacity', type=int, default=16)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--backends', default='native,native_persistent,gevent,thread_pool_executor')
+    parser.add_argument('--output', default='-')
+    args = parser.parse_args(argv)
+
+    report = {
+        'meta': {
+            'python': sys.version,
+            'platform': platform.platform(),
+            'timestamp': time.time(),
+            'tasks': args.tasks,
+            'capacity': args.capacity,
+            'repeat': args.repeat,
+        },
+        'results': {},
+    }
+    for backend in build_backends(args.backends.split(',')):
+        report['results'][backend.name] = run_backend(backend, args.tasks, args.capacity, args.repeat)
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output == '-':
+        print(output)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    return report
@@ -0,0 +1,107 @@
+import argparse
+import json
+import os
+import platform
+import queue
+import sys
+import threading
+import time
+
+from pythreadpool.native_thread_pool import NativeThreadPool
+from pythreadpool.result_channel import ResultChannel
+
+
+CHANNELS = {
+    'queue': queue.Queue,
+    'result_channel': ResultChannel,
+}
+
+
+def now():
+    return time.perf_counter()
+
+
+def noop():
+    pass
+
+
+def channel_throughput(channel_factory, producers, items):
+    channel = channel_factory()
+    start_event = threading.Event()
+
+    def produce():
+        start_event.wait()
+        put = channel.put
+        for item in range(items):
+            put(item)
+
+    threads = [threading.Thread(target=produce) for _ in range(producers)]
+    for thread in threads:
+        thread.start()
+    start = now()
+    start_event.set()
+    get = channel.get
+    for _ in range(producers * items):
+        get()
+    elapsed = now() - start
+    for thread in threads:
+        thread.join()
+    return producers * items / elapsed
+
+
+def pool_completion_throughput(channel_factory, capacity, tasks):
+    pool = NativeThreadPool(total_thread_number=capacity, persistent_workers=True)
+    # Swap the completion path only, everything else about the pool stays the same.
+    pool._thread_res_queue = channel_factory()
+    start = now()
+    for _ in range(tasks):
+        pool.apply_async(noop)
+    pool.wait_all_threads()
+    elapsed = now() - start
+    pool.shutdown()
+    return tasks / elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Completion channel throughput, queue.Queue against ResultChannel')
+    parser.add_argument('--items', type=int, default=20000)
+    parser.add_argument('--tasks', type=int, default=20000)
+    parser.add_argument('--producers', default=','.join(str(n) for n in (1, 2, 4, 8, 16, 32) if n <= max(os.cpu_count() or 1, 4)))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default='-')
+    args = parser.parse_args(argv)
+
+    report = {
+        'meta': {
+            'python': sys.version,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'timestamp': time.time(),
+            'items': args.items,
+            'tasks': args.tasks,
+            'repeat': args.repeat,
+        },
+        'results': {},
+    }
+    for producers in (int(n) for n in args.producers.split(',')):
+        report['results'][producers] = {
+            f'{name}_items_per_second': max(channel_throughput(factory, producers, args.items) for _ in range(args.repeat))
+            for name, factory in CHANNELS.items()
+        }
+        report['results'][producers].update({
+            f'pool_{name}_tasks_per_second': max(pool_completion_throughput(factory, producers, args.tasks)
+                                                 for _ in range(args.repeat))
+            for name, factory in CHANNELS.items()
+        })
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output == '-':
+        print(output)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+import math
+import threading
+from collections import deque
+
+try:
+    from .admission import AdmissionWaiter
+except ImportError:
+    from admission import AdmissionWaiter
+
+
+class AIMDController:
+
+    __slots__ = ('backoff', 'increase', 'latency_threshold')
+
+    def __init__(self, backoff=0.9, increase=1.0, latency_threshold=None):
+        assert 0 < backoff < 1
+        self.backoff = backoff
+        self.increase = increase
+        self.latency_threshold = latency_threshold
+
+    def update(self, limit, latency, success, in_flight):
+        if not success or (self.latency_threshold is not None and latency > self.latency_threshold):
+            return limit * self.backoff
+        # Only grow while the limit is what holds the pool back, an idle pool learns nothing about the backend.
+        if in_flight * 2 >= limit:
+            return limit + self.increase / limit
+        return limit
+
+
+class GradientController:
+
+    __slots__ = ('smoothing', 'tolerance', 'backoff', 'long_latency', 'long_window')
+
+    def __init__(self, smoothing=0.2, tolerance=1.5, backoff=0.9, long_window=600):
+        self.smoothing = smoothing
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.long_latency = None
+        self.long_window = long_window
+
+    def update(self, limit, latency, success, in_flight):
+        if not success:
+            return limit * self.backoff
+        if self.long_latency is None:
+            self.long_latency = latency
+        else:
+            self.long_latency += (latency - self.long_latency) / self.long_window
+        if latency <= 0:
+            return limit
+        # Latency above the long term baseline means requests are queueing in the backend.
+        gradient = max(0.5, min(1.0, self.tolerance * self.long_latency / latency))
+        target = limit * gradient + math.sqrt(limit)
+        if in_flight * 2 < limit:
+            target = min(target, limit)
+        return limit * (1 - self.smoothing) + target * self.smoothing
+
+
+class AdaptiveLimiter:
+
+    __slots__ = ('controller', 'min_limit', 'max_limit', 'limit', 'in_flight', 'lock', 'waiters', 'event_factory',
+                 'samples', 'failures')
+
+    def __init__(self, max_limit, min_limit=1, initial_limit=None, controller=None, event_factory=threading.Event, lock=None):
+        assert 0 < min_limit <= max_limit
+        self.controller = controller if controller is not None else AIMDController()
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial_limit if initial_limit is not None else min_limit, min_limit), max_limit))
+        self.in_flight = 0
+        self.lock = lock if lock is not None else threading.Lock()
+        self.waiters = deque()
+        self.event_factory = event_factory
+        self.samples = 0
+        self.failures = 0
+
+    def current_limit(self):
+        return int(self.limit)
+
+    def acquire(self, blocking=True, timeout=None):
+        with self.lock:
+            if self.in_flight < int(self.limit) and not self.waiters:
+                self.in_flight += 1
+                return True
+            if not blocking:
+                return False
+            waiter = AdmissionWaiter(self.event_factory())
+            self.waiters.append(waiter)
+        if waiter.event.wait(timeout):
+            return True
+        with self.lock:
+            if waiter.granted:
+                return True
+            waiter.abandoned = True
+            return False
+
+    def release(self):
+        with self.lock:
+            if self.in_flight <= 0:
+                raise ValueError('Semaphore released too many times')
+            self.in_flight -= 1
+            self._grant()
+
+    def record(self, latency, success):
+        with self.lock:
+            self.samples += 1
+            if not success:
+                self.failures += 1
+            limit = self.controller.update(self.limit, latency, success, self.in_flight)
+            self.limit = float(min(max(limit, self.min_limit), self.max_limit))
+            self._grant()
+
+    def _grant(self):
+        waiters = self.waiters
+        limit = int(self.limit)
+        while waiters and self.in_flight < limit:
+            waiter = waiters.popleft()
+            if waiter.abandoned:
+                continue
+            self.in_flight += 1
+            waiter.granted = True
+            waiter.event.set()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'limit': int(self.limit),
+                'in_flight': self.in_flight,
+                'waiting': sum(1 for waiter in self.waiters if not waiter.abandoned),
+                'samples': self.samples,
+                'failures': self.failures,
+            }
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
@@ -0,0 +1,77 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class AdmissionWaiter:
+
+    __slots__ = ('event', 'granted', 'abandoned')
+
+    def __init__(self, event):
+        self.event = event
+        self.granted = False
+        self.abandoned = False
+
+
+class AdmissionSemaphore:
+
+    __slots__ = ('value', 'initial_value', 'lock', 'waiters', 'event_factory', '_sequence')
+
+    def __init__(self, value=1, event_factory=threading.Event, lock=None):
+        assert value >= 0
+        self.value = value
+        self.initial_value = value
+        self.lock = lock if lock is not None else threading.Lock()
+        self.waiters = []
+        self.event_factory = event_factory
+        self._sequence = itertools.count()
+
+    def acquire(self, blocking=True, timeout=None, priority=0, deadline=None):
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        with self.lock:
+            if self.value > 0:
+                self.value -= 1
+                return True
+            if not blocking:
+                return False
+            waiter = AdmissionWaiter(self.event_factory())
+            heapq.heappush(self.waiters, (priority, deadline if deadline is not None else float('inf'),
+                                          next(self._sequence), waiter))
+        if waiter.event.wait(timeout):
+            return True
+        with self.lock:
+            if waiter.granted:
+                return True
+            waiter.abandoned = True
+            return False
+
+    def release(self):
+        with self.lock:
+            waiters = self.waiters
+            now = time.monotonic() if waiters else None
+            while waiters:
+                _, deadline, _, waiter = heapq.heappop(waiters)
+                if not waiter.abandoned and deadline > now:
+                    # Hand the slot straight to the most urgent waiter so a newcomer can not overtake it.
+                    waiter.granted = True
+                    waiter.event.set()
+                    return
+            if self.value >= self.initial_value:
+                raise ValueError('Semaphore released too many times')
+            self.value += 1
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
@@ -0,0 +1,107 @@
+import threading
+from concurrent.futures import CancelledError
+
+
+class BatchItem:
+
+    __slots__ = ('key', 'batch', 'done', 'success', 'result', 'callback')
+
+    def __init__(self, key, batch):
+        self.key = key
+        self.batch = batch
+        self.done = False
+        self.success = None
+        self.result = None
+        self.callback = None
+
+    def follow(self, callback, *args):
+        with self.batch.batcher.lock:
+            if not self.done:
+                self.callback = (callback, args)
+                return
+        callback(*args, self.success, self.result)
+
+
+class Batch:
+
+    __slots__ = ('batcher', 'items', 'full')
+
+    def __init__(self, batcher, key):
+        self.batcher = batcher
+        self.items = [BatchItem(key, self)]
+        self.full = batcher.event_factory()
+
+    def close(self):
+        batcher = self.batcher
+        with batcher.lock:
+            if batcher.pending is self:
+                batcher.pending = None
+            return self.items
+
+    def run(self):
+        batcher = self.batcher
+        if batcher.linger > 0:
+            self.full.wait(batcher.linger)
+        items = self.close()
+        keys = [item.key for item in items]
+        try:
+            results = batcher.batch_func(keys)
+            if len(results) != len(keys):
+                raise ValueError(f'Batch function returned {len(results)} results for {len(keys)} items')
+        except BaseException as e:
+            self.deliver(items[1:], False, e if isinstance(e, Exception) else CancelledError())
+            raise
+        for item, res in zip(items[1:], results[1:]):
+            self.deliver((item,), True, res)
+        return results[0]
+
+    def deliver(self, items, success, result):
+        callbacks = []
+        with self.batcher.lock:
+            for item in items:
+                if item.done:
+                    continue
+                item.done = True
+                item.success = success
+                item.result = result
+                if item.callback is not None:
+                    callbacks.append(item.callback)
+                    item.callback = None
+        for callback, args in callbacks:
+            callback(*args, success, result)
+
+    def land(self, success, result):
+        # The leading call already handed out every result unless it never got to run the batch.
+        if not success:
+            self.deliver(self.close()[1:], False, result)
+
+
+class Batcher:
+
+    __slots__ = ('batch_func', 'max_batch_size', 'linger', 'event_factory', 'lock', 'pending')
+
+    def __init__(self, batch_func, max_batch_size=64, linger=0.005, event_factory=threading.Event):
+        assert max_batch_size > 0
+        self.batch_func = batch_func
+        self.max_batch_size = max_batch_size
+        self.linger = linger
+        self.event_factory = event_factory
+        self.lock = threading.Lock()
+        self.pending = None
+
+    def join(self, key):
+        with self.lock:
+            batch = self.pending
+            if batch is None:
+                batch = Batch(self, key)
+                if self.max_batch_size > 1:
+                    self.pending = batch
+                else:
+                    batch.full.set()
+                return True, batch
+            item = BatchItem(key, batch)
+            batch.items.append(item)
+            if len(batch.items) >= self.max_batch_size:
+                self.pending = None
+                batch.full.set()
+            return False, item
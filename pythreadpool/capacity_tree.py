@@ -0,0 +1,88 @@
+import threading
+import time
+
+
+class NoopSemaphore:
+
+    __slots__ = ()
+
+    def acquire(self, blocking=True, timeout=None):
+        return True
+
+    def release(self):
+        pass
+
+
+class CapacityNode:
+
+    __slots__ = ('capacity', 'used', 'parent', 'path', 'condition', '_tree_state')
+
+    def __init__(self, capacity, parent=None):
+        assert capacity > 0
+        self.capacity = capacity
+        self.used = 0
+        self.parent = parent
+        if parent is None:
+            self.path = (self,)
+            self.condition = threading.Condition(threading.Lock())
+            # Number of blocked acquirers in the whole tree, shared by every node.
+            self._tree_state = [0]
+        else:
+            self.path = (self,) + parent.path
+            self.condition = parent.condition
+            self._tree_state = parent._tree_state
+
+    def new_child(self, capacity=0):
+        return CapacityNode(capacity if capacity > 0 else self.capacity, self)
+
+    def root(self):
+        return self.path[-1]
+
+    def depth(self):
+        return len(self.path)
+
+    def available(self):
+        for node in self.path:
+            if node.used >= node.capacity:
+                return False
+        return True
+
+    def acquire(self, blocking=True, timeout=None):
+        with self.condition:
+            if not self.available():
+                if not blocking:
+                    return False
+                self._tree_state[0] += 1
+                try:
+                    if timeout is None:
+                        while not self.available():
+                            self.condition.wait()
+                    else:
+                        deadline = time.monotonic() + timeout
+                        while not self.available():
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                return False
+                            self.condition.wait(remaining)
+                finally:
+                    self._tree_state[0] -= 1
+            for node in self.path:
+                node.used += 1
+            return True
+
+    def release(self):
+        with self.condition:
+            for node in self.path:
+                if node.used <= 0:
+                    raise ValueError('Semaphore released too many times')
+            for node in self.path:
+                node.used -= 1
+            if self._tree_state[0]:
+                self.condition.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
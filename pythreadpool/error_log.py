@@ -0,0 +1,88 @@
+import logging
+import threading
+import time
+import traceback
+
+try:
+    from .pool_metrics import PoolMetrics
+except ImportError:
+    from pool_metrics import PoolMetrics
+
+
+class LazyTraceback:
+
+    __slots__ = ('exception', 'summary', '_text')
+
+    def __init__(self, exception, detach=False):
+        self.exception = exception
+        self.summary = None
+        self._text = None
+        if detach:
+            # The frames are dropped right after logging, a handler that formats later still finds them here.
+            # Source lines are left to be read when the record is rendered.
+            self.summary = traceback.TracebackException(type(exception), exception, exception.__traceback__,
+                                                        lookup_lines=False)
+
+    def __str__(self):
+        if self._text is None:
+            if self.summary is not None:
+                self._text = ''.join(self.summary.format()).rstrip('\n')
+            else:
+                exception = self.exception
+                self._text = ''.join(traceback.format_exception(type(exception), exception, exception.__traceback__)).rstrip('\n')
+        return self._text
+
+
+def drop_frames(exception):
+    seen = set()
+    while exception is not None and id(exception) not in seen:
+        seen.add(id(exception))
+        exception.__traceback__ = None
+        exception = exception.__cause__ or exception.__context__
+
+
+class ErrorLogEntry:
+
+    __slots__ = ('count', 'suppressed', 'logged_at')
+
+    def __init__(self, logged_at):
+        self.count = 1
+        self.suppressed = 0
+        self.logged_at = logged_at
+
+
+class ErrorLog:
+
+    __slots__ = ('interval', 'lock', 'entries')
+
+    def __init__(self, interval=60):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def report(self, func, exception, message, *args, detach=False):
+        key = (PoolMetrics.name_of(func), type(exception))
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.entries[key] = ErrorLogEntry(now)
+                suppressed = 0
+            else:
+                entry.count += 1
+                if now - entry.logged_at < self.interval:
+                    entry.suppressed += 1
+                    return False
+                suppressed = entry.suppressed
+                entry.suppressed = 0
+                entry.logged_at = now
+        if suppressed:
+            logging.error(f"{message}, {suppressed} similar errors suppressed, error msg: \n%s", *args, LazyTraceback(exception, detach))
+        else:
+            logging.error(f"{message}, error msg: \n%s", *args, LazyTraceback(exception, detach))
+        return True
+
+    def snapshot(self):
+        with self.lock:
+            return {f'{name}: {exception_type.__qualname__}': {'count': entry.count, 'suppressed': entry.suppressed}
+                    for (name, exception_type), entry in self.entries.items()}
@@ -0,0 +1,219 @@
+import multiprocessing
+import os
+import struct
+import traceback
+from itertools import count
+from multiprocessing.reduction import ForkingPickler
+
+try:
+    import gevent
+    import gevent.socket
+    from gevent.event import AsyncResult
+    from gevent.queue import Queue
+except:
+    raise ImportError("Import gevent failed, please install gevent by 'pip3 install gevent'")
+
+try:
+    from .gevent_thread_pool import GeventThreadPool
+    from .native_process_pool import RemoteTraceback
+except ImportError:
+    from gevent_thread_pool import GeventThreadPool
+    from native_process_pool import RemoteTraceback
+
+
+HEADER = struct.Struct('!Q')
+
+
+class MessageSocket:
+
+    __slots__ = ('sock', 'outbox', 'writer')
+
+    def __init__(self, conn):
+        # The pipe as a gevent socket, a message larger than the pipe buffer never blocks the hub on either end.
+        self.sock = gevent.socket.socket(fileno=os.dup(conn.fileno()))
+        conn.close()
+        self.outbox = Queue()
+        self.writer = gevent.spawn(self.write_messages)
+
+    def send(self, obj):
+        # Pickled here so a bad payload fails its caller, written by a single greenlet so a killed caller
+        # never leaves half a message behind.
+        self.outbox.put(ForkingPickler.dumps(obj))
+
+    def write_messages(self):
+        sock = self.sock
+        for data in self.outbox:
+            try:
+                sock.sendall(HEADER.pack(len(data)))
+                sock.sendall(data)
+            except OSError:
+                return
+
+    def recv(self):
+        return ForkingPickler.loads(self.recv_exactly(HEADER.unpack(self.recv_exactly(HEADER.size))[0]))
+
+    def recv_exactly(self, size):
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        received = 0
+        while received < size:
+            n = self.sock.recv_into(view[received:])
+            if n == 0:
+                raise EOFError
+            received += n
+        return buffer
+
+    def flush(self):
+        self.outbox.put(StopIteration)
+        self.writer.join()
+
+    def close(self):
+        self.writer.kill()
+        self.sock.close()
+
+
+def run_hub_worker(conn, monkey_patch=True):
+    if monkey_patch:
+        # Tasks are plain functions, a blocking call in one of them would stall every other task of the process.
+        from gevent import monkey
+        monkey.patch_all()
+    # Every task runs on its own greenlet, so one process keeps many I/O bound tasks in flight.
+    running = {}
+    channel = MessageSocket(conn)
+
+    def run(task_id, func, args, kwargs):
+        try:
+            res = (task_id, True, func(*args, **kwargs), None)
+        except Exception as e:
+            res = (task_id, False, e, traceback.format_exc())
+        finally:
+            running.pop(task_id, None)
+        try:
+            channel.send(res)
+        except Exception as e:
+            channel.send((task_id, False, RuntimeError(f'Result of {func!r} can not be sent back: {e!r}'), None))
+
+    while True:
+        try:
+            message = channel.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            gevent.joinall(list(running.values()))
+            break
+        if message[0] == 'run':
+            task_id, func, args, kwargs = message[1:]
+            running[task_id] = gevent.spawn(run, task_id, func, args, kwargs)
+        else:
+            greenlet = running.pop(message[1], None)
+            if greenlet is not None:
+                greenlet.kill(block=False)
+    channel.flush()
+    channel.close()
+
+
+class HubProcess:
+
+    __slots__ = ('process', 'channel', 'waiting', 'reader')
+
+    def __init__(self, process, channel):
+        self.process = process
+        self.channel = channel
+        self.waiting = {}
+        self.reader = None
+
+
+class HubProcessGroup:
+
+    __slots__ = ('context', 'monkey_patch', 'processes', 'task_ids', 'closed')
+
+    def __init__(self, process_number=None, context='spawn', monkey_patch=True):
+        # A forked child would inherit the parent's hub with all of its greenlets, spawn starts clean.
+        self.context = multiprocessing.get_context(context)
+        self.monkey_patch = monkey_patch
+        self.task_ids = count()
+        self.closed = False
+        self.processes = [self.start_process() for _ in range(process_number or os.cpu_count() or 1)]
+
+    def start_process(self):
+        parent_conn, child_conn = self.context.Pipe()
+        process = self.context.Process(target=run_hub_worker, args=(child_conn, self.monkey_patch), daemon=True)
+        process.start()
+        child_conn.close()
+        worker = HubProcess(process, MessageSocket(parent_conn))
+        worker.reader = gevent.spawn(self.read_results, worker)
+        return worker
+
+    def read_results(self, worker):
+        channel = worker.channel
+        while True:
+            try:
+                task_id, success, res, tb = channel.recv()
+            except (EOFError, OSError):
+                break
+            waiter = worker.waiting.pop(task_id, None)
+            if waiter is None:
+                continue
+            if tb is not None:
+                res.__cause__ = RemoteTraceback(tb)
+            waiter.set((success, res))
+        channel.close()
+        worker.process.join()
+        waiting = worker.waiting
+        worker.waiting = {}
+        for waiter in waiting.values():
+            waiter.set((False, RuntimeError(f'Worker process {worker.process.pid} exited with code {worker.process.exitcode}')))
+        if not self.closed:
+            self.processes[self.processes.index(worker)] = self.start_process()
+
+    def run_remote(self, func, args, kwargs):
+        worker = min(self.processes, key=lambda process: len(process.waiting))
+        task_id = next(self.task_ids)
+        waiter = worker.waiting[task_id] = AsyncResult()
+        try:
+            worker.channel.send(('run', task_id, func, args, kwargs))
+        except BaseException:
+            worker.waiting.pop(task_id, None)
+            raise
+        try:
+            success, res = waiter.get()
+        except BaseException:
+            # Stopped or expired in the parent, the greenlet in the worker process goes as well.
+            if worker.waiting.pop(task_id, None) is not None:
+                worker.channel.send(('kill', task_id))
+            raise
+        if not success:
+            raise res
+        return res
+
+    def shutdown(self):
+        self.closed = True
+        for worker in self.processes:
+            worker.channel.send(None)
+        # Workers finish what they are running first, the readers keep delivering until each one exits.
+        gevent.joinall([worker.reader for worker in self.processes])
+
+
+class GeventProcessPool(GeventThreadPool):
+
+    __slots__ = ('_process_group',)
+
+    def __init__(self, **kwargs):
+        self._process_group = kwargs.get('process_group')
+        if self._process_group is None:
+            self._process_group = HubProcessGroup(kwargs.get('process_number'), kwargs.get('mp_context', 'spawn'),
+                                                  kwargs.get('monkey_patch', True))
+        GeventThreadPool.__init__(self, **kwargs)
+
+    def start_thread(self, thread_number, func, args, kwargs):
+        GeventThreadPool.start_thread(self, thread_number, self._process_group.run_remote, (func, args, kwargs), {})
+
+    def start_compact_thread(self, thread_number, func, args, kwargs):
+        GeventThreadPool.start_compact_thread(self, thread_number, self._process_group.run_remote, (func, args, kwargs), {})
+
+    def new_shared_pool(self, max_thread=0, exit_for_any_exception=False, streaming=None, **kwargs):
+        return GeventThreadPool.new_shared_pool(self, max_thread, exit_for_any_exception, streaming,
+                                                process_group=self._process_group, **kwargs)
+
+    def shutdown(self):
+        self._process_group.shutdown()
@@ -1,31 +1,90 @@
+import contextvars
 import logging
+import queue
 import sys
-import traceback
+import time
+from collections import deque
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, FIRST_EXCEPTION, CancelledError
+from functools import partial
 
 try:
     import gevent
+    from gevent import GreenletExit
     from gevent._semaphore import BoundedSemaphore
+    from gevent.event import Event
+    from gevent.monkey import get_original
     from gevent.queue import Queue
+    from greenlet import greenlet as RawGreenlet
 except:
     raise ImportError("Import gevent failed, please install gevent by 'pip3 install gevent'")
 
+try:
+    from .adaptive_limit import AdaptiveLimiter
+    from .admission import AdmissionSemaphore, DeadlineExceeded
+    from .batching import Batcher
+    from .capacity_tree import NoopSemaphore
+    from .error_log import ErrorLog, LazyTraceback, drop_frames
+    from .index_flags import IndexFlags
+    from .native_thread_pool import PoolFull, ResultTimeout, TaskFuture, ThreadTimeout
+    from .pool_metrics import PoolMetrics
+    from .single_flight import SingleFlight
+except ImportError:
+    from adaptive_limit import AdaptiveLimiter
+    from admission import AdmissionSemaphore, DeadlineExceeded
+    from batching import Batcher
+    from capacity_tree import NoopSemaphore
+    from error_log import ErrorLog, LazyTraceback, drop_frames
+    from index_flags import IndexFlags
+    from native_thread_pool import PoolFull, ResultTimeout, TaskFuture, ThreadTimeout
+    from pool_metrics import PoolMetrics
+    from single_flight import SingleFlight
+
+
+class TaskExpired(BaseException):
+    pass
+
 
 class GeventThreadPool:
 
     __slots__ = ('max_thread', 'main_semaphore', 'sub_semaphore', 'exit_for_any_exception',
                  '_thread_res_queue', 'valid_for_new_thread', 'log_exception', 'thread_list',
-                 'completed_threads', 'killed_threads', 'raise_exception', 'happened_exception')
+                 'completed_threads', 'killed_threads', 'raise_exception', 'happened_exception',
+                 'streaming', '_thread_count', '_consumed_count', 'metrics', '_metric_marks',
+                 'return_future', 'error_log', 'drop_traceback', 'admission', '_timers', 'limiter',
+                 'rate_limiter', 'single_flight', '_flights', '_unstarted',
+                 'batchers', 'max_pending', '_pending', '_dispatcher', '_ready', 'compact',
+                 'inherit_context', '_contexts', '_claims', '_delivered')
 
     def __init__(self, **kwargs):
-        assert 'total_thread_number' in kwargs or ('semaphore' in kwargs and 'max_thread' in kwargs)
-        if 'total_thread_number' in kwargs:
+        assert 'total_thread_number' in kwargs or ('semaphore' in kwargs and 'max_thread' in kwargs) \
+            or isinstance(kwargs.get('limiter'), AdaptiveLimiter)
+        self.admission = kwargs.get('admission', False)
+        self.limiter = kwargs.get('limiter')
+        if self.limiter is True:
+            self.limiter = AdaptiveLimiter(kwargs['total_thread_number'], initial_limit=kwargs['total_thread_number'],
+                                           event_factory=Event)
+        assert self.limiter is None or not self.admission
+        # A submission waiting on an unpatched threading.Event would block the hub, and every greenlet with it.
+        assert self.limiter is None or self.limiter.event_factory is not get_original('threading', 'Event')
+        self.compact = kwargs.get('compact', False)
+        if self.admission:
+            def semaphore_type(value):
+                return AdmissionSemaphore(value, event_factory=Event)
+        else:
+            semaphore_type = BoundedSemaphore
+        if self.limiter is not None and 'semaphore' not in kwargs:
+            self.max_thread = self.limiter.max_limit
+            self.main_semaphore = self.limiter
+            self.sub_semaphore = NoopSemaphore() if self.compact else BoundedSemaphore(self.max_thread)
+        elif 'total_thread_number' in kwargs:
             self.max_thread = kwargs['total_thread_number']
-            self.main_semaphore = BoundedSemaphore(self.max_thread)
-            self.sub_semaphore = BoundedSemaphore(self.max_thread)
+            self.main_semaphore = semaphore_type(self.max_thread)
+            # Both semaphores have the same size here, a compact pool only pays for one of them.
+            self.sub_semaphore = NoopSemaphore() if self.compact else semaphore_type(self.max_thread)
         else:
             self.max_thread = kwargs['max_thread']
             self.main_semaphore = kwargs['semaphore']
-            self.sub_semaphore = BoundedSemaphore(self.max_thread)
+            self.sub_semaphore = semaphore_type(self.max_thread)
         self.exit_for_any_exception = kwargs.get("exit_for_any_exception", False)
         self.raise_exception = kwargs.get("raise_exception", False)
         self._thread_res_queue = Queue()
@@ -35,87 +94,680 @@ class GeventThreadPool:
         self.log_exception = kwargs.get('log_exception', True)
         if self.raise_exception:
             self.log_exception = True
-        self.thread_list = []
-        self.completed_threads = set()
-        self.killed_threads = set()
+        self.streaming = kwargs.get('streaming', False)
+        self.thread_list = {} if self.streaming else []
+        self.completed_threads = self.new_index_set()
+        self.killed_threads = self.new_index_set()
+        self._thread_count = 0
+        self._consumed_count = 0
+        self.metrics = kwargs.get('metrics')
+        if self.metrics is True:
+            self.metrics = PoolMetrics()
+        if self.metrics is not None and self.limiter is not None:
+            self.metrics.add_gauge('concurrency_limit', self.limiter.current_limit)
+        self._metric_marks = {}
+        self.return_future = kwargs.get('return_future', False)
+        # Futures hold on to every greenlet, which is what a compact pool avoids.
+        assert not (self.compact and self.return_future)
+        self.error_log = kwargs.get('error_log')
+        if self.error_log is True:
+            self.error_log = ErrorLog()
+        self.drop_traceback = kwargs.get('drop_traceback', False)
+        self._timers = {}
+        self.rate_limiter = kwargs.get('rate_limiter')
+        # A limiter sleeping in the unpatched time.sleep would block the hub, and every greenlet with it.
+        assert self.rate_limiter is None or self.rate_limiter.sleep is not get_original('time', 'sleep')
+        self.single_flight = kwargs.get('single_flight')
+        if self.single_flight is True:
+            self.single_flight = SingleFlight()
+        if self.metrics is not None and self.single_flight is not None:
+            self.metrics.add_gauge('single_flight', self.single_flight.snapshot)
+        self._flights = {}
+        self._unstarted = set()
+        self.batchers = kwargs.get('batchers')
+        if self.batchers is None:
+            self.batchers = {}
+        self.max_pending = kwargs.get('max_pending')
+        self._pending = deque()
+        self.inherit_context = kwargs.get('inherit_context', False)
+        self._contexts = {}
+        self._dispatcher = None
+        self._ready = deque()
+        self._claims = {}
+        self._delivered = 0
 
     def start_thread(self, thread_number, func, args, kwargs):
         success = True
+        killed = False
         res = None
+        # Bound to the batch it started in, a refresh while it runs does not hand its result to the next batch.
+        thread_list = self.thread_list
+        completed_threads = self.completed_threads
+        killed_threads = self.killed_threads
+        thread_res_queue = self._thread_res_queue
+        claims = self._claims
+        timers = self._timers
+        flights = self._flights
+        limiter = self.limiter
+        if limiter is not None:
+            limiter_started_at = time.perf_counter()
+        metrics = self.metrics
+        if metrics is not None:
+            metric_marks = self._metric_marks
+            name, submitted_at = metric_marks[thread_number]
+            started_at = time.perf_counter()
+            metrics.on_start(name, started_at - submitted_at)
+        context = self._contexts.pop(thread_number, None) if self.inherit_context else None
         try:
-            res = func(*args, **kwargs)
+            res = func(*args, **kwargs) if context is None else context.run(func, *args, **kwargs)
         except Exception as e:
             self.happened_exception = e
             res = e
-            err_msg = traceback.format_exc()
             if self.log_exception:
-                logging.error(f"Thread {thread_number} failed, error msg: \n{err_msg}")
+                self.report_exception(func, e, "Thread %s failed", thread_number)
             if self.exit_for_any_exception:
                 sys.exit()
+            if self.drop_traceback:
+                drop_frames(e)
+            success = False
+        except TaskExpired as e:
+            res = ThreadTimeout(str(e))
+            self.happened_exception = res
+            if self.log_exception:
+                self.report_exception(func, res, "Thread %s failed", thread_number)
             success = False
+        except GreenletExit:
+            killed = True
+            raise
         finally:
+            if limiter is not None and not killed:
+                limiter.record(time.perf_counter() - limiter_started_at, success)
             self.main_semaphore.release()
             self.sub_semaphore.release()
-            self.completed_threads.add(thread_number)
-            self._thread_res_queue.put((thread_number, success, res))
+            timer = timers.pop(thread_number, None)
+            if timer is not None:
+                timer.close()
+            flight = flights.pop(thread_number, None)
+            if flight is not None:
+                if killed:
+                    flight.land(False, CancelledError())
+                else:
+                    flight.land(success, res)
+            if metrics is not None:
+                finished_at = time.perf_counter()
+                metrics.on_finish(name, finished_at - started_at, success)
+                metric_marks[thread_number] = (name, finished_at)
+            if self.streaming:
+                thread = thread_list.pop(thread_number, None)
+            else:
+                thread = thread_list[thread_number]
+                completed_threads.add(thread_number)
+            if killed and self.return_future:
+                if self.streaming:
+                    self._consumed_count += 1
+                else:
+                    killed_threads.add(thread_number)
+            else:
+                item = (thread_number, success, res)
+                if self.return_future and thread is not None:
+                    claims[id(item)] = item
+                thread_res_queue.put(item)
+            if self.return_future and thread is not None:
+                if killed:
+                    thread.set_cancelled()
+                else:
+                    thread.set_result(success, res, item)
+
+    def start_compact_thread(self, thread_number, func, args, kwargs):
+        success = True
+        res = None
+        thread_list = self.thread_list
+        completed_threads = self.completed_threads
+        thread_res_queue = self._thread_res_queue
+        if self.streaming:
+            own = thread_list.get(thread_number) is gevent.getcurrent()
+        else:
+            own = thread_number < len(thread_list) and thread_list[thread_number] is gevent.getcurrent()
+        if not own:
+            # Cancelled by a refresh before it ever ran, its slot went back then.
+            return
+        limiter = self.limiter
+        if limiter is not None:
+            limiter_started_at = time.perf_counter()
+        metrics = self.metrics
+        if metrics is not None:
+            metric_marks = self._metric_marks
+            name, submitted_at = metric_marks[thread_number]
+            started_at = time.perf_counter()
+            metrics.on_start(name, started_at - submitted_at)
+        context = self._contexts.pop(thread_number, None) if self.inherit_context else None
+        try:
+            res = func(*args, **kwargs) if context is None else context.run(func, *args, **kwargs)
+        except Exception as e:
+            self.happened_exception = e
+            res = e
+            if self.log_exception:
+                self.report_exception(func, e, "Thread %s failed", thread_number)
+            if self.exit_for_any_exception:
+                sys.exit()
+            if self.drop_traceback:
+                drop_frames(e)
+            success = False
+        except TaskExpired as e:
+            res = ThreadTimeout(str(e))
+            self.happened_exception = res
+            if self.log_exception:
+                self.report_exception(func, res, "Thread %s failed", thread_number)
+            success = False
+        finally:
+            if self.streaming:
+                settled = thread_list.pop(thread_number, None) is None
+            else:
+                settled = thread_number in completed_threads
+                completed_threads.add(thread_number)
+                # Finished greenlets are not kept around, only their results are.
+                thread_list[thread_number] = None
+            # A stopped task already gave its slot back and delivers nothing.
+            if not settled:
+                if limiter is not None:
+                    limiter.record(time.perf_counter() - limiter_started_at, success)
+                self.main_semaphore.release()
+                self.sub_semaphore.release()
+                if self._timers:
+                    timer = self._timers.pop(thread_number, None)
+                    if timer is not None:
+                        timer.close()
+                if self._flights:
+                    flight = self._flights.pop(thread_number, None)
+                    if flight is not None:
+                        flight.land(success, res)
+                if metrics is not None:
+                    finished_at = time.perf_counter()
+                    metrics.on_finish(name, finished_at - started_at, success)
+                    metric_marks[thread_number] = (name, finished_at)
+                thread_res_queue.put((thread_number, success, res))
+
+    def try_apply_async(self, func, args=None, kwargs=None, **options):
+        try:
+            return self.apply_async(func, args, kwargs, submit_timeout=0, **options)
+        except PoolFull:
+            # Not None, which is what an accepted submission without a thread of its own returns when futures are off.
+            return False
 
-    def apply_async(self, func, args=None, kwargs=None):
+    def apply_async(self, func, args=None, kwargs=None, priority=0, deadline=None, timeout=None, rate_key=None,
+                    submit_timeout=None):
         assert self.valid_for_new_thread
         if self.raise_exception and self.happened_exception is not None:
             raise self.happened_exception
-        self.main_semaphore.acquire()
-        self.sub_semaphore.acquire()
+        flight = None
+        batch = None
+        batcher = self.batchers.get(func) if self.batchers else None
+        if batcher is not None and args is not None and len(args) == 1 and not kwargs:
+            leading, flight = batcher.join(args[0])
+            if not leading:
+                return self.follow_flight(flight, func)
+            batch = flight
+        elif self.single_flight is not None:
+            flight_key = self.single_flight.key_of(func, args, kwargs)
+            if flight_key is not None:
+                leading, flight = self.single_flight.join(flight_key)
+                if not leading:
+                    return self.follow_flight(flight, func)
+        metrics = self.metrics
+        if metrics is not None:
+            wait_started_at = time.perf_counter()
+        pending = False
+        throttled = False
+        if self.rate_limiter is not None and submit_timeout is not None:
+            submit_timeout_at = time.monotonic() + submit_timeout
+        if deadline is not None and deadline <= time.monotonic():
+            admitted = False
+        elif self.max_pending is not None:
+            admitted = True
+            # Queued submissions keep their order, a newcomer never takes tokens or a slot ahead of them.
+            # One that finds no tokens waits for them in the queue, the dispatcher takes them once it is the head.
+            throttled = self.rate_limiter is not None and (
+                bool(self._pending) or not self.rate_limiter.acquire(rate_key, deadline, 0, gevent.sleep))
+            pending = throttled or bool(self._pending) or not self.acquire_slot(False, None, priority, deadline)
+            if pending and len(self._pending) >= self.max_pending:
+                self.reject_full(flight)
+        # Tokens are taken before a slot so a throttled submission does not hold capacity while it waits.
+        elif self.rate_limiter is not None and not self.rate_limiter.acquire(rate_key, deadline, submit_timeout, gevent.sleep):
+            # Refused because the wait would outlast the submit timeout rather than the deadline.
+            if submit_timeout is not None and (deadline is None or time.monotonic() + submit_timeout < deadline):
+                self.reject_full(flight)
+            admitted = False
+        else:
+            if self.rate_limiter is not None and submit_timeout is not None:
+                submit_timeout = max(submit_timeout_at - time.monotonic(), 0)
+            admitted = self.acquire_slot(submit_timeout is None or submit_timeout > 0, submit_timeout, priority, deadline)
+            if not admitted and (deadline is None or deadline > time.monotonic()):
+                self.reject_full(flight)
         if args is None:
             args = tuple()
         if kwargs is None:
             kwargs = dict()
-        thread = gevent.spawn(self.start_thread, len(self.thread_list), func, args, kwargs)
-        self.thread_list.append(thread)
-        return thread
-
-    def new_shared_pool(self, max_thread=0, exit_for_any_exception=False):
-        return GeventThreadPool(semaphore=self.main_semaphore, exit_for_any_exception=exit_for_any_exception,
-                                max_thread=max_thread if max_thread > 0 else self.max_thread)
-
-    def get_results_order_by_index(self, raise_exception=False, with_status=False, stop_all_for_exception=False, with_index=False):
-        self.valid_for_new_thread = False
-        threads_result = [('', '')] * len(self.thread_list) if with_status else [''] * len(self.thread_list)
-        for _ in range(len(self.thread_list) - len(self.killed_threads)):
-            thread_number, success, res = self._thread_res_queue.get()
-            should_break = False
+        if self.streaming:
+            thread_number = self._thread_count
+            self._thread_count += 1
+        else:
+            thread_number = len(self.thread_list)
+        if metrics is not None:
+            name = PoolMetrics.name_of(func)
+            submitted_at = time.perf_counter()
+            metrics.on_submit(name, submitted_at - wait_started_at)
+            self._metric_marks[thread_number] = (name, submitted_at)
+        if not admitted:
+            exception = DeadlineExceeded(f'Thread {thread_number} missed its deadline before admission')
+            if flight is not None:
+                flight.land(False, exception)
+            return self.reject_thread(thread_number, exception)
+        if flight is not None:
+            self._flights[thread_number] = flight
+        if batch is not None:
+            # The first call of a batch carries it, its own result is the first one the batch function returns.
+            func, args, kwargs = batch.run, (), {}
+        if self.inherit_context:
+            self._contexts[thread_number] = contextvars.copy_context()
+        if self.compact:
+            # A bare greenlet parented to the hub, without the links and bookkeeping of gevent.Greenlet.
+            greenlet = RawGreenlet(partial(self.start_compact_thread, thread_number, func, args, kwargs), gevent.get_hub())
+        else:
+            greenlet = gevent.Greenlet(self.start_thread, thread_number, func, args, kwargs)
+        handle = TaskFuture(self, thread_number, greenlet, Event()) if self.return_future else greenlet
+        if self.streaming:
+            self.thread_list[thread_number] = handle
+        else:
+            self.thread_list.append(handle)
+        if pending:
+            self.enqueue_pending((self._unstarted, thread_number, handle, greenlet, timeout, priority, deadline, rate_key,
+                                 throttled))
+        else:
+            self.launch(thread_number, greenlet, timeout)
+        return handle
 
-            if thread_number in self.killed_threads:
+    def acquire_slot(self, blocking, timeout, priority, deadline):
+        admission = dict(priority=priority, deadline=deadline) if self.admission else {}
+        if timeout is not None:
+            timeout_at = time.monotonic() + timeout
+        if not self.main_semaphore.acquire(blocking, timeout if blocking else None, **admission):
+            return False
+        if timeout is not None:
+            timeout = max(timeout_at - time.monotonic(), 0)
+        if not self.sub_semaphore.acquire(blocking, timeout if blocking else None, **admission):
+            self.main_semaphore.release()
+            return False
+        return True
+
+    def reject_full(self, flight):
+        exception = PoolFull('No free slot for the submission')
+        if flight is not None:
+            flight.land(False, exception)
+        raise exception
+
+    def launch(self, thread_number, greenlet, timeout):
+        if self.compact:
+            gevent.get_hub().loop.run_callback(greenlet.switch)
+        else:
+            greenlet.start()
+        if timeout is not None:
+            # A libev timer on the hub, no greenlet is parked per timeout.
+            timer = self._timers[thread_number] = gevent.get_hub().loop.timer(timeout)
+            exception = TaskExpired(f'Thread {thread_number} timeout after {timeout} seconds')
+            if self.compact:
+                timer.start(gevent.kill, greenlet, exception)
+            else:
+                timer.start(greenlet.kill, exception, False)
+
+    def enqueue_pending(self, item):
+        item[0].add(item[1])
+        self._pending.append(item)
+        if self._dispatcher is None:
+            self._dispatcher = gevent.spawn(self.dispatch_pending)
+
+    def dispatch_pending(self):
+        pending = self._pending
+        while pending:
+            # The head stays queued while it waits so it still counts against max_pending.
+            item = pending[0]
+            unstarted, thread_number, handle, greenlet, timeout, priority, deadline, rate_key, throttled = item
+            if thread_number not in unstarted:
+                pending.popleft()
                 continue
+            admitted = (not throttled or self.rate_limiter.acquire(rate_key, deadline, None, gevent.sleep)) \
+                and self.acquire_slot(True, None, priority, deadline)
+            if pending and pending[0] is item:
+                pending.popleft()
+            if not admitted:
+                exception = DeadlineExceeded(f'Thread {thread_number} missed its deadline before admission')
+                flight = self._flights.pop(thread_number, None)
+                if flight is not None:
+                    flight.land(False, exception)
+                self.finish_unstarted(unstarted, thread_number, handle if self.return_future else None, False, exception)
+                continue
+            if thread_number in unstarted:
+                unstarted.discard(thread_number)
+                self.launch(thread_number, greenlet, timeout)
+            else:
+                self.main_semaphore.release()
+                self.sub_semaphore.release()
+        self._dispatcher = None
 
-            if not success:
-                if stop_all_for_exception:
-                    should_break = True
-                    self.stop_all()
-                if raise_exception:
-                    self.refresh()
+    def follow_flight(self, flight, func):
+        if self.streaming:
+            thread_number = self._thread_count
+            self._thread_count += 1
+        else:
+            thread_number = len(self.thread_list)
+        if self.metrics is not None:
+            name = PoolMetrics.name_of(func)
+            self.metrics.on_submit(name, 0.0)
+            self._metric_marks[thread_number] = (name, time.perf_counter())
+        handle = TaskFuture(self, thread_number, None, Event()) if self.return_future else None
+        self._unstarted.add(thread_number)
+        if self.streaming:
+            self.thread_list[thread_number] = handle
+        else:
+            self.thread_list.append(handle)
+        flight.follow(self.finish_unstarted, self._unstarted, thread_number, handle)
+        return handle
+
+    def finish_unstarted(self, unstarted, thread_number, handle, success, res):
+        if thread_number not in unstarted:
+            return
+        unstarted.discard(thread_number)
+        if self.streaming:
+            self.thread_list.pop(thread_number, None)
+        else:
+            self.completed_threads.add(thread_number)
+        if self.metrics is not None:
+            self.metrics.on_finish(self._metric_marks[thread_number][0], 0.0, success)
+        item = (thread_number, success, res)
+        if handle is not None:
+            self._claims[id(item)] = item
+        self._thread_res_queue.put(item)
+        if handle is not None:
+            handle.set_result(success, res, item)
+
+    def stop_unstarted(self, n):
+        flight = self._flights.pop(n, None)
+        if flight is not None:
+            flight.land(False, CancelledError())
+        self._unstarted.discard(n)
+        if self.streaming:
+            thread = self.thread_list.pop(n, None)
+            self._consumed_count += 1
+        else:
+            thread = self.thread_list[n]
+            self.completed_threads.add(n)
+            self.killed_threads.add(n)
+        if self.metrics is not None:
+            self.record_killed(n)
+        if self.return_future and thread is not None:
+            thread.set_cancelled()
+
+    def reject_thread(self, thread_number, exception):
+        handle = TaskFuture(self, thread_number, None, Event()) if self.return_future else None
+        if not self.streaming:
+            self.thread_list.append(handle)
+            self.completed_threads.add(thread_number)
+        if self.metrics is not None:
+            self.metrics.on_finish(self._metric_marks[thread_number][0], 0.0, False)
+        item = (thread_number, False, exception)
+        if handle is not None:
+            self._claims[id(item)] = item
+        self._thread_res_queue.put(item)
+        if handle is not None:
+            handle.set_result(False, exception, item)
+        return handle
+
+    def new_shared_pool(self, max_thread=0, exit_for_any_exception=False, streaming=None, **kwargs):
+        return self.__class__(semaphore=self.main_semaphore, exit_for_any_exception=exit_for_any_exception,
+                              max_thread=max_thread if max_thread > 0 else self.max_thread,
+                              streaming=self.streaming if streaming is None else streaming, metrics=self.metrics, return_future=self.return_future,
+                              error_log=self.error_log, drop_traceback=self.drop_traceback, admission=self.admission,
+                              limiter=self.limiter, rate_limiter=self.rate_limiter, single_flight=self.single_flight,
+                              batchers=self.batchers, max_pending=self.max_pending, compact=self.compact,
+                              inherit_context=self.inherit_context, **kwargs)
+
+    def register_batch(self, func, batch_func, max_batch_size=64, linger=0.005):
+        self.batchers[func] = Batcher(batch_func, max_batch_size, linger, event_factory=Event)
+
+    def report_exception(self, func, exception, message, *args):
+        if self.error_log is None:
+            logging.error(f"{message}, error msg: \n%s", *args, LazyTraceback(exception, self.drop_traceback))
+        else:
+            self.error_log.report(func, exception, message, *args, detach=self.drop_traceback)
+
+    def start_chunk(self, chunk):
+        chunk_result = []
+        for func, args, kwargs in chunk:
+            try:
+                chunk_result.append((True, func(*args, **kwargs)))
+            except Exception as e:
+                if self.log_exception:
+                    self.report_exception(func, e, "Task in chunk failed")
+                if self.exit_for_any_exception:
+                    sys.exit()
+                if self.drop_traceback:
+                    drop_frames(e)
+                chunk_result.append((False, e))
+        return chunk_result
+
+    def apply_many(self, tasks, chunksize=None, raise_exception=False, with_status=False, with_index=False):
+        tasks = [(task[0], task[1] if len(task) > 1 and task[1] is not None else tuple(),
+                  task[2] if len(task) > 2 and task[2] is not None else dict()) for task in tasks]
+        if chunksize is None:
+            chunksize, extra = divmod(len(tasks), self.max_thread * 4)
+            if extra:
+                chunksize += 1
+        chunksize = max(chunksize, 1)
+        pool = self.new_shared_pool(exit_for_any_exception=self.exit_for_any_exception)
+        pool.log_exception = self.log_exception
+        # The calls are fed in by this method, they wait for a slot instead of overflowing the pending queue.
+        pool.max_pending = None
+        for start in range(0, len(tasks), chunksize):
+            pool.apply_async(pool.start_chunk, args=(tasks[start:start + chunksize],))
+        results = []
+        for chunk_result in pool.get_results_order_by_index(raise_exception=True):
+            for success, res in chunk_result:
+                if not success and raise_exception:
                     raise res
+                if with_index:
+                    results.append((len(results), success, res) if with_status else (len(results), res))
+                else:
+                    results.append((success, res) if with_status else res)
+        return results
 
-            if with_index:
-                threads_result[thread_number] = (thread_number, success, res) if with_status else (thread_number, res)
-            else:
-                threads_result[thread_number] = (success, res) if with_status else res
+    def map(self, func, iterable, chunksize=None, raise_exception=False, with_status=False, with_index=False):
+        return self.apply_many(((func, (item,)) for item in iterable), chunksize=chunksize, raise_exception=raise_exception,
+                               with_status=with_status, with_index=with_index)
 
-            if should_break:
-                break
+    def imap(self, func, iterable, buffer_size=0, raise_exception=False, with_status=False, with_index=False):
+        buffer_size = buffer_size if buffer_size > 0 else self.max_thread * 2
+        pool = self.new_shared_pool(exit_for_any_exception=self.exit_for_any_exception, streaming=True)
+        pool.log_exception = self.log_exception
+        pool.max_pending = None
+        iterator = iter(iterable)
+        exhausted = False
+        submitted = 0
+        next_index = 0
+        reorder_buffer = {}
+        try:
+            while True:
+                # Whatever is running or waiting for an earlier index counts against the buffer, so submission
+                # pauses once the consumer falls behind by buffer_size results.
+                while not exhausted and submitted - next_index < buffer_size:
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pool.apply_async(func, args=(item,))
+                    submitted += 1
+                if next_index == submitted:
+                    return
+                while next_index not in reorder_buffer:
+                    thread_number, success, res = pool.get_one_result(with_status=True, with_index=True)
+                    reorder_buffer[thread_number] = (success, res)
+                success, res = reorder_buffer.pop(next_index)
+                if not success and raise_exception:
+                    raise res
+                if with_index:
+                    yield (next_index, success, res) if with_status else (next_index, res)
+                else:
+                    yield (success, res) if with_status else res
+                next_index += 1
+        finally:
+            if next_index < submitted:
+                pool.stop_all()
+
+    def record_consumed(self, thread_number):
+        mark = self._metric_marks.pop(thread_number, None)
+        if mark is not None:
+            self.metrics.on_consume(mark[0], time.perf_counter() - mark[1])
+
+    def record_killed(self, thread_number):
+        mark = self._metric_marks.pop(thread_number, None)
+        if mark is not None:
+            self.metrics.on_finish(mark[0], 0.0, False)
+
+    def consume_thread(self, thread_number, item=None):
+        if item is not None:
+            if self._claims.pop(id(item), None) is None:
+                return
+            self.drop_delivered()
+        if self.streaming:
+            self._consumed_count += 1
+        if item is None or not self.streaming:
+            self.killed_threads.add(thread_number)
+        if self.metrics is not None:
+            self.record_consumed(thread_number)
+
+    def drop_delivered(self):
+        self._delivered += 1
+        if self._delivered * 2 > self._thread_res_queue.qsize() + len(self._ready):
+            self._delivered = 0
+            claims = self._claims
+            for items in (self._thread_res_queue.queue, self._ready):
+                kept = [item for item in items if id(item) in claims]
+                items.clear()
+                items.extend(kept)
+
+    def next_result(self, timeout=None):
+        if not self.return_future:
+            return self.take_result(timeout)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        claims = self._claims
+        while True:
+            item = self.take_result(None if deadline is None else max(deadline - time.monotonic(), 0))
+            if claims.pop(id(item), None) is not None:
+                return item
+
+    def take_result(self, timeout=None):
+        if self._ready:
+            return self._ready.popleft()
+        return self._thread_res_queue.get(timeout=timeout)
+
+    def next_result_until(self, deadline):
+        if deadline is None:
+            return self.next_result()
+        try:
+            return self.next_result(max(deadline - time.monotonic(), 0))
+        except queue.Empty:
+            return None
+
+    def unfinished_threads(self):
+        if self.streaming:
+            return {n for n in self.thread_list if n not in self.killed_threads}
+        return {n for n in range(len(self.thread_list)) if n not in self.completed_threads}
+
+    def results_timeout(self, timeout):
+        return ResultTimeout(f'Results timeout after {timeout} seconds', unfinished=self.unfinished_threads())
+
+    def iter_thread_results(self, timeout=None):
+        killed_threads = self.killed_threads
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if self.streaming:
+            while self._thread_count > self._consumed_count:
+                item = self.next_result_until(deadline)
+                if item is None:
+                    raise self.results_timeout(timeout)
+                if item[0] in killed_threads:
+                    killed_threads.discard(item[0])
+                    continue
+                self._consumed_count += 1
+                if self.metrics is not None:
+                    self.record_consumed(item[0])
+                yield item
+        else:
+            remaining = len(self.thread_list) - len(killed_threads)
+            received = []
+            while remaining > 0:
+                item = self.next_result_until(deadline)
+                if item is None:
+                    killed_threads.update(received)
+                    raise self.results_timeout(timeout)
+                if item[0] in killed_threads:
+                    continue
+                remaining -= 1
+                received.append(item[0])
+                if self.metrics is not None:
+                    self.record_consumed(item[0])
+                yield item
+
+    def get_results_order_by_index(self, raise_exception=False, with_status=False, stop_all_for_exception=False, with_index=False,
+                                   timeout=None):
+        if self.streaming:
+            threads_result = {}
+        else:
+            self.valid_for_new_thread = False
+            threads_result = [('', '')] * len(self.thread_list) if with_status else [''] * len(self.thread_list)
+        try:
+            for thread_number, success, res in self.iter_thread_results(timeout):
+                should_break = False
+
+                if thread_number in self.killed_threads:
+                    continue
+
+                if not success:
+                    if stop_all_for_exception:
+                        should_break = True
+                        self.stop_all()
+                    if raise_exception:
+                        if not self.streaming:
+                            self.refresh()
+                        raise res
+
+                if with_index:
+                    threads_result[thread_number] = (thread_number, success, res) if with_status else (thread_number, res)
+                else:
+                    threads_result[thread_number] = (success, res) if with_status else res
+
+                if should_break:
+                    break
+        except ResultTimeout as e:
+            e.results = [threads_result[thread_number] for thread_number in sorted(threads_result)] \
+                if self.streaming else threads_result
+            raise
+        if self.streaming:
+            return [threads_result[thread_number] for thread_number in sorted(threads_result)]
         self.refresh()
         return threads_result
 
-    def get_results_order_by_time(self, raise_exception=False, with_status=False, with_index=False, stop_all_for_exception=False):
-        self.valid_for_new_thread = False
-        for index in range(len(self.thread_list) - len(self.killed_threads)):
-            thread_number, success, res = self._thread_res_queue.get()
+    def get_results_order_by_time(self, raise_exception=False, with_status=False, with_index=False, stop_all_for_exception=False,
+                                  timeout=None):
+        if not self.streaming:
+            self.valid_for_new_thread = False
+        for thread_number, success, res in self.iter_thread_results(timeout):
             should_break = False
             if not success:
                 if stop_all_for_exception:
                     should_break = True
                     self.stop_all()
                 if raise_exception:
-                    self.refresh()
+                    if not self.streaming:
+                        self.refresh()
                     raise res
 
             if with_index:
@@ -126,53 +778,182 @@ class GeventThreadPool:
             if should_break:
                 break
 
-    def get_one_result(self, raise_exception=False, with_status=False, with_index=False, stop_all_for_exception=False):
-        thread_number, success, res = self._thread_res_queue.get()
-        self.killed_threads.add(thread_number)
-        if not success:
-            if stop_all_for_exception:
-                self.stop_all()
-            if raise_exception:
-                raise res
-        if with_index:
-            return (thread_number, success, res) if with_status else (thread_number, res)
-        else:
-            return (success, res) if with_status else res
-
-    def wait_all_threads(self, raise_exception=False, stop_all_for_exception=False):
-        for _ in range(len(self.thread_list) - len(self.killed_threads)):
-            thread_number, success, res = self._thread_res_queue.get()
+    def get_one_result(self, raise_exception=False, with_status=False, with_index=False, stop_all_for_exception=False, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            item = self.next_result_until(deadline)
+            if item is None:
+                raise ResultTimeout(f'Thread timeout after {timeout} seconds', unfinished=self.unfinished_threads())
+            thread_number, success, res = item
+            if thread_number in self.killed_threads:
+                if self.streaming:
+                    self.killed_threads.discard(thread_number)
+                continue
+            if self.streaming:
+                self._consumed_count += 1
+            else:
+                self.killed_threads.add(thread_number)
+            if self.metrics is not None:
+                self.record_consumed(thread_number)
+            if not success:
+                if stop_all_for_exception:
+                    self.stop_all()
+                if raise_exception:
+                    raise res
+            if with_index:
+                return (thread_number, success, res) if with_status else (thread_number, res)
+            else:
+                return (success, res) if with_status else res
+
+    def wait_all_threads(self, raise_exception=False, stop_all_for_exception=False, timeout=None):
+        for thread_number, success, res in self.iter_thread_results(timeout):
             should_break = False
             if not success:
                 if stop_all_for_exception:
                     should_break = True
                     self.stop_all()
                 if raise_exception:
-                    self.refresh()
+                    if not self.streaming:
+                        self.refresh()
                     raise res
             if should_break:
                 break
-        self.refresh()
+        if not self.streaming:
+            self.refresh()
+
+    def wait(self, return_when=ALL_COMPLETED, timeout=None):
+        assert return_when in (FIRST_COMPLETED, ALL_COMPLETED, FIRST_EXCEPTION)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ready = self._ready
+        while True:
+            # Finished tasks whose results are still queued are done too, so everything queued is pulled in first.
+            try:
+                while True:
+                    ready.append(self._thread_res_queue.get_nowait())
+            except queue.Empty:
+                pass
+            done = {item[0] for item in ready if item[0] not in self.killed_threads
+                    and (not self.return_future or id(item) in self._claims)}
+            not_done = self.unfinished_threads() - done
+            if not not_done or (return_when == FIRST_COMPLETED and done) \
+                    or (return_when == FIRST_EXCEPTION and any(not item[1] for item in ready if item[0] in done)):
+                return done, not_done
+            try:
+                ready.append(self._thread_res_queue.get(timeout=None if deadline is None else max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                return done, not_done
 
     def stop_all(self):
-        for index in range(len(self.thread_list)):
+        for index in (list(self.thread_list) if self.streaming else range(len(self.thread_list))):
             self.stop_nth_thread(index)
 
     def stop_nth_thread(self, n):
-        if n not in self.completed_threads:
+        if self.inherit_context:
+            self._contexts.pop(n, None)
+        if n in self._unstarted:
+            return self.stop_unstarted(n)
+        if self.compact:
+            return self.stop_compact_thread(n)
+        if self.streaming:
+            thread = self.thread_list.get(n)
+            if thread is not None:
+                thread.kill()
+                flight = self._flights.pop(n, None)
+                if flight is not None:
+                    flight.land(False, CancelledError())
+                if self.thread_list.pop(n, None) is not None:
+                    self._consumed_count += 1
+                    self.main_semaphore.release()
+                    self.sub_semaphore.release()
+                    if self.metrics is not None:
+                        self.record_killed(n)
+                    if self.return_future:
+                        thread.set_cancelled()
+        elif n not in self.completed_threads:
             self.thread_list[n].kill()
+            flight = self._flights.pop(n, None)
+            if flight is not None:
+                flight.land(False, CancelledError())
             if n not in self.completed_threads:
                 self.completed_threads.add(n)
                 self.killed_threads.add(n)
                 self.main_semaphore.release()
                 self.sub_semaphore.release()
+                if self.metrics is not None:
+                    self.record_killed(n)
+                if self.return_future:
+                    self.thread_list[n].set_cancelled()
+
+    def stop_compact_thread(self, n):
+        if self.streaming:
+            greenlet = self.thread_list.pop(n, None)
+            if greenlet is None:
+                return
+            self._consumed_count += 1
+        else:
+            if n in self.completed_threads:
+                return
+            greenlet = self.thread_list[n]
+            self.thread_list[n] = None
+            self.completed_threads.add(n)
+            self.killed_threads.add(n)
+        self.main_semaphore.release()
+        self.sub_semaphore.release()
+        timer = self._timers.pop(n, None)
+        if timer is not None:
+            timer.close()
+        flight = self._flights.pop(n, None)
+        if flight is not None:
+            flight.land(False, CancelledError())
+        if self.metrics is not None:
+            self.record_killed(n)
+        # The kill is only scheduled, the task is already settled so its greenlet delivers nothing.
+        gevent.kill(greenlet)
+
+    def new_index_set(self):
+        return IndexFlags() if self.compact and not self.streaming else set()
+
+    def cancel_unstarted(self):
+        # A greenlet that never ran would start against the next batch, it is cancelled and gives its slot back.
+        current = gevent.getcurrent()
+        for n in self.unfinished_threads():
+            if n in self._unstarted:
+                continue
+            handle = self.thread_list[n]
+            greenlet = handle.thread if self.return_future else handle
+            if greenlet is None or greenlet.gr_frame is not None or greenlet.dead or greenlet is current:
+                continue
+            if not self.compact:
+                greenlet.kill(block=False)
+            self.main_semaphore.release()
+            self.sub_semaphore.release()
+            timer = self._timers.pop(n, None)
+            if timer is not None:
+                timer.close()
+            if self.return_future:
+                handle.set_cancelled()
 
     def refresh(self):
-        self.thread_list = []
+        self.cancel_unstarted()
+        self.thread_list = {} if self.streaming else []
         self.valid_for_new_thread = True
-        self.completed_threads = set()
-        self.killed_threads = set()
+        self.completed_threads = self.new_index_set()
+        self.killed_threads = self.new_index_set()
+        self._thread_count = 0
+        self._consumed_count = 0
+        self._metric_marks = {}
+        self._contexts = {}
+        self._timers = {}
+        for flight in self._flights.values():
+            flight.land(False, CancelledError())
+        self._flights = {}
+        self._pending.clear()
+        self._unstarted.clear()
+        self._unstarted = set()
         self._thread_res_queue = Queue()
+        self._ready = deque()
+        self._claims = {}
+        self._delivered = 0
         self.happened_exception = None
 
     @classmethod
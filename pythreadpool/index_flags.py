@@ -0,0 +1,35 @@
+class IndexFlags:
+
+    __slots__ = ('flags', 'count')
+
+    def __init__(self, indexes=()):
+        # One byte per task index instead of a boxed int in a hash table.
+        self.flags = bytearray()
+        self.count = 0
+        self.update(indexes)
+
+    def __contains__(self, n):
+        return 0 <= n < len(self.flags) and self.flags[n] == 1
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return (n for n, flag in enumerate(self.flags) if flag)
+
+    def add(self, n):
+        flags = self.flags
+        if n >= len(flags):
+            flags.extend(bytes(max(n + 1 - len(flags), len(flags), 64)))
+        if not flags[n]:
+            flags[n] = 1
+            self.count += 1
+
+    def discard(self, n):
+        if n in self:
+            self.flags[n] = 0
+            self.count -= 1
+
+    def update(self, indexes):
+        for n in indexes:
+            self.add(n)
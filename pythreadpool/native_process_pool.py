@@ -0,0 +1,133 @@
+import multiprocessing
+import threading
+import traceback
+
+try:
+    from .native_thread_pool import NativeThreadPool, WorkerGroup
+except ImportError:
+    from native_thread_pool import NativeThreadPool, WorkerGroup
+
+
+class RemoteTraceback(Exception):
+
+    def __init__(self, tb):
+        self.tb = tb
+
+    def __str__(self):
+        return self.tb
+
+
+def run_process_worker(conn):
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        func, args, kwargs = task
+        try:
+            res = (True, func(*args, **kwargs), None)
+        except Exception as e:
+            res = (False, e, traceback.format_exc())
+        try:
+            conn.send(res)
+        except Exception as e:
+            conn.send((False, RuntimeError(f'Result of {func!r} can not be sent back: {e!r}'), None))
+
+
+class ProcessWorkerGroup(WorkerGroup):
+
+    __slots__ = ('context', 'processes', 'terminated')
+
+    def __init__(self, worker_number, context='spawn'):
+        # Each worker thread starts its process while the others run, a forked child could inherit a lock one of them holds.
+        self.context = multiprocessing.get_context(context)
+        self.processes = {}
+        self.terminated = set()
+        WorkerGroup.__init__(self, worker_number)
+
+    def work(self):
+        self.start_process(threading.current_thread())
+        try:
+            WorkerGroup.work(self)
+        finally:
+            process_and_conn = self.processes.pop(threading.current_thread(), None)
+            if process_and_conn is not None:
+                process, conn = process_and_conn
+                try:
+                    conn.send(None)
+                except OSError:
+                    pass
+                conn.close()
+                process.join()
+
+    def start_process(self, worker):
+        parent_conn, child_conn = self.context.Pipe()
+        process = self.context.Process(target=run_process_worker, args=(child_conn,), daemon=True)
+        process.start()
+        child_conn.close()
+        with self.lock:
+            self.processes[worker] = (process, parent_conn)
+        return process, parent_conn
+
+    def restart_process(self, worker, process, conn):
+        conn.close()
+        process.join()
+        with self.lock:
+            self.terminated.discard(worker)
+        return self.start_process(worker)
+
+    def run_in_process(self, func, args, kwargs):
+        worker = threading.current_thread()
+        process, conn = self.processes[worker]
+        if worker in self.terminated:
+            # Stopped only after its last task had already answered, this task gets a fresh process.
+            process, conn = self.restart_process(worker, process, conn)
+        conn.send((func, args, kwargs))
+        try:
+            success, res, tb = conn.recv()
+        except (EOFError, OSError):
+            stopped = worker in self.terminated
+            self.restart_process(worker, process, conn)
+            # Only a stopped task unwinds its worker, a process that died on its own fails the task.
+            if stopped:
+                raise SystemExit
+            raise RuntimeError(f'Worker process {process.pid} exited with code {process.exitcode}')
+        if not success:
+            if tb is not None:
+                res.__cause__ = RemoteTraceback(tb)
+            raise res
+        return res
+
+    def kill(self, task, interrupt=True):
+        with self.lock:
+            if task.finished:
+                return False
+            if task.worker is None:
+                task.cancelled = True
+                return True
+            self.terminated.add(task.worker)
+            self.processes[task.worker][0].terminate()
+            return False
+
+
+class NativeProcessPool(NativeThreadPool):
+
+    __slots__ = ()
+
+    def __init__(self, **kwargs):
+        kwargs['persistent_workers'] = True
+        owned = kwargs.get('worker_group') is None
+        if owned:
+            if kwargs.get('capacity') is not None:
+                worker_number = kwargs['capacity'].root().capacity
+            else:
+                worker_number = kwargs['total_thread_number'] if 'total_thread_number' in kwargs else kwargs['max_thread']
+            kwargs['worker_group'] = ProcessWorkerGroup(worker_number, kwargs.get('mp_context', 'spawn'))
+        NativeThreadPool.__init__(self, **kwargs)
+        if owned:
+            self.own_workers()
+
+    def start_thread(self, thread_number, func, args, kwargs):
+        NativeThreadPool.start_thread(self, thread_number, self._worker_group.run_in_process, (func, args, kwargs), {})
@@ -1,17 +1,54 @@
+import contextvars
 import ctypes
 import logging
 import os
 import queue
 from queue import Queue
-import traceback
+import time
 import threading
+import weakref
+from collections import deque
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, FIRST_EXCEPTION, CancelledError
 from threading import BoundedSemaphore
 
+try:
+    from .adaptive_limit import AdaptiveLimiter
+    from .admission import AdmissionSemaphore, DeadlineExceeded
+    from .batching import Batcher
+    from .capacity_tree import NoopSemaphore
+    from .error_log import ErrorLog, LazyTraceback, drop_frames
+    from .pool_metrics import PoolMetrics
+    from .result_channel import ResultChannel, retain
+    from .single_flight import SingleFlight
+    from .timer import shared_timer
+except ImportError:
+    from adaptive_limit import AdaptiveLimiter
+    from admission import AdmissionSemaphore, DeadlineExceeded
+    from batching import Batcher
+    from capacity_tree import NoopSemaphore
+    from error_log import ErrorLog, LazyTraceback, drop_frames
+    from pool_metrics import PoolMetrics
+    from result_channel import ResultChannel, retain
+    from single_flight import SingleFlight
+    from timer import shared_timer
+
 
 class ThreadTimeout(Exception):
     pass
 
 
+class PoolFull(Exception):
+    pass
+
+
+class ResultTimeout(ThreadTimeout):
+
+    def __init__(self, message, results=None, unfinished=None):
+        ThreadTimeout.__init__(self, message)
+        self.results = results
+        self.unfinished = unfinished if unfinished is not None else set()
+
+
 class ThreadWithException(threading.Thread):
 
     def __init__(self, *args, **kwargs):
@@ -30,38 +67,317 @@ class ThreadWithException(threading.Thread):
             raise SystemError('PyThreadState_SetAsyncExc failed')
 
 
+_task_local = threading.local()
+
+
+def current_cancel_token():
+    return getattr(_task_local, 'cancel_token', None)
+
+
+class CancelToken:
+
+    __slots__ = ('_event',)
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    def cancelled(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        return self._event.wait(timeout)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise CancelledError()
+
+
+class TaskFuture:
+
+    __slots__ = ('pool', 'thread_number', 'thread', '_event', '_success', '_result', '_cancelled', '_consumed', '_item')
+
+    def __init__(self, pool, thread_number, thread, event):
+        self.pool = pool
+        self.thread_number = thread_number
+        self.thread = thread
+        self._event = event
+        self._success = None
+        self._result = None
+        self._cancelled = False
+        self._consumed = False
+        self._item = None
+
+    def set_result(self, success, res, item=None):
+        self._success = success
+        self._result = res
+        self._item = item
+        self._event.set()
+
+    def set_cancelled(self):
+        self._cancelled = True
+        self._event.set()
+
+    def done(self):
+        return self._event.is_set()
+
+    def cancelled(self):
+        return self._cancelled
+
+    def kill(self):
+        self.thread.kill()
+
+    def cancel(self):
+        if self._event.is_set():
+            return self._cancelled
+        self.pool.stop_nth_thread(self.thread_number)
+        self.set_cancelled()
+        return True
+
+    def _wait(self, timeout):
+        scheduler = getattr(self.pool, 'scheduler', None)
+        if scheduler is not None and scheduler.is_worker():
+            if not scheduler.help_until(self._event.is_set, timeout):
+                raise ThreadTimeout(f'Thread timeout after {timeout} seconds')
+        elif not self._event.wait(timeout):
+            raise ThreadTimeout(f'Thread timeout after {timeout} seconds')
+        if self._cancelled:
+            raise CancelledError()
+        if not self._consumed:
+            self._consumed = True
+            self.pool.consume_thread(self.thread_number, self._item)
+            self._item = None
+
+    def result(self, timeout=None):
+        self._wait(timeout)
+        if not self._success:
+            raise self._result
+        return self._result
+
+    def exception(self, timeout=None):
+        self._wait(timeout)
+        return None if self._success else self._result
+
+
+class WorkerTask:
+
+    __slots__ = ('pool', 'thread_number', 'func', 'args', 'kwargs', 'worker', 'cancelled', 'finished')
+
+    def __init__(self, pool, thread_number, func, args, kwargs):
+        self.pool = pool
+        self.thread_number = thread_number
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.worker = None
+        self.cancelled = False
+        self.finished = False
+
+    def kill(self):
+        self.pool.stop_nth_thread(self.thread_number)
+
+    def is_alive(self):
+        return not self.finished
+
+
+class WorkerGroup:
+
+    __slots__ = ('task_queue', 'lock', 'workers', 'detached')
+
+    def __init__(self, worker_number):
+        self.task_queue = Queue()
+        self.lock = threading.Lock()
+        self.workers = []
+        self.detached = set()
+        for _ in range(worker_number):
+            self.add_worker()
+
+    def add_worker(self):
+        worker = ThreadWithException(target=self.work, daemon=True)
+        self.workers.append(worker)
+        worker.start()
+
+    def submit(self, task):
+        self.task_queue.put(task)
+
+    def work(self):
+        worker = threading.current_thread()
+        task_queue = self.task_queue
+        lock = self.lock
+        detached = self.detached
+        while True:
+            # Not even the last task may keep its pool alive while this worker waits for the next one.
+            task = None
+            if worker in detached:
+                with lock:
+                    detached.discard(worker)
+                return
+            try:
+                task = task_queue.get()
+                if task is None:
+                    return
+                self.run_task(task, worker)
+            except SystemExit:
+                # A stopped task unwinds here, the worker itself stays alive for the next task.
+                continue
+
+    def run_task(self, task, worker):
+        lock = self.lock
+        with lock:
+            if task.cancelled:
+                task.finished = True
+                return
+            task.worker = worker
+        try:
+            task.pool.start_thread(task.thread_number, task.func, task.args, task.kwargs)
+        finally:
+            with lock:
+                task.worker = None
+                task.finished = True
+            task.func = task.args = task.kwargs = None
+
+    def cancel(self, task):
+        with self.lock:
+            if task.finished or task.worker is not None:
+                return False
+            task.cancelled = True
+            return True
+
+    def kill(self, task, interrupt=True):
+        with self.lock:
+            if task.finished:
+                return False
+            if task.worker is None:
+                task.cancelled = True
+                return True
+            worker = task.worker
+            if worker in self.workers:
+                # The task may never give the thread back, so it leaves the group once the task returns.
+                self.workers.remove(worker)
+                self.detached.add(worker)
+                self.add_worker()
+            if interrupt:
+                worker.kill()
+            return False
+
+    def shutdown(self):
+        for _ in range(len(self.workers)):
+            self.task_queue.put(None)
+        self.workers = []
+
+
 class NativeThreadPool:
 
     __slots__ = ('max_thread', 'main_semaphore', 'sub_semaphore', 'exit_for_any_exception',
                  '_thread_res_queue', 'valid_for_new_thread', 'log_exception', 'thread_list',
                  'completed_threads', 'killed_threads', 'raise_exception', 'happened_exception',
-                 'inherit_locals', 'context_key', '_context')
+                 'inherit_locals', 'context_key', '_context', 'persistent_workers', '_worker_group',
+                 'streaming', '_thread_count', '_consumed_count', 'metrics', '_metric_marks',
+                 'return_future', 'capacity', 'cancel_tokens', '_cancel_tokens', '_slot_lock',
+                 'error_log', 'drop_traceback', 'scheduler', 'admission', 'timer', '_timers',
+                 'limiter', 'rate_limiter', 'single_flight', '_flights', '_unstarted',
+                 'batchers', 'max_pending', '_pending', '_dispatcher', '_ready',
+                 'inherit_context', '_contexts', '_worker_owner', '_claims', '_delivered', '__weakref__')
 
     def __init__(self, **kwargs):
-        assert 'total_thread_number' in kwargs or ('semaphore' in kwargs and 'max_thread' in kwargs)
-        if 'total_thread_number' in kwargs:
+        assert 'total_thread_number' in kwargs or ('semaphore' in kwargs and 'max_thread' in kwargs) or 'capacity' in kwargs \
+            or 'scheduler' in kwargs or isinstance(kwargs.get('limiter'), AdaptiveLimiter)
+        self.capacity = kwargs.get('capacity')
+        self.scheduler = kwargs.get('scheduler')
+        self.admission = kwargs.get('admission', False)
+        self.limiter = kwargs.get('limiter')
+        if self.limiter is True:
+            # Starts at the configured size and only backs off once the backend pushes back.
+            self.limiter = AdaptiveLimiter(kwargs['total_thread_number'], initial_limit=kwargs['total_thread_number'])
+        assert self.limiter is None or not (self.admission or self.capacity is not None or self.scheduler is not None)
+        assert not self.admission or (self.capacity is None and self.scheduler is None)
+        semaphore_type = AdmissionSemaphore if self.admission else BoundedSemaphore
+        if self.scheduler is not None:
+            # Tasks queue up in the scheduler instead, a submission from a worker must never block on a slot.
+            self.max_thread = kwargs.get('max_thread') or len(self.scheduler.workers)
+            self.main_semaphore = NoopSemaphore()
+            self.sub_semaphore = NoopSemaphore()
+        elif self.capacity is not None:
+            self.max_thread = self.capacity.capacity
+            self.main_semaphore = self.capacity
+            self.sub_semaphore = NoopSemaphore()
+        elif self.limiter is not None and 'semaphore' not in kwargs:
+            self.max_thread = self.limiter.max_limit
+            self.main_semaphore = self.limiter
+            self.sub_semaphore = NoopSemaphore()
+        elif 'total_thread_number' in kwargs:
             self.max_thread = kwargs['total_thread_number']
-            self.main_semaphore = BoundedSemaphore(self.max_thread)
-            self.sub_semaphore = BoundedSemaphore(self.max_thread)
+            self.main_semaphore = semaphore_type(self.max_thread)
+            self.sub_semaphore = semaphore_type(self.max_thread)
         else:
             self.max_thread = kwargs['max_thread']
             self.main_semaphore = kwargs['semaphore']
-            self.sub_semaphore = BoundedSemaphore(self.max_thread)
+            self.sub_semaphore = semaphore_type(self.max_thread)
         self.inherit_locals = kwargs.get('inherit_locals', False)
         if self.inherit_locals:
             self.context_key = kwargs.get('context_key', 'context')
             self._context = threading.current_thread().__dict__.get(self.context_key, dict())
+        self.inherit_context = kwargs.get('inherit_context', False)
+        self._contexts = {}
+        self.persistent_workers = kwargs.get('persistent_workers', False) or self.scheduler is not None
+        if self.scheduler is not None:
+            self._worker_group = self.scheduler
+        elif self.persistent_workers:
+            self._worker_group = kwargs.get('worker_group')
+            if self._worker_group is None:
+                self._worker_group = WorkerGroup(self.capacity.root().capacity if self.capacity is not None else self.max_thread)
+                self.own_workers()
+        # Shared pools keep the pool owning their workers alive, so the workers outlive every pool using them.
+        self._worker_owner = kwargs.get('worker_owner')
         self.exit_for_any_exception = kwargs.get("exit_for_any_exception", False)
         self.raise_exception = kwargs.get("raise_exception", False)
         self.valid_for_new_thread = True
-        self._thread_res_queue = Queue()
+        self._thread_res_queue = ResultChannel()
         self.happened_exception = None
         self.log_exception = kwargs.get('log_exception', True)
         if self.raise_exception:
             self.log_exception = True
-        self.thread_list = []
+        self.streaming = kwargs.get('streaming', False)
+        self.thread_list = {} if self.streaming else []
         self.completed_threads = set()
         self.killed_threads = set()
+        self._thread_count = 0
+        self._consumed_count = 0
+        self.metrics = kwargs.get('metrics')
+        if self.metrics is True:
+            self.metrics = PoolMetrics()
+        if self.metrics is not None and self.limiter is not None:
+            self.metrics.add_gauge('concurrency_limit', self.limiter.current_limit)
+        self._metric_marks = {}
+        self.return_future = kwargs.get('return_future', False)
+        self.cancel_tokens = kwargs.get('cancel_tokens', False)
+        self._cancel_tokens = {}
+        self._slot_lock = threading.Lock()
+        self.error_log = kwargs.get('error_log')
+        if self.error_log is True:
+            self.error_log = ErrorLog()
+        self.drop_traceback = kwargs.get('drop_traceback', False)
+        self.timer = kwargs.get('timer')
+        self._timers = {}
+        self.rate_limiter = kwargs.get('rate_limiter')
+        self.single_flight = kwargs.get('single_flight')
+        if self.single_flight is True:
+            self.single_flight = SingleFlight()
+        if self.metrics is not None and self.single_flight is not None:
+            self.metrics.add_gauge('single_flight', self.single_flight.snapshot)
+        self._flights = {}
+        self._unstarted = set()
+        self.batchers = kwargs.get('batchers')
+        if self.batchers is None:
+            self.batchers = {}
+        self.max_pending = kwargs.get('max_pending')
+        self._pending = deque()
+        self._dispatcher = None
+        self._ready = deque()
+        self._claims = {}
+        self._delivered = 0
 
     def start_thread(self, thread_number, func, args, kwargs):
         success = True
@@ -69,87 +385,657 @@ class NativeThreadPool:
         main_semaphore = self.main_semaphore
         sub_semaphore = self.sub_semaphore
         thread_res_queue = self._thread_res_queue
+        claims = self._claims
         completed_threads = self.completed_threads
         killed_threads = self.killed_threads
+        thread_list = self.thread_list
+        slot_lock = self._slot_lock
+        timers = self._timers
+        flights = self._flights
+        limiter = self.limiter
+        if limiter is not None:
+            limiter_started_at = time.perf_counter()
+        metrics = self.metrics
+        if metrics is not None:
+            metric_marks = self._metric_marks
+            name, submitted_at = metric_marks[thread_number]
+            started_at = time.perf_counter()
+            metrics.on_start(name, started_at - submitted_at)
+        if self.cancel_tokens:
+            _task_local.cancel_token = self._cancel_tokens.get(thread_number)
+        context = self._contexts.pop(thread_number, None) if self.inherit_context else None
         try:
             if self.inherit_locals:
                 threading.current_thread().__dict__[self.context_key] = self._context
-            res = func(*args, **kwargs)
+            res = func(*args, **kwargs) if context is None else context.run(func, *args, **kwargs)
         except Exception as e:
-            self.happened_exception = e
             res = e
-            err_msg = traceback.format_exc()
-            if self.log_exception:
-                logging.error(f"Thread {thread_number} failed, error msg: \n{err_msg}")
-            if self.exit_for_any_exception:
-                os._exit(-1)
             success = False
-        finally:
-            main_semaphore.release()
-            sub_semaphore.release()
-            completed_threads.add(thread_number)
             if thread_number not in killed_threads:
-                thread_res_queue.put((thread_number, success, res))
+                self.happened_exception = e
+                if self.log_exception:
+                    self.report_exception(func, e, "Thread %s failed", thread_number)
+                if self.exit_for_any_exception:
+                    os._exit(-1)
+            if self.drop_traceback:
+                drop_frames(e)
+        finally:
+            with slot_lock:
+                killed = thread_number in killed_threads
+                if self.streaming:
+                    thread = thread_list.pop(thread_number, None)
+                    if killed:
+                        killed_threads.discard(thread_number)
+                    settled = killed or thread is None
+                else:
+                    thread = thread_list[thread_number]
+                    settled = thread_number in completed_threads
+                    completed_threads.add(thread_number)
+                # A stopped or expired task already gave its slot back.
+                if not settled:
+                    if limiter is not None:
+                        limiter.record(time.perf_counter() - limiter_started_at, success)
+                    main_semaphore.release()
+                    sub_semaphore.release()
+            if timers:
+                timer = timers.pop(thread_number, None)
+                if timer is not None:
+                    timer.cancel()
+            if flights:
+                flight = flights.pop(thread_number, None)
+                if flight is not None:
+                    flight.land(success, res)
+            if self.cancel_tokens:
+                _task_local.cancel_token = None
+                self._cancel_tokens.pop(thread_number, None)
+            if metrics is not None:
+                finished_at = time.perf_counter()
+                metrics.on_finish(name, finished_at - started_at, success)
+                if settled:
+                    metric_marks.pop(thread_number, None)
+                else:
+                    metric_marks[thread_number] = (name, finished_at)
+            if not settled:
+                item = (thread_number, success, res)
+                if self.return_future and thread is not None:
+                    claims[id(item)] = item
+                thread_res_queue.put(item)
+            if self.return_future and thread is not None:
+                if killed:
+                    thread.set_cancelled()
+                elif not settled:
+                    thread.set_result(success, res, item)
+
+    def drop_thread(self, thread_number, thread):
+        if self.streaming:
+            with self._slot_lock:
+                self.thread_list.pop(thread_number, None)
+                self.killed_threads.discard(thread_number)
+        if self.cancel_tokens:
+            self._cancel_tokens.pop(thread_number, None)
+        if self.metrics is not None:
+            self.record_killed(thread_number)
+        if self.return_future:
+            thread.set_cancelled()
 
-    def apply_async(self, func, args=None, kwargs=None, daemon=True):
+    def try_apply_async(self, func, args=None, kwargs=None, **options):
+        try:
+            return self.apply_async(func, args, kwargs, submit_timeout=0, **options)
+        except PoolFull:
+            # Not None, which is what an accepted submission without a thread of its own returns when futures are off.
+            return False
+
+    def apply_async(self, func, args=None, kwargs=None, daemon=True, priority=0, deadline=None, timeout=None, rate_key=None,
+                    submit_timeout=None):
         assert self.valid_for_new_thread
         if self.raise_exception and self.happened_exception is not None:
             raise self.happened_exception
-        self.main_semaphore.acquire()
-        self.sub_semaphore.acquire()
+        flight = None
+        batch = None
+        batcher = self.batchers.get(func) if self.batchers else None
+        if batcher is not None and args is not None and len(args) == 1 and not kwargs:
+            leading, flight = batcher.join(args[0])
+            if not leading:
+                return self.follow_flight(flight, func)
+            batch = flight
+        elif self.single_flight is not None:
+            flight_key = self.single_flight.key_of(func, args, kwargs)
+            if flight_key is not None:
+                leading, flight = self.single_flight.join(flight_key)
+                if not leading:
+                    return self.follow_flight(flight, func)
+        metrics = self.metrics
+        if metrics is not None:
+            wait_started_at = time.perf_counter()
+        pending = False
+        throttled = False
+        if self.rate_limiter is not None and submit_timeout is not None:
+            submit_timeout_at = time.monotonic() + submit_timeout
+        if deadline is not None and deadline <= time.monotonic():
+            admitted = False
+        elif self.max_pending is not None:
+            admitted = True
+            # Queued submissions keep their order, a newcomer never takes tokens or a slot ahead of them.
+            # One that finds no tokens waits for them in the queue, the dispatcher takes them once it is the head.
+            throttled = self.rate_limiter is not None and (
+                bool(self._pending) or not self.rate_limiter.acquire(rate_key, deadline, 0))
+            pending = throttled or bool(self._pending) or not self.acquire_slot(False, None, priority, deadline)
+            if pending and len(self._pending) >= self.max_pending:
+                self.reject_full(flight)
+        # Tokens are taken before a slot so a throttled submission does not hold capacity while it waits.
+        elif self.rate_limiter is not None and not self.rate_limiter.acquire(rate_key, deadline, submit_timeout):
+            # Refused because the wait would outlast the submit timeout rather than the deadline.
+            if submit_timeout is not None and (deadline is None or time.monotonic() + submit_timeout < deadline):
+                self.reject_full(flight)
+            admitted = False
+        else:
+            if self.rate_limiter is not None and submit_timeout is not None:
+                submit_timeout = max(submit_timeout_at - time.monotonic(), 0)
+            admitted = self.acquire_slot(submit_timeout is None or submit_timeout > 0, submit_timeout, priority, deadline)
+            if not admitted and (deadline is None or deadline > time.monotonic()):
+                self.reject_full(flight)
         if args is None:
             args = tuple()
         if kwargs is None:
             kwargs = dict()
-        thread = ThreadWithException(target=self.start_thread, args=(len(self.thread_list), func, args, kwargs), daemon=daemon)
-        self.thread_list.append(thread)
-        thread.start()
-        return thread
-
-    def new_shared_pool(self, max_thread=0, exit_for_any_exception=False):
-        return NativeThreadPool(semaphore=self.main_semaphore, exit_for_any_exception=exit_for_any_exception,
-                                max_thread=max_thread if max_thread > 0 else self.max_thread)
-
-    def get_results_order_by_index(self, raise_exception=False, with_status=False, stop_all_for_exception=False, with_index=False):
-        self.valid_for_new_thread = False
-        threads_result = [('', '')] * len(self.thread_list) if with_status else [''] * len(self.thread_list)
-        for index in range(len(self.thread_list) - len(self.killed_threads)):
-            thread_number, success, res = self._thread_res_queue.get()
-            should_break = False
+        if self.streaming:
+            thread_number = self._thread_count
+            self._thread_count += 1
+        else:
+            thread_number = len(self.thread_list)
+        if metrics is not None:
+            name = PoolMetrics.name_of(func)
+            submitted_at = time.perf_counter()
+            metrics.on_submit(name, submitted_at - wait_started_at)
+            self._metric_marks[thread_number] = (name, submitted_at)
+        if not admitted:
+            exception = DeadlineExceeded(f'Thread {thread_number} missed its deadline before admission')
+            if flight is not None:
+                flight.land(False, exception)
+            return self.reject_thread(thread_number, exception)
+        if flight is not None:
+            self._flights[thread_number] = flight
+        if batch is not None:
+            # The first call of a batch carries it, its own result is the first one the batch function returns.
+            func, args, kwargs = batch.run, (), {}
+        if self.inherit_context:
+            # A context copy shares its variables with the submitter's until either side sets one, so this is O(1).
+            self._contexts[thread_number] = contextvars.copy_context()
+        if self.cancel_tokens:
+            self._cancel_tokens[thread_number] = CancelToken()
+        if self.persistent_workers:
+            thread = WorkerTask(self, thread_number, func, args, kwargs)
+        else:
+            thread = ThreadWithException(target=self.start_thread, args=(thread_number, func, args, kwargs), daemon=daemon)
+        handle = TaskFuture(self, thread_number, thread, threading.Event()) if self.return_future else thread
+        if self.streaming:
+            self.thread_list[thread_number] = handle
+        else:
+            self.thread_list.append(handle)
+        if pending:
+            self.enqueue_pending((self._unstarted, thread_number, handle, thread, func, timeout, priority, deadline, rate_key,
+                                 throttled))
+        else:
+            self.launch(thread_number, handle, thread, func, timeout)
+        return handle
 
-            if thread_number in self.killed_threads:
+    def acquire_slot(self, blocking, timeout, priority, deadline):
+        admission = dict(priority=priority, deadline=deadline) if self.admission else {}
+        if timeout is not None:
+            timeout_at = time.monotonic() + timeout
+        if not self.main_semaphore.acquire(blocking, timeout if blocking else None, **admission):
+            return False
+        if timeout is not None:
+            timeout = max(timeout_at - time.monotonic(), 0)
+        if not self.sub_semaphore.acquire(blocking, timeout if blocking else None, **admission):
+            self.main_semaphore.release()
+            return False
+        return True
+
+    def reject_full(self, flight):
+        exception = PoolFull('No free slot for the submission')
+        if flight is not None:
+            flight.land(False, exception)
+        raise exception
+
+    def launch(self, thread_number, handle, thread, func, timeout):
+        if timeout is not None:
+            self._timers[thread_number] = (self.timer or shared_timer()).call_later(
+                timeout, self.expire_thread, thread_number, handle, func, timeout)
+        if self.persistent_workers:
+            self._worker_group.submit(thread)
+        else:
+            thread.start()
+
+    def enqueue_pending(self, item):
+        with self._slot_lock:
+            item[0].add(item[1])
+            self._pending.append(item)
+            if self._dispatcher is None:
+                self._dispatcher = self.new_thread(self.dispatch_pending)
+
+    def dispatch_pending(self):
+        pending = self._pending
+        while True:
+            with self._slot_lock:
+                if not pending:
+                    self._dispatcher = None
+                    return
+                # The head stays queued while it waits so it still counts against max_pending.
+                item = pending[0]
+                unstarted, thread_number, handle, thread, func, timeout, priority, deadline, rate_key, throttled = item
+                if thread_number not in unstarted:
+                    pending.popleft()
+                    continue
+            admitted = (not throttled or self.rate_limiter.acquire(rate_key, deadline)) \
+                and self.acquire_slot(True, None, priority, deadline)
+            with self._slot_lock:
+                if pending and pending[0] is item:
+                    pending.popleft()
+            if not admitted:
+                exception = DeadlineExceeded(f'Thread {thread_number} missed its deadline before admission')
+                self.land_flight(thread_number, False, exception)
+                self.finish_unstarted(unstarted, thread_number, handle if self.return_future else None, False, exception)
                 continue
+            with self._slot_lock:
+                started = thread_number in unstarted
+                unstarted.discard(thread_number)
+            if started:
+                self.launch(thread_number, handle, thread, func, timeout)
+            else:
+                self.main_semaphore.release()
+                self.sub_semaphore.release()
 
-            if not success:
-                if stop_all_for_exception:
-                    should_break = True
-                    self.stop_all()
-                if raise_exception:
-                    self.refresh()
-                    raise res
+    def expire_thread(self, thread_number, thread, func, timeout):
+        with self._slot_lock:
+            if self.streaming:
+                if self.thread_list.get(thread_number) is not thread or thread_number in self.killed_threads:
+                    return
+                del self.thread_list[thread_number]
+            else:
+                if thread_number >= len(self.thread_list) or self.thread_list[thread_number] is not thread \
+                        or thread_number in self.completed_threads:
+                    return
+                self.completed_threads.add(thread_number)
+            if self.limiter is not None:
+                self.limiter.record(timeout, False)
+            self.main_semaphore.release()
+            self.sub_semaphore.release()
+            thread_res_queue = self._thread_res_queue
+            claims = self._claims
+            self._timers.pop(thread_number, None)
+        exception = ThreadTimeout(f'Thread {thread_number} timeout after {timeout} seconds')
+        self.happened_exception = exception
+        if self.log_exception:
+            self.report_exception(func, exception, "Thread %s failed", thread_number)
+        self.land_flight(thread_number, False, exception)
+        token = self._cancel_tokens.get(thread_number) if self.cancel_tokens else None
+        if token is not None:
+            token.cancel()
+        if self.persistent_workers:
+            if self._worker_group.kill(thread.thread if self.return_future else thread, token is None) and token is not None:
+                self._cancel_tokens.pop(thread_number, None)
+        elif token is None:
+            thread.kill()
+        item = (thread_number, False, exception)
+        if self.return_future:
+            claims[id(item)] = item
+        thread_res_queue.put(item)
+        if self.return_future:
+            thread.set_result(False, exception, item)
+        if self.scheduler is not None:
+            self.scheduler.wake_helpers()
 
-            if with_index:
-                threads_result[thread_number] = (thread_number, success, res) if with_status else (thread_number, res)
+    def follow_flight(self, flight, func):
+        if self.streaming:
+            thread_number = self._thread_count
+            self._thread_count += 1
+        else:
+            thread_number = len(self.thread_list)
+        if self.metrics is not None:
+            name = PoolMetrics.name_of(func)
+            self.metrics.on_submit(name, 0.0)
+            self._metric_marks[thread_number] = (name, time.perf_counter())
+        handle = TaskFuture(self, thread_number, None, threading.Event()) if self.return_future else None
+        self._unstarted.add(thread_number)
+        if self.streaming:
+            self.thread_list[thread_number] = handle
+        else:
+            self.thread_list.append(handle)
+        # A cached result is delivered right here, otherwise whoever finishes the leading call delivers it.
+        flight.follow(self.finish_unstarted, self._unstarted, thread_number, handle)
+        return handle
+
+    def finish_unstarted(self, unstarted, thread_number, handle, success, res):
+        with self._slot_lock:
+            if thread_number not in unstarted:
+                return
+            unstarted.discard(thread_number)
+            if self.streaming:
+                self.thread_list.pop(thread_number, None)
             else:
-                threads_result[thread_number] = (success, res) if with_status else res
+                self.completed_threads.add(thread_number)
+        if self.metrics is not None:
+            self.metrics.on_finish(self._metric_marks[thread_number][0], 0.0, success)
+        item = (thread_number, success, res)
+        if handle is not None:
+            self._claims[id(item)] = item
+        self._thread_res_queue.put(item)
+        if handle is not None:
+            handle.set_result(success, res, item)
 
-            if should_break:
-                break
+    def stop_unstarted(self, n):
+        self.land_flight(n, False, CancelledError())
+        with self._slot_lock:
+            if n not in self._unstarted:
+                return
+            self._unstarted.discard(n)
+            if self.streaming:
+                thread = self.thread_list.pop(n, None)
+                self._consumed_count += 1
+            else:
+                thread = self.thread_list[n]
+                self.completed_threads.add(n)
+                self.killed_threads.add(n)
+        if self.cancel_tokens:
+            self._cancel_tokens.pop(n, None)
+        if self.metrics is not None:
+            self.record_killed(n)
+        if self.return_future and thread is not None:
+            thread.set_cancelled()
 
+    def land_flight(self, thread_number, success, res):
+        flight = self._flights.pop(thread_number, None)
+        if flight is not None:
+            flight.land(success, res)
+
+    def reject_thread(self, thread_number, exception):
+        handle = TaskFuture(self, thread_number, None, threading.Event()) if self.return_future else None
+        if not self.streaming:
+            self.thread_list.append(handle)
+            self.completed_threads.add(thread_number)
+        if self.metrics is not None:
+            self.metrics.on_finish(self._metric_marks[thread_number][0], 0.0, False)
+        item = (thread_number, False, exception)
+        if handle is not None:
+            self._claims[id(item)] = item
+        self._thread_res_queue.put(item)
+        if handle is not None:
+            handle.set_result(False, exception, item)
+        return handle
+
+    def new_shared_pool(self, max_thread=0, exit_for_any_exception=False, streaming=None):
+        if self.scheduler is not None:
+            shared_capacity = dict(scheduler=self.scheduler, max_thread=max_thread if max_thread > 0 else self.max_thread)
+        elif self.capacity is not None:
+            shared_capacity = dict(capacity=self.capacity.new_child(max_thread))
+        else:
+            shared_capacity = dict(semaphore=self.main_semaphore, max_thread=max_thread if max_thread > 0 else self.max_thread)
+        return self.__class__(exit_for_any_exception=exit_for_any_exception, persistent_workers=self.persistent_workers,
+                              streaming=self.streaming if streaming is None else streaming, metrics=self.metrics, return_future=self.return_future,
+                              cancel_tokens=self.cancel_tokens, error_log=self.error_log, drop_traceback=self.drop_traceback,
+                              admission=self.admission, limiter=self.limiter, rate_limiter=self.rate_limiter,
+                              single_flight=self.single_flight, inherit_context=self.inherit_context,
+                              batchers=self.batchers, max_pending=self.max_pending,
+                              worker_group=self._worker_group if self.persistent_workers else None,
+                              worker_owner=(self._worker_owner or self) if self.persistent_workers else None, **shared_capacity)
+
+    def register_batch(self, func, batch_func, max_batch_size=64, linger=0.005):
+        self.batchers[func] = Batcher(batch_func, max_batch_size, linger)
+
+    def report_exception(self, func, exception, message, *args):
+        if self.error_log is None:
+            logging.error(f"{message}, error msg: \n%s", *args, LazyTraceback(exception, self.drop_traceback))
+        else:
+            self.error_log.report(func, exception, message, *args, detach=self.drop_traceback)
+
+    def start_chunk(self, chunk):
+        chunk_result = []
+        for func, args, kwargs in chunk:
+            try:
+                chunk_result.append((True, func(*args, **kwargs)))
+            except Exception as e:
+                if self.log_exception:
+                    self.report_exception(func, e, "Task in chunk failed")
+                if self.exit_for_any_exception:
+                    os._exit(-1)
+                if self.drop_traceback:
+                    drop_frames(e)
+                chunk_result.append((False, e))
+        return chunk_result
+
+    def apply_many(self, tasks, chunksize=None, raise_exception=False, with_status=False, with_index=False):
+        tasks = [(task[0], task[1] if len(task) > 1 and task[1] is not None else tuple(),
+                  task[2] if len(task) > 2 and task[2] is not None else dict()) for task in tasks]
+        if chunksize is None:
+            chunksize, extra = divmod(len(tasks), self.max_thread * 4)
+            if extra:
+                chunksize += 1
+        chunksize = max(chunksize, 1)
+        pool = self.new_shared_pool(exit_for_any_exception=self.exit_for_any_exception)
+        pool.log_exception = self.log_exception
+        # The calls are fed in by this method, they wait for a slot instead of overflowing the pending queue.
+        pool.max_pending = None
+        for start in range(0, len(tasks), chunksize):
+            pool.apply_async(pool.start_chunk, args=(tasks[start:start + chunksize],))
+        results = []
+        for chunk_result in pool.get_results_order_by_index(raise_exception=True):
+            for success, res in chunk_result:
+                if not success and raise_exception:
+                    raise res
+                if with_index:
+                    results.append((len(results), success, res) if with_status else (len(results), res))
+                else:
+                    results.append((success, res) if with_status else res)
+        return results
+
+    def map(self, func, iterable, chunksize=None, raise_exception=False, with_status=False, with_index=False):
+        return self.apply_many(((func, (item,)) for item in iterable), chunksize=chunksize, raise_exception=raise_exception,
+                               with_status=with_status, with_index=with_index)
+
+    def imap(self, func, iterable, buffer_size=0, raise_exception=False, with_status=False, with_index=False):
+        buffer_size = buffer_size if buffer_size > 0 else self.max_thread * 2
+        pool = self.new_shared_pool(exit_for_any_exception=self.exit_for_any_exception, streaming=True)
+        pool.log_exception = self.log_exception
+        pool.max_pending = None
+        iterator = iter(iterable)
+        exhausted = False
+        submitted = 0
+        next_index = 0
+        reorder_buffer = {}
+        try:
+            while True:
+                # Whatever is running or waiting for an earlier index counts against the buffer, so submission
+                # pauses once the consumer falls behind by buffer_size results.
+                while not exhausted and submitted - next_index < buffer_size:
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pool.apply_async(func, args=(item,))
+                    submitted += 1
+                if next_index == submitted:
+                    return
+                while next_index not in reorder_buffer:
+                    thread_number, success, res = pool.get_one_result(with_status=True, with_index=True)
+                    reorder_buffer[thread_number] = (success, res)
+                success, res = reorder_buffer.pop(next_index)
+                if not success and raise_exception:
+                    raise res
+                if with_index:
+                    yield (next_index, success, res) if with_status else (next_index, res)
+                else:
+                    yield (success, res) if with_status else res
+                next_index += 1
+        finally:
+            if next_index < submitted:
+                pool.stop_all()
+
+    def record_consumed(self, thread_number):
+        mark = self._metric_marks.pop(thread_number, None)
+        if mark is not None:
+            self.metrics.on_consume(mark[0], time.perf_counter() - mark[1])
+
+    def record_killed(self, thread_number):
+        mark = self._metric_marks.pop(thread_number, None)
+        if mark is not None:
+            self.metrics.on_finish(mark[0], 0.0, False)
+
+    def consume_thread(self, thread_number, item=None):
+        # The future and the pool-wide getters race for a result, whoever claims it first delivers it.
+        if item is not None:
+            if self._claims.pop(id(item), None) is None:
+                return
+            self.drop_delivered()
+        if self.streaming:
+            self._consumed_count += 1
+        # A streaming pool only has to skip results still in the queue, a batch counts every consumed index.
+        if item is None or not self.streaming:
+            self.killed_threads.add(thread_number)
+        if self.metrics is not None:
+            self.record_consumed(thread_number)
+
+    def drop_delivered(self):
+        # Queued copies of results their futures delivered are skipped by the getters and dropped in bulk,
+        # so reading a future stays O(1) amortized however far back its result is queued.
+        self._delivered += 1
+        channel = self._thread_res_queue
+        if self._delivered * 2 > channel.qsize() + len(self._ready):
+            self._delivered = 0
+            claims = self._claims
+
+            def keep(item):
+                return id(item) in claims
+
+            channel.retain(keep)
+            retain(self._ready, keep)
+
+    def next_result(self, timeout=None):
+        if not self.return_future:
+            return self.take_result(timeout)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        claims = self._claims
+        while True:
+            item = self.take_result(None if deadline is None else max(deadline - time.monotonic(), 0))
+            if claims.pop(id(item), None) is not None:
+                return item
+
+    def take_result(self, timeout=None):
+        # Results pulled in by wait() are handed out first and in the order they arrived.
+        if self._ready:
+            return self._ready.popleft()
+        return self.receive_result(timeout)
+
+    def receive_result(self, timeout=None):
+        scheduler = self.scheduler
+        if scheduler is not None and scheduler.is_worker():
+            # Waiting inside a worker runs pending tasks instead of parking the thread.
+            if not scheduler.help_until(self._thread_res_queue.qsize, timeout):
+                raise queue.Empty
+        return self._thread_res_queue.get(timeout=timeout)
+
+    def next_result_until(self, deadline):
+        if deadline is None:
+            return self.next_result()
+        try:
+            return self.next_result(max(deadline - time.monotonic(), 0))
+        except queue.Empty:
+            return None
+
+    def unfinished_threads(self):
+        if self.streaming:
+            return {n for n in self.thread_list if n not in self.killed_threads}
+        return {n for n in range(len(self.thread_list)) if n not in self.completed_threads}
+
+    def results_timeout(self, timeout):
+        return ResultTimeout(f'Results timeout after {timeout} seconds', unfinished=self.unfinished_threads())
+
+    def iter_thread_results(self, timeout=None):
+        killed_threads = self.killed_threads
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if self.streaming:
+            while self._thread_count > self._consumed_count:
+                item = self.next_result_until(deadline)
+                if item is None:
+                    raise self.results_timeout(timeout)
+                if item[0] in killed_threads:
+                    killed_threads.discard(item[0])
+                    continue
+                self._consumed_count += 1
+                if self.metrics is not None:
+                    self.record_consumed(item[0])
+                yield item
+        else:
+            remaining = len(self.thread_list) - len(killed_threads)
+            received = []
+            while remaining > 0:
+                item = self.next_result_until(deadline)
+                if item is None:
+                    # What was handed out so far counts as consumed, so a later call only waits for the rest.
+                    killed_threads.update(received)
+                    raise self.results_timeout(timeout)
+                if item[0] in killed_threads:
+                    continue
+                remaining -= 1
+                received.append(item[0])
+                if self.metrics is not None:
+                    self.record_consumed(item[0])
+                yield item
+
+    def get_results_order_by_index(self, raise_exception=False, with_status=False, stop_all_for_exception=False, with_index=False,
+                                   timeout=None):
+        if self.streaming:
+            threads_result = {}
+        else:
+            self.valid_for_new_thread = False
+            threads_result = [('', '')] * len(self.thread_list) if with_status else [''] * len(self.thread_list)
+        try:
+            for thread_number, success, res in self.iter_thread_results(timeout):
+                should_break = False
+
+                if thread_number in self.killed_threads:
+                    continue
+
+                if not success:
+                    if stop_all_for_exception:
+                        should_break = True
+                        self.stop_all()
+                    if raise_exception:
+                        if not self.streaming:
+                            self.refresh()
+                        raise res
+
+                if with_index:
+                    threads_result[thread_number] = (thread_number, success, res) if with_status else (thread_number, res)
+                else:
+                    threads_result[thread_number] = (success, res) if with_status else res
+
+                if should_break:
+                    break
+        except ResultTimeout as e:
+            e.results = [threads_result[thread_number] for thread_number in sorted(threads_result)] \
+                if self.streaming else threads_result
+            raise
+
+        if self.streaming:
+            return [threads_result[thread_number] for thread_number in sorted(threads_result)]
         self.refresh()
         return threads_result
 
-    def get_results_order_by_time(self, raise_exception=False, with_status=False, with_index=False, stop_all_for_exception=False):
-        self.valid_for_new_thread = False
-        for index in range(len(self.thread_list) - len(self.killed_threads)):
-            thread_number, success, res = self._thread_res_queue.get()
+    def get_results_order_by_time(self, raise_exception=False, with_status=False, with_index=False, stop_all_for_exception=False,
+                                  timeout=None):
+        if not self.streaming:
+            self.valid_for_new_thread = False
+        for thread_number, success, res in self.iter_thread_results(timeout):
             should_break = False
             if not success:
                 if stop_all_for_exception:
                     should_break = True
                     self.stop_all()
                 if raise_exception:
-                    self.refresh()
+                    if not self.streaming:
+                        self.refresh()
                     raise res
 
             if with_index:
@@ -161,58 +1047,161 @@ class NativeThreadPool:
                 break
 
     def get_one_result(self, raise_exception=False, with_status=False, with_index=False, stop_all_for_exception=False, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
         while True:
-            try:
-                thread_number, success, res = self._thread_res_queue.get(timeout=timeout)
-                if thread_number in self.killed_threads:
-                    continue
+            item = self.next_result_until(deadline)
+            if item is None:
+                raise ResultTimeout(f'Thread timeout after {timeout} seconds', unfinished=self.unfinished_threads())
+            thread_number, success, res = item
+            if thread_number in self.killed_threads:
+                if self.streaming:
+                    self.killed_threads.discard(thread_number)
+                continue
+            if self.streaming:
+                self._consumed_count += 1
+            else:
                 self.killed_threads.add(thread_number)
-                if not success:
-                    if stop_all_for_exception:
-                        self.stop_all()
-                    if raise_exception:
-                        raise res
-                if with_index:
-                    return (thread_number, success, res) if with_status else (thread_number, res)
-                else:
-                    return (success, res) if with_status else res
-            except queue.Empty:
-                raise ThreadTimeout(f'Thread timeout after {timeout} seconds')
+            if self.metrics is not None:
+                self.record_consumed(thread_number)
+            if not success:
+                if stop_all_for_exception:
+                    self.stop_all()
+                if raise_exception:
+                    raise res
+            if with_index:
+                return (thread_number, success, res) if with_status else (thread_number, res)
+            else:
+                return (success, res) if with_status else res
 
-    def wait_all_threads(self, raise_exception=False, stop_all_for_exception=False):
-        for _ in range(len(self.thread_list) - len(self.killed_threads)):
-            thread_number, success, res = self._thread_res_queue.get()
+    def wait_all_threads(self, raise_exception=False, stop_all_for_exception=False, timeout=None):
+        for thread_number, success, res in self.iter_thread_results(timeout):
             should_break = False
             if not success:
                 if stop_all_for_exception:
                     should_break = True
                     self.stop_all()
                 if raise_exception:
-                    self.refresh()
+                    if not self.streaming:
+                        self.refresh()
                     raise res
             if should_break:
                 break
-        self.refresh()
+        if not self.streaming:
+            self.refresh()
+
+    def wait(self, return_when=ALL_COMPLETED, timeout=None):
+        assert return_when in (FIRST_COMPLETED, ALL_COMPLETED, FIRST_EXCEPTION)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ready = self._ready
+        while True:
+            # Finished tasks whose results are still queued are done too, so everything queued is pulled in first.
+            try:
+                while True:
+                    ready.append(self._thread_res_queue.get(timeout=0))
+            except queue.Empty:
+                pass
+            done = {item[0] for item in ready if item[0] not in self.killed_threads
+                    and (not self.return_future or id(item) in self._claims)}
+            not_done = self.unfinished_threads() - done
+            if not not_done or (return_when == FIRST_COMPLETED and done) \
+                    or (return_when == FIRST_EXCEPTION and any(not item[1] for item in ready if item[0] in done)):
+                return done, not_done
+            try:
+                ready.append(self.receive_result(None if deadline is None else max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                return done, not_done
 
     def stop_all(self):
-        for index in range(len(self.thread_list)):
+        for index in (list(self.thread_list) if self.streaming else range(len(self.thread_list))):
             self.stop_nth_thread(index)
 
     def stop_nth_thread(self, n):
-        if n not in self.completed_threads:
-
-            self.completed_threads.add(n)
+        if self.inherit_context:
+            self._contexts.pop(n, None)
+        if n in self._unstarted:
+            return self.stop_unstarted(n)
+        with self._slot_lock:
+            if self.streaming:
+                thread = self.thread_list.get(n)
+                if thread is None or n in self.killed_threads:
+                    return
+                self._consumed_count += 1
+            elif n in self.completed_threads:
+                return
+            else:
+                thread = self.thread_list[n]
+                self.completed_threads.add(n)
             self.killed_threads.add(n)
-            self.thread_list[n].kill()
+            self.main_semaphore.release()
+            self.sub_semaphore.release()
+        self.land_flight(n, False, CancelledError())
+        token = self._cancel_tokens.get(n) if self.cancel_tokens else None
+        if token is not None:
+            token.cancel()
+        if self.persistent_workers:
+            if self._worker_group.kill(thread.thread if self.return_future else thread, token is None):
+                self.drop_thread(n, thread)
+        elif token is None:
+            thread.kill()
+        if self.scheduler is not None:
+            self.scheduler.wake_helpers()
+
+    def cancel_unstarted(self):
+        # A task still queued for a worker would start against the next batch, it is cancelled and gives its slot back.
+        with self._slot_lock:
+            queued = [(n, self.thread_list[n]) for n in self.unfinished_threads() if n not in self._unstarted]
+        for n, handle in queued:
+            if not self._worker_group.cancel(handle.thread if self.return_future else handle):
+                continue
+            self.main_semaphore.release()
+            self.sub_semaphore.release()
+            timer = self._timers.pop(n, None)
+            if timer is not None:
+                timer.cancel()
+            if self.return_future:
+                handle.set_cancelled()
 
     def refresh(self):
-        self.thread_list = []
+        if self.persistent_workers:
+            self.cancel_unstarted()
+        self.thread_list = {} if self.streaming else []
         self.valid_for_new_thread = True
         self.completed_threads = set()
         self.killed_threads = set()
-        self._thread_res_queue = Queue()
+        self._thread_count = 0
+        self._consumed_count = 0
+        self._metric_marks = {}
+        self._cancel_tokens = {}
+        self._contexts = {}
+        self._timers = {}
+        # Calls abandoned by a refresh must not leave their followers waiting forever.
+        for flight in self._flights.values():
+            flight.land(False, CancelledError())
+        self._flights = {}
+        with self._slot_lock:
+            self._pending.clear()
+            self._unstarted.clear()
+        self._unstarted = set()
+        self._thread_res_queue = ResultChannel()
+        self._ready = deque()
+        self._claims = {}
+        self._delivered = 0
         self.happened_exception = None
 
+    def own_workers(self):
+        # A dropped pool takes the worker threads it started with it, even if nobody called shutdown().
+        weakref.finalize(self, self._worker_group.shutdown)
+
+    def shutdown(self):
+        if self.persistent_workers:
+            self._worker_group.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
     @classmethod
     def new_thread(cls, target, args=None, kwargs=None, daemon=True):
         args = args if args is not None else tuple()
@@ -0,0 +1,149 @@
+import threading
+import time
+
+
+class LatencyHistogram:
+
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    BUCKET_NUMBER = 32
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * self.BUCKET_NUMBER
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        # Bucket n holds samples below 2 ** n microseconds.
+        self.buckets[min(int(seconds * 1000000).bit_length(), self.BUCKET_NUMBER - 1)] += 1
+
+    def percentile(self, percent):
+        if self.count == 0:
+            return 0.0
+        rank = self.count * percent / 100
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= rank:
+                return min((1 << index) / 1000000, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'buckets': {f'<{1 << index}us': bucket for index, bucket in enumerate(self.buckets) if bucket},
+        }
+
+
+class FunctionMetrics:
+
+    __slots__ = ('submitted', 'completed', 'failed', 'consumed', 'semaphore_wait', 'queue_wait', 'run_time', 'consume_delay')
+
+    def __init__(self):
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.consumed = 0
+        self.semaphore_wait = LatencyHistogram()
+        self.queue_wait = LatencyHistogram()
+        self.run_time = LatencyHistogram()
+        self.consume_delay = LatencyHistogram()
+
+    def snapshot(self):
+        return {
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'consumed': self.consumed,
+            'in_flight': self.submitted - self.completed,
+            'semaphore_wait': self.semaphore_wait.snapshot(),
+            'queue_wait': self.queue_wait.snapshot(),
+            'run_time': self.run_time.snapshot(),
+            'consume_delay': self.consume_delay.snapshot(),
+        }
+
+
+class PoolMetrics:
+
+    __slots__ = ('lock', 'functions', 'gauges', 'report_callback', 'report_interval', '_reporter', '_closed')
+
+    def __init__(self, report_callback=None, report_interval=60):
+        self.lock = threading.Lock()
+        self.functions = {}
+        self.gauges = {}
+        self.report_callback = report_callback
+        self.report_interval = report_interval
+        self._closed = threading.Event()
+        self._reporter = None
+        if report_callback is not None:
+            self._reporter = threading.Thread(target=self._report_periodically, daemon=True)
+            self._reporter.start()
+
+    @staticmethod
+    def name_of(func):
+        return getattr(func, '__qualname__', None) or repr(func)
+
+    def _function(self, name):
+        metrics = self.functions.get(name)
+        if metrics is None:
+            metrics = self.functions[name] = FunctionMetrics()
+        return metrics
+
+    def add_gauge(self, name, getter):
+        with self.lock:
+            self.gauges[name] = getter
+
+    def on_submit(self, name, semaphore_wait):
+        with self.lock:
+            metrics = self._function(name)
+            metrics.submitted += 1
+            metrics.semaphore_wait.record(semaphore_wait)
+
+    def on_start(self, name, queue_wait):
+        with self.lock:
+            self._function(name).queue_wait.record(queue_wait)
+
+    def on_finish(self, name, run_time, success):
+        with self.lock:
+            metrics = self._function(name)
+            metrics.completed += 1
+            if not success:
+                metrics.failed += 1
+            metrics.run_time.record(run_time)
+
+    def on_consume(self, name, consume_delay):
+        with self.lock:
+            metrics = self._function(name)
+            metrics.consumed += 1
+            metrics.consume_delay.record(consume_delay)
+
+    def snapshot(self):
+        with self.lock:
+            functions = {name: metrics.snapshot() for name, metrics in self.functions.items()}
+            gauges = list(self.gauges.items())
+        return {
+            'timestamp': time.time(),
+            'in_flight': sum(metrics['in_flight'] for metrics in functions.values()),
+            'submitted': sum(metrics['submitted'] for metrics in functions.values()),
+            'failed': sum(metrics['failed'] for metrics in functions.values()),
+            'functions': functions,
+            'gauges': {name: getter() for name, getter in gauges},
+        }
+
+    def close(self):
+        self._closed.set()
+
+    def _report_periodically(self):
+        while not self._closed.wait(self.report_interval):
+            self.report_callback(self.snapshot())
@@ -0,0 +1,80 @@
+import threading
+import time
+
+
+class TokenBucket:
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated_at', 'lock')
+
+    def __init__(self, rate, burst=None):
+        assert rate > 0
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1)
+        self.tokens = float(self.burst)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, tokens=1, max_delay=None):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            delay = (tokens - self.tokens) / self.rate if self.tokens < tokens else 0.0
+            if max_delay is not None and delay > max_delay:
+                return None
+            # Tokens may go negative, later callers then queue up behind this reservation.
+            self.tokens -= tokens
+            return delay
+
+    def refund(self, tokens=1):
+        with self.lock:
+            self.tokens = min(self.burst, self.tokens + tokens)
+
+
+class RateLimiter:
+
+    __slots__ = ('bucket', 'key_rate', 'key_burst', 'buckets', 'lock', 'sleep')
+
+    def __init__(self, rate=None, burst=None, key_rate=None, key_burst=None, sleep=None):
+        self.bucket = TokenBucket(rate, burst) if rate is not None else None
+        self.key_rate = key_rate
+        self.key_burst = key_burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.sleep = sleep
+
+    def set_key_rate(self, key, rate, burst=None):
+        with self.lock:
+            self.buckets[key] = TokenBucket(rate, burst)
+
+    def bucket_of(self, key):
+        if key is None:
+            return None
+        bucket = self.buckets.get(key)
+        if bucket is None and self.key_rate is not None:
+            with self.lock:
+                bucket = self.buckets.get(key)
+                if bucket is None:
+                    bucket = self.buckets[key] = TokenBucket(self.key_rate, self.key_burst)
+        return bucket
+
+    def acquire(self, key=None, deadline=None, timeout=None, sleep=time.sleep):
+        max_delay = None if deadline is None else deadline - time.monotonic()
+        if timeout is not None and (max_delay is None or timeout < max_delay):
+            max_delay = timeout
+        delay = 0.0
+        reserved = []
+        for bucket in (self.bucket_of(key), self.bucket):
+            if bucket is None:
+                continue
+            bucket_delay = bucket.reserve(1, max_delay)
+            if bucket_delay is None:
+                for reserved_bucket in reserved:
+                    reserved_bucket.refund()
+                return False
+            reserved.append(bucket)
+            delay = max(delay, bucket_delay)
+        if delay > 0:
+            # Without a sleep of its own the limiter waits the way its caller does, a gevent pool passes gevent.sleep.
+            (self.sleep or sleep)(delay)
+        return True
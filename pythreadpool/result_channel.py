@@ -0,0 +1,72 @@
+import queue
+import threading
+import time
+from collections import deque
+
+
+def retain(items, keep):
+    kept = []
+    for _ in range(len(items)):
+        try:
+            item = items.popleft()
+        except IndexError:
+            break
+        if keep(item):
+            kept.append(item)
+    # Back at the head in their order, ahead of anything appended meanwhile.
+    items.extendleft(reversed(kept))
+    return kept
+
+
+class ResultChannel:
+
+    __slots__ = ('items', 'condition', 'waiting')
+
+    def __init__(self):
+        self.items = deque()
+        self.condition = threading.Condition(threading.Lock())
+        self.waiting = 0
+
+    def put(self, item):
+        self.items.append(item)
+        # A consumer counts itself as waiting before it looks at the deque again, so either it sees
+        # this item or this put sees the consumer and wakes it up.
+        if self.waiting:
+            with self.condition:
+                self.condition.notify()
+
+    def get(self, timeout=None):
+        items = self.items
+        try:
+            return items.popleft()
+        except IndexError:
+            pass
+        with self.condition:
+            self.waiting += 1
+            try:
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while True:
+                    try:
+                        return items.popleft()
+                    except IndexError:
+                        pass
+                    if deadline is None:
+                        self.condition.wait()
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise queue.Empty
+                        self.condition.wait(remaining)
+            finally:
+                self.waiting -= 1
+
+    def retain(self, keep):
+        if retain(self.items, keep) and self.waiting:
+            with self.condition:
+                self.condition.notify_all()
+
+    def qsize(self):
+        return len(self.items)
+
+    def empty(self):
+        return not self.items
@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class Flight:
+
+    __slots__ = ('key', 'group', 'done', 'success', 'result', 'followers')
+
+    def __init__(self, key, group):
+        self.key = key
+        self.group = group
+        self.done = False
+        self.success = None
+        self.result = None
+        self.followers = []
+
+    def follow(self, callback, *args):
+        with self.group.lock:
+            if not self.done:
+                self.followers.append((callback, args))
+                return
+        callback(*args, self.success, self.result)
+
+    def land(self, success, result):
+        self.group.land(self, success, result)
+
+
+class ResultCache:
+
+    __slots__ = ('max_size', 'ttl', 'entries', 'hits', 'misses')
+
+    def __init__(self, max_size=128, ttl=None):
+        assert max_size > 0
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self.entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, value):
+        self.entries[key] = (value, time.monotonic() + self.ttl if self.ttl is not None else None)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def snapshot(self):
+        return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+class SingleFlight:
+
+    __slots__ = ('lock', 'flights', 'cache', 'coalesced')
+
+    def __init__(self, cache_size=0, ttl=None):
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.cache = ResultCache(cache_size, ttl) if cache_size > 0 else None
+        self.coalesced = 0
+
+    @staticmethod
+    def key_of(func, args, kwargs):
+        key = (func, tuple(args) if args else (), tuple(sorted(kwargs.items())) if kwargs else ())
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def join(self, key):
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return False, flight
+            flight = Flight(key, self)
+            if self.cache is not None:
+                entry = self.cache.get(key)
+                if entry is not None:
+                    flight.done = True
+                    flight.success = True
+                    flight.result = entry[0]
+                    return False, flight
+            self.flights[key] = flight
+            return True, flight
+
+    def land(self, flight, success, result):
+        with self.lock:
+            if flight.done:
+                return
+            if self.flights.get(flight.key) is flight:
+                del self.flights[flight.key]
+            flight.done = True
+            flight.success = success
+            flight.result = result
+            if success and self.cache is not None:
+                self.cache.put(flight.key, result)
+            followers = flight.followers
+            flight.followers = None
+        for callback, args in followers:
+            callback(*args, success, result)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'in_flight': len(self.flights),
+                'coalesced': self.coalesced,
+                'cache': self.cache.snapshot() if self.cache is not None else None,
+            }
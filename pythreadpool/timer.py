@@ -0,0 +1,103 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+try:
+    from .error_log import LazyTraceback
+except ImportError:
+    from error_log import LazyTraceback
+
+
+class TimerHandle:
+
+    __slots__ = ('timer', 'when', 'callback', 'args', 'cancelled')
+
+    def __init__(self, timer, when, callback, args):
+        self.timer = timer
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        if not self.cancelled:
+            self.timer.cancel(self)
+
+
+class TimerHeap:
+
+    __slots__ = ('heap', 'condition', 'cancelled', 'thread', '_sequence')
+
+    def __init__(self):
+        self.heap = []
+        self.condition = threading.Condition(threading.Lock())
+        self.cancelled = 0
+        self.thread = None
+        self._sequence = itertools.count()
+
+    def call_later(self, delay, callback, *args):
+        handle = TimerHandle(self, time.monotonic() + delay, callback, args)
+        with self.condition:
+            heapq.heappush(self.heap, (handle.when, next(self._sequence), handle))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='pythreadpool-timer', daemon=True)
+                self.thread.start()
+            elif self.heap[0][2] is handle:
+                self.condition.notify()
+        return handle
+
+    def cancel(self, handle):
+        with self.condition:
+            if handle.cancelled:
+                return
+            handle.cancelled = True
+            handle.callback = handle.args = None
+            self.cancelled += 1
+            # Finished tasks cancel most timers long before they are due, drop them in bulk.
+            if self.cancelled > 64 and self.cancelled * 2 > len(self.heap):
+                self.heap = [entry for entry in self.heap if not entry[2].cancelled]
+                heapq.heapify(self.heap)
+                self.cancelled = 0
+
+    def run(self):
+        with self.condition:
+            while True:
+                heap = self.heap
+                if not heap:
+                    self.condition.wait()
+                    continue
+                when, _, handle = heap[0]
+                if handle.cancelled:
+                    heapq.heappop(heap)
+                    self.cancelled -= 1
+                    continue
+                delay = when - time.monotonic()
+                if delay > 0:
+                    self.condition.wait(delay)
+                    continue
+                heapq.heappop(heap)
+                handle.cancelled = True
+                callback, args = handle.callback, handle.args
+                handle.callback = handle.args = None
+                self.condition.release()
+                try:
+                    callback(*args)
+                except Exception as e:
+                    logging.error("Timer callback %r failed, error msg: \n%s", callback, LazyTraceback(e))
+                finally:
+                    self.condition.acquire()
+
+
+_shared_timer = None
+_shared_timer_lock = threading.Lock()
+
+
+def shared_timer():
+    global _shared_timer
+    if _shared_timer is None:
+        with _shared_timer_lock:
+            if _shared_timer is None:
+                _shared_timer = TimerHeap()
+    return _shared_timer
@@ -0,0 +1,143 @@
+import threading
+import time
+from collections import deque
+
+try:
+    from .native_thread_pool import WorkerGroup
+except ImportError:
+    from native_thread_pool import WorkerGroup
+
+
+_shutdown = object()
+
+
+class WorkStealingScheduler(WorkerGroup):
+
+    __slots__ = ('injected', 'deques', 'work_ready', 'result_ready', 'idle', 'helping', '_local')
+
+    def __init__(self, worker_number):
+        self.injected = deque()
+        self.deques = {}
+        lock = threading.Lock()
+        self.work_ready = threading.Condition(lock)
+        self.result_ready = threading.Condition(lock)
+        self.idle = 0
+        self.helping = 0
+        self._local = threading.local()
+        WorkerGroup.__init__(self, worker_number)
+
+    def is_worker(self):
+        return getattr(self._local, 'deque', None) is not None
+
+    def submit(self, task):
+        own = getattr(self._local, 'deque', None)
+        if own is None:
+            self.injected.append(task)
+        else:
+            own.append(task)
+        if self.idle:
+            with self.work_ready:
+                self.work_ready.notify()
+        elif self.helping:
+            with self.result_ready:
+                self.result_ready.notify()
+
+    def next_task(self, own):
+        try:
+            return own.pop()
+        except IndexError:
+            pass
+        try:
+            return self.injected.popleft()
+        except IndexError:
+            pass
+        for other in list(self.deques.values()):
+            if other is not own:
+                try:
+                    return other.popleft()
+                except IndexError:
+                    pass
+        return None
+
+    def has_task(self):
+        return bool(self.injected) or any(self.deques.values())
+
+    def work(self):
+        worker = threading.current_thread()
+        own = self._local.deque = deque()
+        with self.work_ready:
+            self.deques[worker] = own
+        detached = self.detached
+        try:
+            while worker not in detached:
+                task = self.next_task(own)
+                if task is None:
+                    with self.work_ready:
+                        self.idle += 1
+                        while not self.has_task():
+                            self.work_ready.wait()
+                        self.idle -= 1
+                    continue
+                if task is _shutdown:
+                    return
+                try:
+                    self.run_task(task, worker)
+                except SystemExit:
+                    continue
+        finally:
+            with self.work_ready:
+                self.deques.pop(worker, None)
+                detached.discard(worker)
+            self.injected.extend(own)
+
+    def run_task(self, task, worker):
+        try:
+            WorkerGroup.run_task(self, task, worker)
+        finally:
+            self.wake_helpers()
+
+    def wake_helpers(self):
+        if self.helping:
+            with self.result_ready:
+                self.result_ready.notify_all()
+
+    def help_until(self, ready, timeout=None):
+        own = self._local.deque
+        worker = threading.current_thread()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        stopping = False
+        while not ready():
+            task = None if stopping else self.next_task(own)
+            if task is _shutdown:
+                self.injected.appendleft(task)
+                stopping = True
+                task = None
+            if task is not None:
+                try:
+                    self.run_task(task, worker)
+                except SystemExit:
+                    pass
+                continue
+            with self.result_ready:
+                # Counted before looking again, so a submit or a result landing after the look still notifies.
+                self.helping += 1
+                try:
+                    if ready() or (not stopping and self.has_task()):
+                        continue
+                    if deadline is None:
+                        remaining = None
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return False
+                    self.result_ready.wait(remaining)
+                finally:
+                    self.helping -= 1
+        return True
+
+    def shutdown(self):
+        for _ in range(len(self.workers)):
+            self.injected.append(_shutdown)
+        self.workers = []
+        with self.work_ready:
+            self.work_ready.notify_all()
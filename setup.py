@@ -22,7 +22,7 @@ setup(
     author="ChenZaichuang",
     author_email="1158400735@qq.com",
 
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmark", "benchmark.*"]),
     include_package_data=True,
     platforms="any",
     install_requires=[]
@@ -8,9 +8,52 @@ pip3 install gevent
 
 cp ${DIR}/pythreadpool/gevent_thread_pool.py ${DIR}
 cp ${DIR}/pythreadpool/native_thread_pool.py ${DIR}
+cp ${DIR}/pythreadpool/native_process_pool.py ${DIR}
+cp ${DIR}/pythreadpool/asyncio_task_pool.py ${DIR}
+cp ${DIR}/pythreadpool/pool_metrics.py ${DIR}
+cp ${DIR}/pythreadpool/capacity_tree.py ${DIR}
+cp ${DIR}/pythreadpool/error_log.py ${DIR}
+cp ${DIR}/pythreadpool/work_stealing.py ${DIR}
+cp ${DIR}/pythreadpool/admission.py ${DIR}
+cp ${DIR}/pythreadpool/timer.py ${DIR}
+cp ${DIR}/pythreadpool/adaptive_limit.py ${DIR}
+cp ${DIR}/pythreadpool/rate_limit.py ${DIR}
+cp ${DIR}/pythreadpool/single_flight.py ${DIR}
+cp ${DIR}/pythreadpool/batching.py ${DIR}
+cp ${DIR}/pythreadpool/result_channel.py ${DIR}
+cp ${DIR}/pythreadpool/index_flags.py ${DIR}
+cp ${DIR}/pythreadpool/gevent_process_pool.py ${DIR}
 
 python3 -m unittest ${DIR}/gevent_thread_pool_test.py
 python3 -m unittest ${DIR}/native_thread_pool_test.py
+python3 -m unittest ${DIR}/native_process_pool_test.py
+python3 -m unittest ${DIR}/asyncio_task_pool_test.py
+python3 -m unittest ${DIR}/capacity_tree_test.py
+python3 -m unittest ${DIR}/error_log_test.py
+python3 -m unittest ${DIR}/work_stealing_test.py
+python3 -m unittest ${DIR}/admission_test.py
+python3 -m unittest ${DIR}/timer_test.py
+python3 -m unittest ${DIR}/adaptive_limit_test.py
+python3 -m unittest ${DIR}/rate_limit_test.py
+python3 -m unittest ${DIR}/single_flight_test.py
+python3 -m unittest ${DIR}/batching_test.py
+python3 -m unittest ${DIR}/result_channel_test.py
+python3 -m unittest ${DIR}/index_flags_test.py
+python3 -m unittest ${DIR}/gevent_process_pool_test.py
 
 rm ${DIR}/gevent_thread_pool_test.py
-rm ${DIR}/native_thread_pool_test.py
\ No newline at end of file
+rm ${DIR}/native_thread_pool_test.py
+rm ${DIR}/native_process_pool_test.py
+rm ${DIR}/asyncio_task_pool_test.py
+rm ${DIR}/capacity_tree_test.py
+rm ${DIR}/error_log_test.py
+rm ${DIR}/work_stealing_test.py
+rm ${DIR}/admission_test.py
+rm ${DIR}/timer_test.py
+rm ${DIR}/adaptive_limit_test.py
+rm ${DIR}/rate_limit_test.py
+rm ${DIR}/single_flight_test.py
+rm ${DIR}/batching_test.py
+rm ${DIR}/result_channel_test.py
+rm ${DIR}/index_flags_test.py
+rm ${DIR}/gevent_process_pool_test.py
\ No newline at end of file
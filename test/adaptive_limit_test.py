@@ -0,0 +1,69 @@
+import threading
+import unittest
+from time import sleep
+
+from adaptive_limit import AdaptiveLimiter, AIMDController, GradientController
+
+
+class AdaptiveLimiterTest(unittest.TestCase):
+
+    def test_aimd_limiter_should_grow_under_load_and_back_off_on_errors(self):
+        limiter = AdaptiveLimiter(8, min_limit=2, controller=AIMDController(backoff=0.5, latency_threshold=1))
+        self.assertEqual(2, limiter.current_limit())
+        for _ in range(50):
+            acquired = 0
+            while limiter.acquire(blocking=False):
+                acquired += 1
+            self.assertEqual(limiter.current_limit(), acquired)
+            limiter.record(0.01, True)
+            for _ in range(acquired):
+                limiter.release()
+        self.assertEqual(8, limiter.current_limit())
+
+        limiter.record(0.01, False)
+        self.assertEqual(4, limiter.current_limit())
+        limiter.record(2, True)
+        self.assertEqual(2, limiter.current_limit())
+        limiter.record(0.01, False)
+        self.assertEqual(2, limiter.current_limit())
+        self.assertEqual({'limit': 2, 'in_flight': 0, 'waiting': 0, 'samples': 53, 'failures': 2}, limiter.snapshot())
+
+    def test_aimd_limiter_should_not_grow_while_idle(self):
+        limiter = AdaptiveLimiter(8, min_limit=4)
+        for _ in range(20):
+            limiter.record(0.01, True)
+        self.assertEqual(4, limiter.current_limit())
+
+    def test_gradient_limiter_should_shrink_when_latency_rises(self):
+        limiter = AdaptiveLimiter(64, initial_limit=32, controller=GradientController(smoothing=0.5, tolerance=1))
+        for _ in range(32):
+            limiter.acquire()
+        for _ in range(10):
+            limiter.record(0.01, True)
+        grown = limiter.current_limit()
+        self.assertLess(32, grown)
+        for _ in range(10):
+            limiter.record(0.1, True)
+        self.assertGreater(grown, limiter.current_limit())
+
+    def test_adaptive_limiter_should_block_beyond_limit_and_wake_on_growth(self):
+        limiter = AdaptiveLimiter(4, min_limit=1)
+        self.assertTrue(limiter.acquire())
+        self.assertFalse(limiter.acquire(timeout=0.01))
+        acquired = []
+        thread = threading.Thread(target=lambda: acquired.append(limiter.acquire(timeout=1)))
+        thread.start()
+        sleep(0.02)
+        self.assertEqual([], acquired)
+        limiter.record(0.01, True)
+        thread.join()
+        self.assertEqual([True], acquired)
+        self.assertEqual(2, limiter.snapshot()['in_flight'])
+        limiter.release()
+        limiter.release()
+        with self.assertRaises(ValueError):
+            limiter.release()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import threading
+import time
+import unittest
+from time import sleep
+
+from admission import AdmissionSemaphore
+
+
+class AdmissionSemaphoreTest(unittest.TestCase):
+
+    def acquire_in_thread(self, semaphore, name, order, **kwargs):
+        def acquire():
+            if semaphore.acquire(**kwargs):
+                order.append(name)
+                sleep(0.01)
+                semaphore.release()
+            else:
+                order.append(f'{name} dropped')
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        sleep(0.02)
+        return thread
+
+    def test_admission_semaphore_should_admit_by_priority_then_deadline(self):
+        semaphore = AdmissionSemaphore(1)
+        self.assertTrue(semaphore.acquire())
+        order = []
+        now = time.monotonic()
+        threads = [
+            self.acquire_in_thread(semaphore, 'bulk', order, priority=5),
+            self.acquire_in_thread(semaphore, 'late', order, priority=1, deadline=now + 10),
+            self.acquire_in_thread(semaphore, 'early', order, priority=1, deadline=now + 5),
+            self.acquire_in_thread(semaphore, 'interactive', order, priority=0),
+        ]
+        semaphore.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(['interactive', 'early', 'late', 'bulk'], order)
+        self.assertEqual(1, semaphore.value)
+
+    def test_admission_semaphore_should_drop_expired_waiters(self):
+        semaphore = AdmissionSemaphore(1)
+        self.assertTrue(semaphore.acquire())
+        self.assertFalse(semaphore.acquire(deadline=time.monotonic() - 1))
+        self.assertFalse(semaphore.acquire(blocking=False))
+        order = []
+        expired = self.acquire_in_thread(semaphore, 'expired', order, deadline=time.monotonic() + 0.01)
+        waiting = self.acquire_in_thread(semaphore, 'waiting', order, priority=1)
+        expired.join()
+        semaphore.release()
+        waiting.join()
+        self.assertEqual(['expired dropped', 'waiting'], order)
+        self.assertEqual(1, semaphore.value)
+        with self.assertRaises(ValueError):
+            semaphore.release()
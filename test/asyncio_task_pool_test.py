@@ -0,0 +1,70 @@
+import asyncio
+import unittest
+import logging
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+logging.basicConfig(level=logging.DEBUG, format=LOG_FORMAT)
+
+from asyncio_task_pool import AsyncioTaskPool as TaskPool
+from native_thread_pool import ThreadTimeout
+
+
+class AsyncioTaskPoolTest(unittest.IsolatedAsyncioTestCase):
+
+    async def func_with_sleep(self, param, sleep_second=0.1):
+        await asyncio.sleep(sleep_second)
+        return param
+
+    async def func_with_sleep_and_exception(self, sleep_second=0.1):
+        await asyncio.sleep(sleep_second)
+        raise RuntimeError("Not Killed")
+
+    async def func_for_test_concurrency(self, q, sleep_second=0.1):
+        q.put_nowait('')
+        await asyncio.sleep(sleep_second)
+        q.get_nowait()
+
+    async def test_task_pool_should_get_results_order_by_index(self):
+        pool = TaskPool(total_thread_number=2)
+        await pool.apply_async(self.func_with_sleep, args=(1,), kwargs=dict(sleep_second=0.2))
+        await pool.apply_async(self.func_with_sleep, args=(2,), kwargs=dict(sleep_second=0.1))
+        await pool.apply_async(self.func_with_sleep_and_exception, args=(0.01,))
+        res = await pool.get_results_order_by_index(with_status=True)
+        self.assertEqual((True, 1), res[0])
+        self.assertEqual((True, 2), res[1])
+        self.assertEqual(False, res[2][0])
+        self.assertEqual(RuntimeError, type(res[2][1]))
+
+        await pool.apply_async(self.func_with_sleep_and_exception, args=(0.01,))
+        with self.assertRaisesRegex(RuntimeError, "^Not Killed$"):
+            await pool.get_results_order_by_index(raise_exception=True)
+
+    async def test_task_pool_should_get_results_order_by_time(self):
+        pool = TaskPool(total_thread_number=2)
+        await pool.apply_async(self.func_with_sleep, args=(1,), kwargs=dict(sleep_second=0.2))
+        await pool.apply_async(self.func_with_sleep, args=(2,), kwargs=dict(sleep_second=0.1))
+        self.assertEqual([(1, 2), (0, 1)], [res async for res in pool.get_results_order_by_time(with_index=True)])
+
+    async def test_task_pool_should_get_one_result_with_timeout(self):
+        pool = TaskPool(total_thread_number=2)
+        await pool.apply_async(self.func_with_sleep, args=(1,), kwargs=dict(sleep_second=0.2))
+        with self.assertRaises(ThreadTimeout):
+            await pool.get_one_result(timeout=0.05)
+        self.assertEqual(1, await pool.get_one_result(timeout=1))
+
+    async def test_task_pool_should_block_new_task_when_pool_full(self):
+        pool = TaskPool(total_thread_number=2)
+        shared_pool = pool.new_shared_pool()
+        queue = asyncio.Queue(maxsize=2)
+        for _ in range(3):
+            await pool.apply_async(self.func_for_test_concurrency, args=(queue,))
+            await shared_pool.apply_async(self.func_for_test_concurrency, args=(queue,))
+        await pool.wait_all_threads(raise_exception=True)
+        await shared_pool.wait_all_threads(raise_exception=True)
+
+    async def test_task_pool_should_release_capacity_when_stop_tasks(self):
+        pool = TaskPool(total_thread_number=2)
+        await pool.apply_async(self.func_with_sleep, args=(1,), kwargs=dict(sleep_second=10))
+        await pool.apply_async(self.func_with_sleep, args=(2,), kwargs=dict(sleep_second=10))
+        pool.stop_all()
+        await pool.apply_async(self.func_with_sleep, args=(3,), kwargs=dict(sleep_second=0.01))
+        self.assertEqual(['', '', 3], await asyncio.wait_for(pool.get_results_order_by_index(), 1))
@@ -0,0 +1,48 @@
+import unittest
+from concurrent.futures import CancelledError
+
+from batching import Batcher
+
+
+class BatcherTest(unittest.TestCase):
+
+    def test_batcher_should_close_full_batch_and_hand_out_results(self):
+        batcher = Batcher(lambda keys: [key.upper() for key in keys], max_batch_size=3, linger=10)
+        leading, batch = batcher.join('a')
+        self.assertTrue(leading)
+        delivered = []
+        followers = []
+        for key in ('b', 'c'):
+            following, item = batcher.join(key)
+            self.assertFalse(following)
+            followers.append(item)
+        followers[0].follow(lambda name, success, res: delivered.append((name, success, res)), 'b')
+        self.assertTrue(batcher.join('d')[0])
+        self.assertEqual('A', batch.run())
+        followers[1].follow(lambda success, res: delivered.append(('c', success, res)))
+        self.assertEqual([('b', True, 'B'), ('c', True, 'C')], delivered)
+
+    def test_batcher_should_fail_followers_of_abandoned_batch(self):
+        batcher = Batcher(lambda keys: keys, max_batch_size=4, linger=0)
+        _, batch = batcher.join(1)
+        _, item = batcher.join(2)
+        delivered = []
+        item.follow(lambda success, res: delivered.append((success, type(res))))
+        batch.land(False, CancelledError())
+        batch.land(True, None)
+        self.assertEqual([(False, CancelledError)], delivered)
+        self.assertIsNone(batcher.pending)
+
+    def test_batcher_should_fail_every_item_when_batch_function_fails(self):
+        def fail(keys):
+            raise RuntimeError('backend down')
+        batcher = Batcher(fail, linger=0)
+        _, batch = batcher.join(1)
+        _, item = batcher.join(2)
+        with self.assertRaises(RuntimeError):
+            batch.run()
+        self.assertEqual((True, False, RuntimeError), (item.done, item.success, type(item.result)))
+
+
+if __name__ == '__main__':
+    unittest.main()
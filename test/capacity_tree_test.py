@@ -0,0 +1,46 @@
+import threading
+import unittest
+from time import sleep
+
+from capacity_tree import CapacityNode
+
+
+class CapacityTreeTest(unittest.TestCase):
+
+    def test_capacity_node_should_reserve_slot_at_every_level(self):
+        root = CapacityNode(3)
+        tenant = root.new_child(2)
+        request = tenant.new_child()
+        self.assertEqual(3, request.depth())
+        self.assertIs(root, request.root())
+        self.assertEqual(2, request.capacity)
+
+        self.assertTrue(request.acquire())
+        self.assertEqual((1, 1, 1), (request.used, tenant.used, root.used))
+        self.assertTrue(tenant.acquire())
+        self.assertFalse(request.acquire(blocking=False))
+        self.assertFalse(tenant.acquire(timeout=0.01))
+        self.assertTrue(root.acquire(blocking=False))
+        self.assertFalse(root.new_child().acquire(blocking=False))
+
+        request.release()
+        tenant.release()
+        root.release()
+        self.assertEqual((0, 0, 0), (request.used, tenant.used, root.used))
+        with self.assertRaises(ValueError):
+            request.release()
+
+    def test_capacity_node_should_wake_waiter_when_any_level_frees(self):
+        root = CapacityNode(1)
+        tenant_a = root.new_child()
+        tenant_b = root.new_child()
+        tenant_a.acquire()
+        acquired = []
+        waiter = threading.Thread(target=lambda: acquired.append(tenant_b.acquire(timeout=1)))
+        waiter.start()
+        sleep(0.05)
+        self.assertEqual([], acquired)
+        tenant_a.release()
+        waiter.join()
+        self.assertEqual([True], acquired)
+        self.assertEqual((0, 1, 1), (tenant_a.used, tenant_b.used, root.used))
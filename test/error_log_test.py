@@ -0,0 +1,66 @@
+import unittest
+from unittest import mock
+
+from error_log import ErrorLog, LazyTraceback, drop_frames
+
+
+def failing_func():
+    raise RuntimeError("Not Killed")
+
+
+def raise_exception(func):
+    try:
+        func()
+    except Exception as e:
+        return e
+
+
+class ErrorLogTest(unittest.TestCase):
+
+    def test_lazy_traceback_should_render_only_when_formatted(self):
+        exception = raise_exception(failing_func)
+        with mock.patch('traceback.format_exception', wraps=__import__('traceback').format_exception) as format_exception:
+            lazy_traceback = LazyTraceback(exception)
+            format_exception.assert_not_called()
+            self.assertIn('failing_func', str(lazy_traceback))
+            self.assertIn('RuntimeError: Not Killed', str(lazy_traceback))
+            self.assertEqual(1, format_exception.call_count)
+
+    def test_drop_frames_should_clear_traceback_chain(self):
+        def failing_with_cause():
+            try:
+                failing_func()
+            except RuntimeError as e:
+                raise ValueError("Wrapped") from e
+
+        exception = raise_exception(failing_with_cause)
+        self.assertIsNotNone(exception.__cause__.__traceback__)
+        drop_frames(exception)
+        self.assertIsNone(exception.__traceback__)
+        self.assertIsNone(exception.__cause__.__traceback__)
+
+    def test_error_log_should_collapse_duplicate_errors(self):
+        error_log = ErrorLog(interval=60)
+        with self.assertLogs(level='ERROR') as logs:
+            for index in range(5):
+                error_log.report(failing_func, raise_exception(failing_func), "Thread %s failed", index)
+            error_log.report(failing_func, ValueError("Other"), "Thread %s failed", 5)
+        self.assertEqual(2, len(logs.records))
+        self.assertIn('Thread 0 failed', logs.output[0])
+        self.assertEqual({'failing_func: RuntimeError': {'count': 5, 'suppressed': 4},
+                          'failing_func: ValueError': {'count': 1, 'suppressed': 0}}, error_log.snapshot())
+
+        error_log.interval = 0
+        with self.assertLogs(level='ERROR') as logs:
+            error_log.report(failing_func, raise_exception(failing_func), "Thread %s failed", 6)
+        self.assertIn('Thread 6 failed, 4 similar errors suppressed', logs.output[0])
+        self.assertEqual({'count': 6, 'suppressed': 0}, error_log.snapshot()['failing_func: RuntimeError'])
+
+    def test_detached_lazy_traceback_should_render_after_frames_are_dropped(self):
+        exception = raise_exception(failing_func)
+        with mock.patch('linecache.getline', wraps=__import__('linecache').getline) as getline:
+            lazy_traceback = LazyTraceback(exception, detach=True)
+            drop_frames(exception)
+            getline.assert_not_called()
+            self.assertIn('in failing_func', str(lazy_traceback))
+            self.assertIn('raise RuntimeError("Not Killed")', str(lazy_traceback))
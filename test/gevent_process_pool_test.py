@@ -0,0 +1,132 @@
+import os
+import time
+import unittest
+import logging
+from gevent import sleep
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+logging.basicConfig(level=logging.DEBUG, format=LOG_FORMAT)
+
+from gevent_process_pool import GeventProcessPool as ProcessPool
+
+
+def func_with_sleep(param, sleep_second=0.1):
+    sleep(sleep_second)
+    return param
+
+
+def func_with_exception(sleep_second=0.1):
+    sleep(sleep_second)
+    raise RuntimeError("Not Killed")
+
+
+def func_with_pid(sleep_second=0.01):
+    sleep(sleep_second)
+    return os.getpid()
+
+
+def func_with_blocking_sleep(sleep_second=0.3):
+    time.sleep(sleep_second)
+    return os.getpid()
+
+
+def func_with_exit():
+    os._exit(3)
+
+
+def echo(payload):
+    sleep(0.01)
+    return payload
+
+
+class GeventProcessPoolTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = ProcessPool(total_thread_number=40, process_number=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+
+    def setUp(self):
+        self.pool.refresh()
+
+    def test_process_pool_should_get_results_order_by_index(self):
+        pool = self.pool
+        pool.apply_async(func_with_sleep, args=(1,), kwargs=dict(sleep_second=0.2))
+        pool.apply_async(func_with_sleep, args=(2,), kwargs=dict(sleep_second=0.1))
+        pool.apply_async(func_with_exception, args=(0.01,))
+        res = pool.get_results_order_by_index(with_status=True)
+        self.assertEqual([(True, 1), (True, 2)], res[:2])
+        self.assertEqual(False, res[2][0])
+        self.assertEqual(RuntimeError, type(res[2][1]))
+        self.assertIn('func_with_exception', str(res[2][1].__cause__))
+
+        pool.apply_async(func_with_sleep, args=(1,), kwargs=dict(sleep_second=0.3))
+        pool.apply_async(func_with_sleep, args=(2,), kwargs=dict(sleep_second=0.1))
+        self.assertEqual([(1, 2), (0, 1)], list(pool.get_results_order_by_time(with_index=True)))
+
+    def test_process_pool_should_run_many_greenlets_per_process(self):
+        pool = self.pool
+        started_at = time.monotonic()
+        for _ in range(40):
+            pool.apply_async(func_with_pid, kwargs=dict(sleep_second=0.3))
+        pids = pool.get_results_order_by_index(raise_exception=True)
+        self.assertLess(time.monotonic() - started_at, 3)
+        self.assertEqual(2, len(set(pids)))
+        self.assertEqual(20, pids.count(pids[0]))
+        self.assertNotIn(os.getpid(), pids)
+
+        shared_pool = pool.new_shared_pool(max_thread=2)
+        self.assertEqual(ProcessPool, type(shared_pool))
+        for _ in range(4):
+            shared_pool.apply_async(func_with_pid)
+        self.assertTrue(set(shared_pool.get_results_order_by_index(raise_exception=True)) <= set(pids))
+
+    def test_process_pool_should_not_block_the_hub_on_plain_blocking_calls(self):
+        pool = self.pool
+        started_at = time.monotonic()
+        for _ in range(20):
+            pool.apply_async(func_with_blocking_sleep, kwargs=dict(sleep_second=0.3))
+        pids = pool.get_results_order_by_index(raise_exception=True)
+        self.assertLess(time.monotonic() - started_at, 1.5)
+        self.assertEqual(2, len(set(pids)))
+
+    def test_process_pool_should_stop_and_expire_remote_tasks(self):
+        from native_thread_pool import ThreadTimeout
+        pool = self.pool
+        pool.apply_async(func_with_sleep, args=(1,), kwargs=dict(sleep_second=10))
+        pool.apply_async(func_with_sleep, args=(2,), kwargs=dict(sleep_second=10), timeout=0.2)
+        pool.apply_async(func_with_sleep, args=(3,), kwargs=dict(sleep_second=0.1))
+        sleep(0.05)
+        pool.stop_nth_thread(0)
+        res = pool.get_results_order_by_index(with_status=True)
+        self.assertEqual(ThreadTimeout, type(res[1][1]))
+        self.assertEqual((True, 3), res[2])
+        sleep(0.05)
+        self.assertEqual(0, sum(len(process.waiting) for process in pool._process_group.processes))
+
+    def test_process_pool_should_fail_tasks_of_a_dead_process(self):
+        pool = self.pool
+        pool.apply_async(lambda: 1)
+        pool.apply_async(func_with_exit)
+        res = pool.get_results_order_by_index(with_status=True)
+        self.assertEqual(False, res[0][0])
+        self.assertEqual(False, res[1][0])
+        self.assertIn('exited with code 3', str(res[1][1]))
+        self.assertEqual(2, len(pool._process_group.processes))
+        for _ in range(4):
+            pool.apply_async(func_with_sleep, args=(1,))
+        self.assertEqual([1] * 4, pool.get_results_order_by_index(raise_exception=True))
+
+    def test_process_pool_should_move_payloads_larger_than_the_pipe_buffer(self):
+        pool = ProcessPool(total_thread_number=50, process_number=1)
+        try:
+            for size in (64 * 1024, 1024 * 1024):
+                payload = b'x' * size
+                for _ in range(50):
+                    pool.apply_async(echo, args=(payload,))
+                res = pool.get_results_order_by_index(raise_exception=True, timeout=20)
+                self.assertEqual([payload] * 50, res)
+        finally:
+            pool.shutdown()
@@ -15,15 +15,24 @@ global ExitException
 
 class GeventThreadPoolTest(unittest.TestCase):
 
-    __test__ = False
     thread_type = ''
 
     @classmethod
     def setUpClass(cls) -> None:
-        from gevent_thread_pool import GeventThreadPool as ThreadPool
-        from gevent import sleep
-        from gevent.queue import Queue, Full
-        from greenlet import GreenletExit as ExitException
+        global ThreadPool
+        global sleep
+        global Queue
+        global Full
+        global ExitException
+        from gevent_thread_pool import GeventThreadPool as _ThreadPool
+        ThreadPool = _ThreadPool
+        from gevent import sleep as _sleep
+        sleep = _sleep
+        from gevent.queue import Queue as _Queue, Full as _Full
+        Queue = _Queue
+        Full = _Full
+        from greenlet import GreenletExit as _ExitException
+        ExitException = _ExitException
 
     def func_with_args_and_kwargs(self, param, *args, **kwargs):
         return ','.join([str(param), str(args), str(kwargs)])
@@ -219,6 +228,556 @@ class GeventThreadPoolTest(unittest.TestCase):
         sleep(0.2)
         self.assertEqual(0, queue.qsize())
 
+    def test_thread_pool_should_map_and_apply_many_by_chunk(self):
+        pool = ThreadPool(total_thread_number=2)
+        self.assertEqual([i * 2 for i in range(50)], pool.map(lambda x: x * 2, range(50), chunksize=7))
+        self.assertEqual([i * 2 for i in range(50)], pool.map(lambda x: x * 2, range(50)))
+        self.assertEqual([], pool.map(lambda x: x * 2, []))
+
+        res = pool.apply_many([(self.func_with_args_and_kwargs, (1, 2), dict(a=3)),
+                               (self.func_with_sleep_and_exception, (0.01,)),
+                               (self.func_with_sleep, (5,), dict(sleep_second=0.01))],
+                              chunksize=2, with_status=True, with_index=True)
+        self.assertEqual((0, True, "1,(2,),{'a': 3}"), res[0])
+        self.assertEqual((1, False), res[1][:2])
+        self.assertEqual(RuntimeError, type(res[1][2]))
+        self.assertEqual((2, True, 5), res[2])
+
+        with self.assertRaises((RuntimeError,)):
+            pool.apply_many([(self.func_with_sleep_and_exception, (0.01,))], raise_exception=True)
+
+        queue = Queue(maxsize=2)
+        pool.map(lambda _: self.func_for_test_concurrency(queue, sleep_second=0.01), range(10), chunksize=1)
+
+    def test_thread_pool_should_release_consumed_tasks_in_streaming_mode(self):
+        pool = ThreadPool(total_thread_number=4, streaming=True)
+
+        def produce():
+            for i in range(200):
+                pool.apply_async(self.func_with_args_and_kwargs, args=(i,))
+
+        producer = ThreadPool.new_thread(produce)
+        consumed = 0
+        while not producer.dead or consumed < 200:
+            for _ in pool.get_results_order_by_time():
+                consumed += 1
+                self.assertLessEqual(len(pool.thread_list), 4)
+            sleep(0)
+        self.assertEqual(200, consumed)
+        self.assertEqual({}, pool.thread_list)
+        self.assertEqual(set(), pool.completed_threads)
+        self.assertEqual(set(), pool.killed_threads)
+
+        pool.apply_async(self.func_with_sleep, args=(1,), kwargs=dict(sleep_second=0.2))
+        pool.apply_async(self.func_with_sleep, args=(2,), kwargs=dict(sleep_second=0.1))
+        pool.apply_async(self.func_with_sleep_and_exception, args=(0.01,))
+        pool.stop_nth_thread(pool._thread_count - 1)
+        self.assertEqual([(200, 1), (201, 2)], pool.get_results_order_by_index(with_index=True))
+        sleep(0.05)
+        self.assertEqual({}, pool.thread_list)
+        self.assertEqual(set(), pool.killed_threads)
+
+    def test_thread_pool_should_record_metrics(self):
+        reports = []
+        pool = ThreadPool(total_thread_number=2, metrics=True)
+        shared_pool = pool.new_shared_pool()
+        self.assertIs(pool.metrics, shared_pool.metrics)
+        pool.apply_async(self.func_with_sleep, args=(1,), kwargs=dict(sleep_second=0.05))
+        pool.apply_async(self.func_with_sleep, args=(2,), kwargs=dict(sleep_second=0.05))
+        shared_pool.apply_async(self.func_with_sleep_and_exception, args=(0.01,))
+        snapshot = pool.metrics.snapshot()
+        self.assertEqual(3, snapshot['submitted'])
+        self.assertLessEqual(1, snapshot['in_flight'])
+        pool.get_results_order_by_index()
+        shared_pool.get_one_result()
+        snapshot = pool.metrics.snapshot()
+        self.assertEqual(0, snapshot['in_flight'])
+        self.assertEqual(1, snapshot['failed'])
+        sleep_metrics = snapshot['functions'][self.func_with_sleep.__qualname__]
+        self.assertEqual(2, sleep_metrics['completed'])
+        self.assertEqual(2, sleep_metrics['consumed'])
+        self.assertEqual(2, sleep_metrics['run_time']['count'])
+        self.assertAlmostEqual(0.05, sleep_metrics['run_time']['mean'], delta=0.05)
+        self.assertLessEqual(0.01, snapshot['functions'][self.func_with_sleep_and_exception.__qualname__]['semaphore_wait']['max'])
+        self.assertEqual(2, sleep_metrics['queue_wait']['count'])
+        self.assertEqual(2, sleep_metrics['consume_delay']['count'])
+        self.assertEqual({}, pool._metric_marks)
+
+    def test_thread_pool_should_return_future_for_each_task(self):
+        from concurrent.futures import CancelledError
+        from native_thread_pool import ThreadTimeout
+        pool = ThreadPool(total_thread_number=3, return_future=True)
+        future_1 = pool.apply_async(self.func_with_sleep, args=(1,), kwargs=dict(sleep_second=0.2))
+        future_2 = pool.apply_async(self.func_with_sleep, args=(2,), kwargs=dict(sleep_second=0.05))
+        future_3 = pool.apply_async(self.func_with_sleep_and_exception, args=(0.01,))
+        with self.assertRaises(ThreadTimeout):
+            future_1.result(timeout=0.01)
+        self.assertFalse(future_1.done())
+        self.assertEqual(2, future_2.result())
+        self.assertTrue(future_2.done())
+        self.assertEqual(RuntimeError, type(future_3.exception()))
+        with self.assertRaisesRegex(RuntimeError, "^Not Killed$"):
+            future_3.result()
+        self.assertEqual([(0, 1)], list(pool.get_results_order_by_time(with_index=True)))
+        self.assertEqual(1, future_1.result())
+
+        pool.refresh()
+        future_1 = pool.apply_async(self.func_with_sleep, args=(1,), kwargs=dict(sleep_second=0.2))
+        future_2 = pool.apply_async(self.func_with_sleep, args=(2,), kwargs=dict(sleep_second=0.05))
+        sleep(0.01)
+        self.assertTrue(future_1.cancel())
+        self.assertTrue(future_1.cancelled())
+        with self.assertRaises(CancelledError):
+            future_1.result()
+        self.assertEqual(2, pool.get_one_result())
+        self.assertFalse(future_2.cancel())
+        self.assertEqual(2, future_2.result())
+
+    def test_thread_pool_should_collapse_logged_errors_and_drop_frames(self):
+        pool = ThreadPool(total_thread_number=2, error_log=True, drop_traceback=True)
+        shared_pool = pool.new_shared_pool()
+        self.assertIs(pool.error_log, shared_pool.error_log)
+        with self.assertLogs(level='ERROR') as logs:
+            for _ in range(3):
+                pool.apply_async(self.func_with_sleep_and_exception, args=(0.01,))
+                shared_pool.apply_async(self.func_with_sleep_and_exception, args=(0.01,))
+            res = pool.get_results_order_by_index() + shared_pool.get_results_order_by_index()
+        self.assertEqual(1, len(logs.records))
+        self.assertEqual(6, len(res))
+        for exception in res:
+            self.assertEqual(RuntimeError, type(exception))
+            self.assertIsNone(exception.__traceback__)
+        self.assertEqual(6, sum(entry['count'] for entry in pool.error_log.snapshot().values()))
+
+    def test_thread_pool_should_render_dropped_frames_in_deferred_log_records(self):
+        for error_log in (None, True):
+            pool = ThreadPool(total_thread_number=2, error_log=error_log, drop_traceback=True)
+            with mock.patch('logging.error') as log_error:
+                pool.apply_async(self.func_with_sleep_and_exception, args=(0.01,))
+                res = pool.get_results_order_by_index()
+                res += pool.apply_many([(self.func_with_sleep_and_exception, (0.01,))], chunksize=1)
+            self.assertEqual([RuntimeError, RuntimeError], [type(exception) for exception in res])
+            self.assertIsNone(res[0].__traceback__)
+            self.assertIsNone(res[1].__traceback__)
+            self.assertTrue(log_error.called)
+            # Rendered only now, the way a QueueHandler's listener formats records after the task moved on.
+            for call in log_error.call_args_list:
+                self.assertIn('in func_with_sleep_and_exception', str(call[0][-1]))
+
+    def test_thread_pool_should_admit_by_priority_and_drop_expired_deadline(self):
+        from time import monotonic
+        from admission import DeadlineExceeded
+        pool = ThreadPool(total_thread_number=1, admission=True)
+        pool.apply_async(self.func_with_sleep, args=('blocker',), kwargs=dict(sleep_second=0.2))
+        order = []
+        shared_pools = {}
+
+        def submit(name, **kwargs):
+            shared_pools[name] = pool.new_shared_pool()
+            shared_pools[name].apply_async(order.append, args=(name,), **kwargs)
+
+        submitters = []
+        for name, kwargs in [('bulk', dict(priority=5)), ('expired', dict(deadline=monotonic() + 0.05)),
+                             ('interactive', dict(priority=1))]:
+            submitters.append(ThreadPool.new_thread(submit, args=(name,), kwargs=kwargs))
+            sleep(0.02)
+        self.assertEqual(['blocker'], pool.get_results_order_by_index())
+        for submitter in submitters:
+            submitter.join()
+        self.assertEqual([None], shared_pools['interactive'].get_results_order_by_index())
+        self.assertEqual([None], shared_pools['bulk'].get_results_order_by_index())
+        self.assertEqual(['interactive', 'bulk'], order)
+        success, res = shared_pools['expired'].get_one_result(with_status=True)
+        self.assertEqual(False, success)
+        self.assertEqual(DeadlineExceeded, type(res))
+
+        pool.apply_async(order.append, args=('late',), deadline=monotonic() - 1)
+        success, res = pool.get_one_result(with_status=True)
+        self.assertEqual((False, DeadlineExceeded), (success, type(res)))
+        self.assertNotIn('late', order)
+
+    def test_thread_pool_should_fail_task_with_timeout(self):
+        from native_thread_pool import ThreadTimeout
+        pool = ThreadPool(total_thread_number=1)
+        pool.apply_async(self.func_with_sleep, args=(1,), kwargs=dict(sleep_second=10), timeout=0.05)
+        pool.apply_async(self.func_with_sleep, args=(2,), kwargs=dict(sleep_second=0.01), timeout=1)
+        res = pool.get_results_order_by_index(with_status=True)
+        self.assertEqual(False, res[0][0])
+        self.assertEqual(ThreadTimeout, type(res[0][1]))
+        self.assertEqual((True, 2), res[1])
+
+        pool.apply_async(self.func_with_sleep, args=(3,), kwargs=dict(sleep_second=0.01), timeout=0.05)
+        sleep(0.1)
+        self.assertEqual([3], pool.get_results_order_by_index(raise_exception=True))
+
+    def test_thread_pool_should_adapt_concurrency_limit(self):
+        from adaptive_limit import AdaptiveLimiter
+        from gevent.event import Event
+        pool = ThreadPool(limiter=AdaptiveLimiter(4, initial_limit=4, event_factory=Event), metrics=True, log_exception=False)
+        self.assertEqual(4, pool.max_thread)
+        for _ in range(4):
+            pool.apply_async(self.func_with_sleep_and_exception, args=(0.01,))
+        pool.wait_all_threads()
+        self.assertEqual(2, pool.limiter.current_limit())
+        self.assertEqual(2, pool.metrics.snapshot()['gauges']['concurrency_limit'])
+
+        shared_pool = pool.new_shared_pool()
+        for index in range(8):
+            shared_pool.apply_async(self.func_with_sleep, args=(index,), kwargs=dict(sleep_second=0.01))
+        self.assertEqual(list(range(8)), shared_pool.get_results_order_by_index())
+        self.assertLess(2, pool.limiter.current_limit())
+        self.assertEqual(0, pool.limiter.snapshot()['in_flight'])
+        self.assertEqual(32, ThreadPool(total_thread_number=32, limiter=True).limiter.current_limit())
+        with self.assertRaises(AssertionError):
+            ThreadPool(limiter=AdaptiveLimiter(2, initial_limit=2))
+
+    def test_thread_pool_should_rate_limit_before_taking_a_slot(self):
+        from time import monotonic
+        from admission import DeadlineExceeded
+        from rate_limit import RateLimiter
+        pool = ThreadPool(total_thread_number=4, rate_limiter=RateLimiter(rate=50, burst=2, sleep=sleep), log_exception=False)
+        shared_pool = pool.new_shared_pool()
+        started = monotonic()
+        for index in range(3):
+            pool.apply_async(self.func_with_sleep, args=(index,), kwargs=dict(sleep_second=0))
+            shared_pool.apply_async(self.func_with_sleep, args=(index,), kwargs=dict(sleep_second=0))
+        self.assertLessEqual(0.07, monotonic() - started)
+        self.assertEqual([0, 1, 2], pool.get_results_order_by_index())
+        self.assertEqual([0, 1, 2], shared_pool.get_results_order_by_index())
+
+        pool.rate_limiter.set_key_rate('partner', 1, burst=1)
+        pool.apply_async(self.func_with_sleep, args=('first',), kwargs=dict(sleep_second=0), rate_key='partner')
+        pool.apply_async(self.func_with_sleep, args=('second',), kwargs=dict(sleep_second=0), rate_key='partner',
+                         deadline=monotonic() + 0.1)
+        res = pool.get_results_order_by_index(with_status=True)
+        self.assertEqual((True, 'first'), res[0])
+        self.assertEqual((False, DeadlineExceeded), (res[1][0], type(res[1][1])))
+
+    def test_thread_pool_should_coalesce_identical_calls(self):
+        from single_flight import SingleFlight
+        calls = []
+
+        def fetch(key, sleep_second=0.05):
+            calls.append(key)
+            sleep(sleep_second)
+            return key.upper()
+
+        pool = ThreadPool(total_thread_number=4, single_flight=SingleFlight(cache_size=2), metrics=True)
+        shared_pool = pool.new_shared_pool()
+        for _ in range(3):
+            pool.apply_async(fetch, args=('config',))
+            shared_pool.apply_async(fetch, args=('config',))
+        pool.apply_async(fetch, args=('profile',))
+        self.assertEqual(['CONFIG', 'CONFIG', 'CONFIG', 'PROFILE'], pool.get_results_order_by_index())
+        self.assertEqual(['CONFIG', 'CONFIG', 'CONFIG'], shared_pool.get_results_order_by_index())
+        self.assertEqual(['config', 'profile'], sorted(calls))
+
+        pool.apply_async(fetch, args=('config',))
+        pool.apply_async(fetch, args=('config',), kwargs=dict(sleep_second=0))
+        self.assertEqual(['CONFIG', 'CONFIG'], pool.get_results_order_by_index())
+        self.assertEqual(3, len(calls))
+        self.assertEqual({'in_flight': 0, 'coalesced': 5, 'cache': {'size': 2, 'hits': 1, 'misses': 3}},
+                         pool.metrics.snapshot()['gauges']['single_flight'])
+
+    def test_thread_pool_should_fan_out_failure_of_coalesced_call(self):
+        from concurrent.futures import CancelledError
+        pool = ThreadPool(total_thread_number=2, single_flight=True, log_exception=False)
+        for _ in range(3):
+            pool.apply_async(self.func_with_sleep_and_exception, kwargs=dict(sleep_second=0.05))
+        pool.stop_nth_thread(2)
+        res = pool.get_results_order_by_index(with_status=True)
+        self.assertEqual((False, RuntimeError), (res[0][0], type(res[0][1])))
+        self.assertIs(res[0][1], res[1][1])
+        self.assertEqual(('', ''), res[2])
+
+        pool.apply_async(self.func_with_sleep_and_exception, kwargs=dict(sleep_second=0.05))
+        pool.apply_async(self.func_with_sleep_and_exception, kwargs=dict(sleep_second=0.05))
+        pool.stop_nth_thread(0)
+        res = pool.get_results_order_by_index(with_status=True)
+        self.assertEqual(('', ''), res[0])
+        self.assertEqual(False, res[1][0])
+        self.assertEqual(CancelledError, type(res[1][1]))
+
+    def test_thread_pool_should_batch_single_calls(self):
+        batches = []
+
+        def fetch_one(key):
+            return key * 10
+
+        def fetch_many(keys):
+            batches.append(list(keys))
+            sleep(0.01)
+            return [key * 10 for key in keys]
+
+        pool = ThreadPool(total_thread_number=4, log_exception=False)
+        pool.register_batch(fetch_one, fetch_many, max_batch_size=3, linger=0.05)
+        shared_pool = pool.new_shared_pool()
+        for key in range(4):
+            pool.apply_async(fetch_one, args=(key,))
+        shared_pool.apply_async(fetch_one, args=(4,))
+        self.assertEqual([0, 10, 20, 30], pool.get_results_order_by_index())
+        self.assertEqual([40], shared_pool.get_results_order_by_index())
+        self.assertEqual([[0, 1, 2], [3, 4]], batches)
+
+        pool.apply_async(fetch_one, kwargs=dict(key=5))
+        self.assertEqual([50], pool.get_results_order_by_index())
+        self.assertEqual(2, len(batches))
+
+        pool.register_batch(fetch_one, lambda keys: keys[:1], max_batch_size=2, linger=0.05)
+        pool.apply_async(fetch_one, args=(1,))
+        pool.apply_async(fetch_one, args=(2,))
+        res = pool.get_results_order_by_index(with_status=True)
+        self.assertEqual([(False, ValueError), (False, ValueError)], [(success, type(e)) for success, e in res])
+        self.assertIs(res[0][1], res[1][1])
+
+    def test_thread_pool_should_reject_or_queue_submissions_when_full(self):
+        from native_thread_pool import PoolFull
+        pool = ThreadPool(total_thread_number=1)
+        pool.apply_async(self.func_with_sleep, args=(0,), kwargs=dict(sleep_second=0.1))
+        self.assertIs(False, pool.try_apply_async(self.func_with_sleep, args=(1,)))
+        with self.assertRaises(PoolFull):
+            pool.apply_async(self.func_with_sleep, args=(1,), submit_timeout=0.02)
+        pool.apply_async(self.func_with_sleep, args=(1,), kwargs=dict(sleep_second=0), submit_timeout=1)
+        self.assertEqual([0, 1], pool.get_results_order_by_index())
+
+        pool = ThreadPool(total_thread_number=1, max_pending=2)
+        for index in range(3):
+            pool.apply_async(self.func_with_sleep, args=(index,), kwargs=dict(sleep_second=0.05))
+        with self.assertRaises(PoolFull):
+            pool.apply_async(self.func_with_sleep, args=(3,))
+        self.assertIs(False, pool.try_apply_async(self.func_with_sleep, args=(3,)))
+        pool.stop_nth_thread(2)
+        self.assertEqual([0, 1, ''], pool.get_results_order_by_index())
+
+        pool = ThreadPool(total_thread_number=1, single_flight=True)
+        pool.apply_async(self.func_with_sleep, args=(4,), kwargs=dict(sleep_second=0.05))
+        self.assertIsNone(pool.try_apply_async(self.func_with_sleep, args=(4,), kwargs=dict(sleep_second=0.05)))
+        self.assertEqual([4, 4], pool.get_results_order_by_index())
+
+    def test_thread_pool_should_imap_in_order_with_bounded_buffer(self):
+        started = []
+
+        def work(index):
+            started.append(index)
+            sleep(0.05 if index == 0 else 0.001)
+            return index * 2
+
+        pool = ThreadPool(total_thread_number=4, log_exception=False)
+        results = pool.imap(work, range(20), buffer_size=5)
+        self.assertEqual(0, next(results))
+        self.assertEqual([0, 1, 2, 3, 4], sorted(started))
+        self.assertEqual([index * 2 for index in range(1, 20)], list(results))
+
+        self.assertEqual([(0, True, 1), (1, True, 2)], list(pool.imap(self.func_with_sleep, [1, 2], with_status=True, with_index=True)))
+        with self.assertRaises(RuntimeError):
+            list(pool.imap(self.func_with_sleep_and_exception, [0.01] * 10, raise_exception=True))
+        results = pool.imap(self.func_with_sleep, range(10), buffer_size=3)
+        self.assertEqual(0, next(results))
+        results.close()
+
+    def test_thread_pool_should_return_partial_results_after_timeout(self):
+        from time import monotonic
+        from native_thread_pool import ResultTimeout
+        pool = ThreadPool(total_thread_number=3)
+        for n, sleep_second in enumerate((0.01, 0.5, 0.01)):
+            pool.apply_async(self.func_with_sleep, args=(n,), kwargs=dict(sleep_second=sleep_second))
+        with self.assertRaises(ResultTimeout) as context:
+            pool.get_results_order_by_index(timeout=0.2)
+        self.assertEqual([0, '', 2], context.exception.results)
+        self.assertEqual({1}, context.exception.unfinished)
+        self.assertEqual(['', 1, ''], pool.get_results_order_by_index(timeout=1))
+
+        pool = ThreadPool(total_thread_number=2, streaming=True)
+        pool.apply_async(self.func_with_sleep, args=(0,), kwargs=dict(sleep_second=0.01))
+        pool.apply_async(self.func_with_sleep, args=(1,), kwargs=dict(sleep_second=0.5))
+        with self.assertRaises(ResultTimeout) as context:
+            pool.wait_all_threads(timeout=0.2)
+        self.assertEqual({1}, context.exception.unfinished)
+        with self.assertRaises(ResultTimeout):
+            pool.get_one_result(timeout=0.01)
+        self.assertEqual([1], list(pool.get_results_order_by_time(timeout=1)))
+
+        pool = ThreadPool(total_thread_number=1)
+        pool.apply_async(self.func_with_sleep, args=(0,), kwargs=dict(sleep_second=0))
+        self.assertEqual(0, pool.get_one_result())
+        pool.apply_async(self.func_with_sleep, args=(1,), kwargs=dict(sleep_second=0.5))
+
+        def redeliver():
+            # Copies of a result that was already consumed keep waking the reader up.
+            for _ in range(8):
+                sleep(0.05)
+                pool._thread_res_queue.put((0, True, 0))
+
+        ThreadPool.new_thread(redeliver)
+        started = monotonic()
+        with self.assertRaises(ResultTimeout):
+            pool.get_one_result(timeout=0.2)
+        self.assertLess(monotonic() - started, 0.35)
+
+    def test_thread_pool_should_wait_for_first_completed_or_exception(self):
+        from concurrent.futures import FIRST_COMPLETED, FIRST_EXCEPTION
+        pool = ThreadPool(total_thread_number=3)
+        pool.apply_async(self.func_with_sleep, args=(0,), kwargs=dict(sleep_second=0.01))
+        pool.apply_async(self.func_with_sleep_and_exception, args=(0.1,))
+        pool.apply_async(self.func_with_sleep, args=(2,), kwargs=dict(sleep_second=0.5))
+        self.assertEqual(({0}, {1, 2}), pool.wait(return_when=FIRST_COMPLETED))
+        self.assertEqual(({0, 1}, {2}), pool.wait(return_when=FIRST_EXCEPTION))
+        self.assertEqual(({0, 1}, {2}), pool.wait(timeout=0.05))
+        self.assertEqual(({0, 1, 2}, set()), pool.wait())
+        self.assertEqual([0, 1, 2], [n for n, res in pool.get_results_order_by_time(with_index=True)])
+
+    def test_thread_pool_should_keep_compact_bookkeeping_for_high_fan_out(self):
+        from native_thread_pool import ThreadTimeout
+        pool = ThreadPool(total_thread_number=100, compact=True)
+        for n in range(50):
+            pool.apply_async(self.func_with_sleep, args=(n,), kwargs=dict(sleep_second=0.01))
+        pool.apply_async(self.func_with_sleep_and_exception, args=(0.01,))
+        pool.apply_async(self.func_with_sleep, args=(51,), kwargs=dict(sleep_second=1), timeout=0.05)
+        pool.apply_async(self.func_with_sleep, args=(52,), kwargs=dict(sleep_second=1))
+        sleep(0.02)
+        pool.stop_nth_thread(52)
+        self.assertEqual([None] * 51, pool.thread_list[:51])
+        res = pool.get_results_order_by_index(with_status=True)
+        self.assertEqual([(True, n) for n in range(50)], res[:50])
+        self.assertEqual(RuntimeError, type(res[50][1]))
+        self.assertEqual(ThreadTimeout, type(res[51][1]))
+        self.assertEqual(('', ''), res[52])
+        self.assertEqual(100, pool.main_semaphore.counter)
+
+        pool = ThreadPool(total_thread_number=3, compact=True, streaming=True)
+        for n in range(3):
+            pool.apply_async(self.func_with_sleep, args=(n,), kwargs=dict(sleep_second=0.05))
+        pool.stop_nth_thread(0)
+        self.assertEqual([1, 2], sorted(pool.get_results_order_by_time()))
+        self.assertEqual({}, pool.thread_list)
+
+    def test_thread_pool_should_wait_for_already_finished_tasks(self):
+        from concurrent.futures import FIRST_COMPLETED
+        for streaming in (False, True):
+            pool = ThreadPool(total_thread_number=3, streaming=streaming)
+            for n in range(3):
+                pool.apply_async(self.func_with_sleep, args=(n,), kwargs=dict(sleep_second=0.01))
+            sleep(0.2)
+            self.assertEqual(({0, 1, 2}, set()), pool.wait())
+            self.assertEqual(({0, 1, 2}, set()), pool.wait(return_when=FIRST_COMPLETED))
+            self.assertEqual([0, 1, 2], sorted(pool.get_results_order_by_time()))
+
+    def test_thread_pool_should_run_tasks_in_submitter_context(self):
+        import contextvars
+        request_id = contextvars.ContextVar('request_id', default=None)
+
+        def read_request_id():
+            sleep(0.01)
+            return request_id.get()
+
+        def change_request_id():
+            request_id.set('changed')
+            return request_id.get()
+
+        pool = ThreadPool(total_thread_number=1, inherit_context=True, persistent_workers=True)
+        token = request_id.set('a')
+        pool.apply_async(read_request_id)
+        request_id.set('b')
+        pool.apply_async(change_request_id)
+        pool.apply_async(read_request_id)
+        shared_pool = pool.new_shared_pool()
+        shared_pool.apply_async(read_request_id)
+        self.assertEqual(['a', 'changed', 'b'], pool.get_results_order_by_index())
+        self.assertEqual(['b'], shared_pool.get_results_order_by_index())
+        self.assertEqual('b', request_id.get())
+        request_id.reset(token)
+
+        pool = ThreadPool(total_thread_number=1, inherit_context=True)
+        pool.apply_async(read_request_id)
+        pool.apply_async(read_request_id)
+        pool.stop_nth_thread(1)
+        pool.get_results_order_by_index()
+        self.assertEqual({}, pool._contexts)
+
+    def test_thread_pool_should_not_keep_results_delivered_by_futures(self):
+        for streaming in (False, True):
+            pool = ThreadPool(total_thread_number=10, return_future=True, streaming=streaming)
+            futures = [pool.apply_async(self.func_with_sleep, args=(n,), kwargs=dict(sleep_second=0.001)) for n in range(100)]
+            self.assertEqual(list(range(100)), [future.result() for future in futures])
+            self.assertEqual(0, pool._thread_res_queue.qsize())
+            self.assertEqual(set() if streaming else set(range(100)), set(pool.killed_threads))
+            future = pool.apply_async(self.func_with_sleep, args=(100,), kwargs=dict(sleep_second=0.001))
+            self.assertEqual([100], list(pool.get_results_order_by_time()))
+            self.assertEqual(100, future.result())
+            self.assertEqual(0, pool._thread_res_queue.qsize())
+
+    def test_thread_pool_should_not_wait_for_tokens_past_submit_timeout(self):
+        from time import monotonic
+        from native_thread_pool import PoolFull
+        from rate_limit import RateLimiter
+        pool = ThreadPool(total_thread_number=4, rate_limiter=RateLimiter(rate=1, burst=1, sleep=sleep))
+        pool.apply_async(self.func_with_sleep, args=(0,), kwargs=dict(sleep_second=0))
+        started = monotonic()
+        self.assertIs(False, pool.try_apply_async(self.func_with_sleep, args=(1,), kwargs=dict(sleep_second=0)))
+        with self.assertRaises(PoolFull):
+            pool.apply_async(self.func_with_sleep, args=(2,), kwargs=dict(sleep_second=0), submit_timeout=0.05)
+        self.assertLess(monotonic() - started, 0.3)
+        self.assertEqual([0], pool.get_results_order_by_index())
+
+        pool = ThreadPool(total_thread_number=4, rate_limiter=RateLimiter(rate=20, burst=1, sleep=sleep), max_pending=4)
+        started = monotonic()
+        for index in range(5):
+            pool.apply_async(self.func_with_sleep, args=(index,), kwargs=dict(sleep_second=0))
+        with self.assertRaises(PoolFull):
+            pool.apply_async(self.func_with_sleep, args=(5,), kwargs=dict(sleep_second=0))
+        self.assertLess(monotonic() - started, 0.05)
+        self.assertEqual(list(range(5)), pool.get_results_order_by_index())
+        self.assertLess(0.15, monotonic() - started)
+
+    def test_thread_pool_should_wait_for_tokens_without_blocking_other_greenlets(self):
+        import gevent
+        import time
+        from rate_limit import RateLimiter
+        ticks = []
+
+        def tick():
+            while True:
+                ticks.append(1)
+                sleep(0.01)
+
+        ticker = gevent.spawn(tick)
+        pool = ThreadPool(total_thread_number=4, rate_limiter=RateLimiter(rate=10, burst=1))
+        for n in range(3):
+            pool.apply_async(self.func_with_sleep, args=(n,), kwargs=dict(sleep_second=0))
+        ticker.kill()
+        self.assertGreater(len(ticks), 5)
+        self.assertEqual([0, 1, 2], pool.get_results_order_by_index())
+        with self.assertRaises(AssertionError):
+            ThreadPool(total_thread_number=4, rate_limiter=RateLimiter(rate=10, sleep=time.sleep))
+
+    def test_thread_pool_should_bound_results_left_by_futures_read_out_of_order(self):
+        pool = ThreadPool(total_thread_number=10, return_future=True)
+        futures = [pool.apply_async(self.func_with_sleep, args=(n,), kwargs=dict(sleep_second=0)) for n in range(200)]
+        pool.wait()
+        for unread in range(199, -1, -1):
+            self.assertEqual(unread, futures[unread].result())
+            self.assertLessEqual(len(pool._ready) + pool._thread_res_queue.qsize(), 2 * unread)
+        self.assertEqual(0, pool._thread_res_queue.qsize())
+
+    def test_thread_pool_should_not_run_tasks_of_a_refreshed_batch(self):
+        pool = ThreadPool(total_thread_number=1)
+        pool.apply_async(self.func_with_sleep_and_exception, args=(0,))
+        for n in range(3):
+            pool.apply_async(self.func_with_sleep, args=(f'old{n}',), kwargs=dict(sleep_second=0))
+        stale = list(pool.thread_list)
+        with self.assertRaises(RuntimeError):
+            pool.get_results_order_by_index(raise_exception=True)
+        for n in range(3):
+            pool.apply_async(self.func_with_sleep, args=(n,), kwargs=dict(sleep_second=0))
+        self.assertEqual([0, 1, 2], pool.get_results_order_by_index(timeout=2))
+        self.assertTrue(all(greenlet.successful() for greenlet in stale))
+
+    def test_thread_pool_should_map_more_items_than_max_pending(self):
+        pool = ThreadPool(total_thread_number=2, max_pending=2)
+        self.assertEqual(list(range(40)), pool.map(abs, range(40)))
+        self.assertEqual(list(range(40)), list(pool.imap(abs, range(40))))
+        self.assertEqual(list(range(40)), pool.apply_many([(abs, (n,)) for n in range(40)], chunksize=1))
+
     def test_thread_pool_should_wait_all_threads(self):
         pool = ThreadPool(total_thread_number=2)
 
@@ -0,0 +1,30 @@
+import unittest
+
+from index_flags import IndexFlags
+
+
+class IndexFlagsTest(unittest.TestCase):
+
+    def test_index_flags_should_behave_like_a_set_of_indexes(self):
+        flags = IndexFlags([3, 1])
+        self.assertEqual(2, len(flags))
+        self.assertIn(1, flags)
+        self.assertNotIn(2, flags)
+        self.assertNotIn(1000, flags)
+        flags.add(1)
+        flags.add(200)
+        self.assertEqual(3, len(flags))
+        self.assertEqual([1, 3, 200], list(flags))
+        flags.discard(3)
+        flags.discard(4)
+        flags.discard(5000)
+        self.assertEqual(2, len(flags))
+        flags.update(range(5))
+        self.assertEqual([0, 1, 2, 3, 4, 200], list(flags))
+
+    def test_index_flags_should_grow_geometrically(self):
+        flags = IndexFlags()
+        for n in range(10000):
+            flags.add(n)
+        self.assertEqual(10000, len(flags))
+        self.assertLess(len(flags.flags), 20000)
@@ -0,0 +1,113 @@
+import os
+import unittest
+import logging
+from time import sleep
+from queue import Queue
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+logging.basicConfig(level=logging.DEBUG, format=LOG_FORMAT)
+
+from native_process_pool import NativeProcessPool as ProcessPool
+
+
+def func_with_sleep(param, sleep_second=0.1):
+    sleep(sleep_second)
+    return param
+
+
+def func_with_exception(sleep_second=0.1):
+    sleep(sleep_second)
+    raise RuntimeError("Not Killed")
+
+
+def func_with_pid():
+    sleep(0.01)
+    return os.getpid()
+
+
+def func_with_exit():
+    os._exit(3)
+
+
+class NativeProcessPoolTest(unittest.TestCase):
+
+    def test_process_pool_should_get_results_order_by_index(self):
+        pool = ProcessPool(total_thread_number=2)
+        pool.apply_async(func_with_sleep, args=(1,), kwargs=dict(sleep_second=0.2))
+        pool.apply_async(func_with_sleep, args=(2,), kwargs=dict(sleep_second=0.1))
+        pool.apply_async(func_with_exception, args=(0.01,))
+        res = pool.get_results_order_by_index(with_status=True)
+        self.assertEqual((True, 1), res[0])
+        self.assertEqual((True, 2), res[1])
+        self.assertEqual(False, res[2][0])
+        self.assertEqual(RuntimeError, type(res[2][1]))
+
+        pool.apply_async(func_with_exception, args=(0.01,))
+        with self.assertRaisesRegex(RuntimeError, "^Not Killed$"):
+            pool.get_results_order_by_index(raise_exception=True)
+        pool.shutdown()
+
+    def test_process_pool_should_get_results_order_by_time(self):
+        pool = ProcessPool(total_thread_number=2)
+        pool.apply_async(func_with_sleep, args=(1,), kwargs=dict(sleep_second=0.3))
+        pool.apply_async(func_with_sleep, args=(2,), kwargs=dict(sleep_second=0.1))
+        self.assertEqual([(1, 2), (0, 1)], list(pool.get_results_order_by_time(with_index=True)))
+
+        pool.refresh()
+        pool.apply_async(func_with_sleep, args=(1,), kwargs=dict(sleep_second=0.3))
+        pool.apply_async(func_with_sleep, args=(2,), kwargs=dict(sleep_second=0.1))
+        self.assertEqual(2, pool.get_one_result(timeout=1))
+        pool.wait_all_threads()
+        pool.shutdown()
+
+    def test_process_pool_should_reuse_worker_processes(self):
+        pool = ProcessPool(total_thread_number=2)
+        shared_pool = pool.new_shared_pool()
+        self.assertEqual(ProcessPool, type(shared_pool))
+        for _ in range(10):
+            pool.apply_async(func_with_pid)
+            shared_pool.apply_async(func_with_pid)
+        pids = set(pool.get_results_order_by_index(raise_exception=True))
+        pids.update(shared_pool.get_results_order_by_index(raise_exception=True))
+        self.assertLessEqual(len(pids), 2)
+        self.assertNotIn(os.getpid(), pids)
+        pool.shutdown()
+
+    def test_process_pool_should_terminate_worker_when_stop_nth_thread(self):
+        pool = ProcessPool(total_thread_number=2)
+        # Both worker processes are up first, so only the restart after the stop is paid for below.
+        for _ in range(2):
+            pool.apply_async(func_with_pid)
+        pool.wait_all_threads()
+        pool.apply_async(func_with_sleep, args=(1,), kwargs=dict(sleep_second=10))
+        pool.apply_async(func_with_sleep, args=(2,), kwargs=dict(sleep_second=0.2))
+        sleep(0.1)
+        pool.stop_nth_thread(0)
+        pool.apply_async(func_with_sleep, args=(3,), kwargs=dict(sleep_second=0.1))
+        self.assertEqual([2, 3], list(pool.get_results_order_by_time()))
+
+        pool.refresh()
+        pool.apply_async(func_with_sleep, args=(1,), kwargs=dict(sleep_second=10))
+        pool.apply_async(func_with_sleep, args=(2,), kwargs=dict(sleep_second=10))
+        sleep(0.1)
+        pool.stop_all()
+        pool.apply_async(func_with_sleep, args=(3,), kwargs=dict(sleep_second=0.01))
+        self.assertEqual(3, pool.get_one_result(timeout=5))
+        pool.shutdown()
+
+    def test_process_pool_should_fail_task_when_function_can_not_be_pickled(self):
+        pool = ProcessPool(total_thread_number=1)
+        pool.apply_async(lambda: 1)
+        res = pool.get_results_order_by_index(with_status=True)
+        self.assertEqual(False, res[0][0])
+        pool.shutdown()
+
+    def test_process_pool_should_fail_task_of_a_dead_process(self):
+        pool = ProcessPool(total_thread_number=1)
+        pool.apply_async(func_with_exit)
+        pool.apply_async(func_with_sleep, args=(1,), kwargs=dict(sleep_second=0.01))
+        res = pool.get_results_order_by_index(with_status=True)
+        self.assertEqual(False, res[0][0])
+        self.assertEqual(RuntimeError, type(res[0][1]))
+        self.assertIn('exited with code 3', str(res[0][1]))
+        self.assertEqual((True, 1), res[1])
+        pool.shutdown()
@@ -0,0 +1,50 @@
+import threading
+import time
+import unittest
+
+from rate_limit import RateLimiter, TokenBucket
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def test_token_bucket_should_allow_burst_then_pace_reservations(self):
+        bucket = TokenBucket(100, burst=3)
+        self.assertEqual([0.0, 0.0, 0.0], [bucket.reserve() for _ in range(3)])
+        delays = [bucket.reserve() for _ in range(3)]
+        for expected, delay in zip((0.01, 0.02, 0.03), delays):
+            self.assertAlmostEqual(expected, delay, delta=0.005)
+        self.assertIsNone(bucket.reserve(max_delay=0.01))
+        bucket.refund(3)
+        self.assertAlmostEqual(0.01, bucket.reserve(), delta=0.005)
+
+    def test_rate_limiter_should_limit_each_key_and_the_total(self):
+        slept = []
+        limiter = RateLimiter(rate=10, burst=4, key_rate=1, key_burst=2, sleep=slept.append)
+        limiter.set_key_rate('fast', 1000, burst=10)
+        self.assertTrue(limiter.acquire('slow'))
+        self.assertTrue(limiter.acquire('slow'))
+        self.assertTrue(limiter.acquire('fast'))
+        self.assertEqual([], slept)
+        self.assertTrue(limiter.acquire('slow'))
+        self.assertAlmostEqual(1, slept.pop(), delta=0.01)
+        self.assertTrue(limiter.acquire('fast'))
+        self.assertAlmostEqual(0.1, slept.pop(), delta=0.01)
+        self.assertFalse(limiter.acquire('slow', deadline=time.monotonic() + 0.5))
+        self.assertFalse(limiter.acquire('slow', deadline=time.monotonic() + 10, timeout=0.5))
+        self.assertEqual([], slept)
+        self.assertIs(limiter.bucket_of('slow'), limiter.bucket_of('slow'))
+        self.assertIsNone(RateLimiter(rate=1).bucket_of('any'))
+
+    def test_rate_limiter_should_pace_concurrent_callers(self):
+        limiter = RateLimiter(rate=50, burst=1)
+        started = time.monotonic()
+        threads = [threading.Thread(target=limiter.acquire) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLessEqual(0.09, time.monotonic() - started)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import queue
+import threading
+import unittest
+
+from result_channel import ResultChannel
+
+
+class ResultChannelTest(unittest.TestCase):
+
+    def test_result_channel_should_keep_order_and_time_out(self):
+        channel = ResultChannel()
+        for item in range(3):
+            channel.put(item)
+        self.assertEqual(3, channel.qsize())
+        self.assertEqual([0, 1, 2], [channel.get() for _ in range(3)])
+        self.assertTrue(channel.empty())
+        with self.assertRaises(queue.Empty):
+            channel.get(timeout=0.01)
+
+    def test_result_channel_should_wake_blocked_consumers(self):
+        channel = ResultChannel()
+        producers = 4
+        items = 5000
+        received = []
+
+        def consume():
+            for _ in range(producers * items // 2):
+                received.append(channel.get(timeout=10))
+
+        consumers = [threading.Thread(target=consume) for _ in range(2)]
+        for consumer in consumers:
+            consumer.start()
+        threads = [threading.Thread(target=lambda base: [channel.put(base + item) for item in range(items)], args=(base * items,))
+                   for base in range(producers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads + consumers:
+            thread.join()
+        self.assertEqual(list(range(producers * items)), sorted(received))
+        self.assertEqual(0, channel.waiting)
+
+
+if __name__ == '__main__':
+    unittest.main()
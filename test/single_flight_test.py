@@ -0,0 +1,79 @@
+import threading
+import unittest
+from time import sleep
+
+from single_flight import ResultCache, SingleFlight
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def test_single_flight_should_fan_out_to_followers(self):
+        single_flight = SingleFlight()
+        key = single_flight.key_of(len, ('abc',), {})
+        leading, flight = single_flight.join(key)
+        self.assertTrue(leading)
+        results = []
+        for _ in range(2):
+            following, same_flight = single_flight.join(key)
+            self.assertFalse(following)
+            self.assertIs(flight, same_flight)
+            same_flight.follow(lambda name, success, res: results.append((name, success, res)), 'follower')
+        single_flight.land(flight, True, 3)
+        single_flight.land(flight, False, None)
+        flight.follow(lambda success, res: results.append(('late', success, res)))
+        self.assertEqual([('follower', True, 3), ('follower', True, 3), ('late', True, 3)], results)
+        self.assertTrue(single_flight.join(key)[0])
+        self.assertIsNone(single_flight.key_of(len, ([],), {}))
+        self.assertEqual(single_flight.key_of(dict, (), dict(a=1, b=2)), single_flight.key_of(dict, (), dict(b=2, a=1)))
+
+    def test_single_flight_should_cache_successful_results(self):
+        single_flight = SingleFlight(cache_size=1, ttl=0.05)
+        _, failing = single_flight.join('failing')
+        single_flight.land(failing, False, RuntimeError())
+        self.assertTrue(single_flight.join('failing')[0])
+        _, flight = single_flight.join('ok')
+        single_flight.land(flight, True, 'result')
+        leading, cached = single_flight.join('ok')
+        self.assertFalse(leading)
+        self.assertEqual((True, True, 'result'), (cached.done, cached.success, cached.result))
+        sleep(0.06)
+        self.assertTrue(single_flight.join('ok')[0])
+        self.assertEqual({'in_flight': 2, 'coalesced': 0, 'cache': {'size': 0, 'hits': 1, 'misses': 4}},
+                         single_flight.snapshot())
+
+    def test_result_cache_should_evict_least_recently_used(self):
+        cache = ResultCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(1, cache.get('a')[0])
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(['a', 'c'], list(cache.entries))
+
+    def test_single_flight_should_run_concurrent_identical_calls_once(self):
+        single_flight = SingleFlight()
+        calls = []
+        results = []
+
+        def call():
+            leading, flight = single_flight.join('key')
+            if leading:
+                calls.append(1)
+                sleep(0.05)
+                single_flight.land(flight, True, 'value')
+            else:
+                done = threading.Event()
+                flight.follow(lambda success, res: (results.append(res), done.set()))
+                done.wait()
+
+        threads = [threading.Thread(target=call) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([1], calls)
+        self.assertEqual(['value'] * 4, results)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import threading
+import time
+import unittest
+
+from timer import TimerHeap
+
+
+class TimerHeapTest(unittest.TestCase):
+
+    def test_timer_heap_should_fire_callbacks_in_deadline_order(self):
+        timer = TimerHeap()
+        fired = []
+        done = threading.Event()
+        timer.call_later(0.06, done.set)
+        timer.call_later(0.04, fired.append, 'second')
+        timer.call_later(0.02, fired.append, 'first')
+        cancelled = timer.call_later(0.03, fired.append, 'cancelled')
+        cancelled.cancel()
+        self.assertTrue(done.wait(1))
+        self.assertEqual(['first', 'second'], fired)
+        self.assertEqual(1, len([thread for thread in threading.enumerate() if thread is timer.thread]))
+
+    def test_timer_heap_should_compact_cancelled_timers(self):
+        timer = TimerHeap()
+        handles = [timer.call_later(60, time.sleep, 0) for _ in range(1000)]
+        for handle in handles[:900]:
+            handle.cancel()
+        self.assertLess(len(timer.heap), 500)
+        for handle in handles[900:]:
+            handle.cancel()
+
+    def test_timer_heap_should_log_failed_callbacks_and_keep_firing(self):
+        timer = TimerHeap()
+        done = threading.Event()
+        with self.assertLogs(level='ERROR') as logs:
+            timer.call_later(0.01, int, 'not a number')
+            timer.call_later(0.02, done.set)
+            self.assertTrue(done.wait(1))
+        self.assertIn('Timer callback', logs.output[0])
+        self.assertIn("ValueError: invalid literal for int()", logs.output[0])
@@ -0,0 +1,111 @@
+import threading
+import unittest
+from concurrent.futures import CancelledError
+from time import monotonic, sleep
+
+from native_thread_pool import NativeThreadPool as ThreadPool
+from work_stealing import WorkStealingScheduler
+
+
+def fan_out(pool, depth, width=3):
+    if depth == 0:
+        sleep(0.001)
+        return 1
+    shared_pool = pool.new_shared_pool()
+    for _ in range(width):
+        shared_pool.apply_async(fan_out, args=(shared_pool, depth - 1, width))
+    return sum(shared_pool.get_results_order_by_index(raise_exception=True))
+
+
+def fan_out_with_future(pool, depth, width=3):
+    if depth == 0:
+        sleep(0.01)
+        return threading.get_ident()
+    futures = [pool.apply_async(fan_out_with_future, args=(pool, depth - 1, width)) for _ in range(width)]
+    idents = set()
+    for future in futures:
+        res = future.result()
+        idents.update(res if isinstance(res, set) else {res})
+    return idents
+
+
+class WorkStealingSchedulerTest(unittest.TestCase):
+
+    def test_scheduler_should_run_recursive_fan_out_without_deadlock(self):
+        scheduler = WorkStealingScheduler(2)
+        pool = ThreadPool(scheduler=scheduler)
+        pool.apply_async(fan_out, args=(pool, 4))
+        pool.apply_async(fan_out, args=(pool, 3))
+        self.assertEqual([81, 27], pool.get_results_order_by_index(raise_exception=True))
+        scheduler.shutdown()
+
+    def test_scheduler_should_steal_children_waited_by_future(self):
+        scheduler = WorkStealingScheduler(4)
+        pool = ThreadPool(scheduler=scheduler, return_future=True)
+        idents = pool.apply_async(fan_out_with_future, args=(pool, 3, 4)).result(timeout=5)
+        self.assertLessEqual(len(idents), 4)
+        self.assertGreater(len(idents), 1)
+        self.assertNotIn(threading.get_ident(), idents)
+        scheduler.shutdown()
+
+    def test_scheduler_should_drop_stopped_tasks_waiting_in_deque(self):
+        scheduler = WorkStealingScheduler(1)
+        pool = ThreadPool(scheduler=scheduler, return_future=True)
+        blocker = threading.Event()
+        first = pool.apply_async(blocker.wait)
+        second = pool.apply_async(sleep, args=(0.01,))
+        self.assertTrue(second.cancel())
+        blocker.set()
+        self.assertTrue(first.result(timeout=1))
+        with self.assertRaises(CancelledError):
+            second.result()
+        self.assertEqual(1, len(scheduler.workers))
+        scheduler.shutdown()
+
+    def test_scheduler_should_wake_helper_for_task_submitted_during_its_last_check(self):
+        done = threading.Event()
+        armed = []
+
+        class RacingScheduler(WorkStealingScheduler):
+
+            __slots__ = ()
+
+            def has_task(self):
+                res = WorkStealingScheduler.has_task(self)
+                if armed:
+                    # A submission landing between the helper's last look and its wait.
+                    submitter = threading.Thread(target=armed.pop().apply_async, args=(done.set,))
+                    submitter.start()
+                    submitter.join(0.2)
+                return res
+
+        scheduler = RacingScheduler(1)
+        pool = ThreadPool(scheduler=scheduler)
+
+        def wait_for_done():
+            armed.append(pool.new_shared_pool())
+            started = monotonic()
+            return scheduler.help_until(done.is_set, timeout=2), monotonic() - started
+
+        pool.apply_async(wait_for_done)
+        helped, elapsed = pool.get_results_order_by_index(raise_exception=True)[0]
+        self.assertTrue(helped)
+        self.assertLess(elapsed, 1)
+        scheduler.shutdown()
+
+    def test_scheduler_should_not_run_tasks_of_a_refreshed_batch(self):
+        scheduler = WorkStealingScheduler(1)
+        pool = ThreadPool(scheduler=scheduler)
+        blocker = threading.Event()
+        pool.apply_async(int, args=('failed',))
+        pool.apply_async(blocker.wait)
+        for n in range(3):
+            pool.apply_async(str, args=(f'old{n}',))
+        with self.assertRaises(ValueError):
+            pool.get_results_order_by_index(raise_exception=True, stop_all_for_exception=False)
+        pool.refresh()
+        for n in range(3):
+            pool.apply_async(str, args=(n,))
+        blocker.set()
+        self.assertEqual(['0', '1', '2'], pool.get_results_order_by_index(timeout=2))
+        scheduler.shutdown()